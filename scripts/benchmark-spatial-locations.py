@@ -0,0 +1,118 @@
+"""
+This script compares the hand written trig distance queries against the
+spatial index (Locations.coordinates) queries on the full Locations table.
+
+Usage: python benchmark-spatial-locations.py [num_samples]
+"""
+
+from math import asin, cos, degrees, radians, sin
+import random
+import sys
+import time
+from Utilities import Utilities
+import mysql.connector
+
+# constants
+PATH_MYSQL_INFO = '.mysql-info.json'
+RADII_MILES = [5, 25, 50, 100, 250]
+DEFAULT_NUM_SAMPLES = 50
+
+
+# old path: full scan with the hand written great circle distance
+SQL_TRIG = '''
+    SELECT
+        loc.id
+    FROM
+        Locations loc,
+        (SELECT lat, lng FROM Locations WHERE id = %s) origin
+    WHERE
+        ROUND(3959 * ACOS(LEAST(1, GREATEST(-1,
+            COS(RADIANS(origin.lat)) * COS(RADIANS(loc.lat)) * COS(RADIANS(loc.lng) - RADIANS(origin.lng)) +
+            SIN(RADIANS(origin.lat)) * SIN(RADIANS(loc.lat))
+        )))) <= %s
+'''
+
+# new path: the spatial index narrows the rows down to the bounding box, then ST_Distance_Sphere
+SQL_SPATIAL = '''
+    SELECT
+        loc.id
+    FROM
+        Locations loc,
+        (SELECT coordinates FROM Locations WHERE id = %s) origin
+    WHERE
+        MBRContains(ST_GeomFromText(%s, 4326, 'axis-order=long-lat'), loc.coordinates)
+        AND ROUND(ST_Distance_Sphere(origin.coordinates, loc.coordinates, 3959)) <= %s
+'''
+
+
+# get the WKT polygon of the box around the coordinates that contains the whole radius
+def getBoundingBoxPolygon(lat, lng, miles):
+    angle = (miles + 1) / 3959
+    lat_delta = degrees(angle)
+
+    if sin(angle) >= cos(radians(lat)):
+        lng_delta = 180
+    else:
+        lng_delta = degrees(asin(sin(angle) / cos(radians(lat))))
+
+    lat_min, lat_max = max(lat - lat_delta, -90), min(lat + lat_delta, 90)
+    lng_min, lng_max = max(lng - lng_delta, -180), min(lng + lng_delta, 180)
+
+    corners = [(lng_min, lat_min), (lng_max, lat_min), (lng_max, lat_max), (lng_min, lat_max), (lng_min, lat_min)]
+    points = ','.join('{} {}'.format(x, y) for x, y in corners)
+
+    return 'POLYGON(({}))'.format(points)
+
+# run the statement and return (elapsed seconds, set of location ids)
+def timeQuery(cursor, sql, parms):
+    start = time.perf_counter()
+    cursor.execute(sql, parms)
+    rows = cursor.fetchall()
+    elapsed = time.perf_counter() - start
+
+    return elapsed, set(row[0] for row in rows)
+
+def main():
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_NUM_SAMPLES
+
+    configData = Utilities.getJsonData(PATH_MYSQL_INFO)
+    mydb = mysql.connector.connect(user=configData['user'], password=configData['passwd'], host=configData['host'], database=configData['database'])
+    mycursor = mydb.cursor()
+
+    mycursor.execute('SELECT id, lat, lng FROM Locations')
+    locations = mycursor.fetchall()
+    print('Locations: {}'.format(len(locations)))
+
+    random.seed(0)
+    samples = random.sample(locations, min(num_samples, len(locations)))
+
+    print('{:>8} {:>12} {:>12} {:>9} {:>10}'.format('miles', 'trig (ms)', 'spatial (ms)', 'speedup', 'mismatches'))
+
+    for miles in RADII_MILES:
+        trig_total = 0
+        spatial_total = 0
+        mismatches = 0
+
+        for location_id, lat, lng in samples:
+            polygon = getBoundingBoxPolygon(float(lat), float(lng), miles)
+
+            trig_elapsed, trig_ids = timeQuery(mycursor, SQL_TRIG, (location_id, miles))
+            spatial_elapsed, spatial_ids = timeQuery(mycursor, SQL_SPATIAL, (location_id, polygon, miles))
+
+            trig_total += trig_elapsed
+            spatial_total += spatial_elapsed
+
+            # ST_Distance_Sphere and the trig formula can round a border location differently
+            mismatches += len(trig_ids ^ spatial_ids)
+
+        trig_ms = trig_total / len(samples) * 1000
+        spatial_ms = spatial_total / len(samples) * 1000
+
+        print('{:>8} {:>12.2f} {:>12.2f} {:>8.1f}x {:>10}'.format(miles, trig_ms, spatial_ms, trig_ms / spatial_ms, mismatches))
+
+    mycursor.close()
+    mydb.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+This script checks and rebuilds the materialized User_Stats counters.
+
+Usage:
+    python user-stats.py check      compare User_Stats with the counts computed from the source tables
+    python user-stats.py rebuild    recompute User_Stats (calls the User_Stats_Rebuild procedure)
+
+check exits with status 1 if any user's counters are wrong.
+"""
+
+import sys
+from Utilities import Utilities
+import mysql.connector
+
+# constants
+PATH_MYSQL_INFO = '.mysql-info.json'
+
+# the counters computed from the source tables next to the materialized ones
+SQL_COMPARE = '''
+    SELECT
+        u.id AS user_id,
+        COALESCE(us.count_products, 0) AS count_products,
+        COALESCE(us.count_agreements, 0) AS count_agreements,
+        (SELECT COUNT(*) FROM Products p WHERE p.user_id = u.id) AS expected_count_products,
+        (
+            SELECT COUNT(*)
+            FROM Products p
+                INNER JOIN Payments pay ON pay.product_id = p.id
+                INNER JOIN Product_Requests pr ON pr.payment_id = pay.id AND pr.status = 'accepted'
+            WHERE p.user_id = u.id
+        ) AS expected_count_agreements
+    FROM
+        Users u
+        LEFT JOIN User_Stats us ON us.user_id = u.id
+'''
+
+
+# connect to the database
+def getConnection():
+    configData = Utilities.getJsonData(PATH_MYSQL_INFO)
+    return mysql.connector.connect(user=configData['user'], password=configData['passwd'], host=configData['host'], database=configData['database'])
+
+# print every user whose counters don't match and return the number of them
+def check(mydb) -> int:
+    mycursor = mydb.cursor(dictionary=True)
+    mycursor.execute(SQL_COMPARE)
+
+    num_users = 0
+    num_wrong = 0
+
+    for row in mycursor.fetchall():
+        num_users += 1
+
+        products_match   = row['count_products'] == row['expected_count_products']
+        agreements_match = row['count_agreements'] == row['expected_count_agreements']
+
+        if products_match and agreements_match:
+            continue
+
+        num_wrong += 1
+        print('user {}: count_products {} (expected {}), count_agreements {} (expected {})'.format(
+            row['user_id'],
+            row['count_products'], row['expected_count_products'],
+            row['count_agreements'], row['expected_count_agreements'],
+        ))
+
+    mycursor.close()
+
+    print('{} of {} users have incorrect stats'.format(num_wrong, num_users))
+
+    return num_wrong
+
+# recompute all the counters
+def rebuild(mydb):
+    mycursor = mydb.cursor()
+    mycursor.callproc('User_Stats_Rebuild')
+    mydb.commit()
+    mycursor.close()
+
+    print('User_Stats rebuilt')
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command not in ['check', 'rebuild']:
+        print(__doc__)
+        sys.exit(2)
+
+    mydb = getConnection()
+
+    try:
+        if command == 'rebuild':
+            rebuild(mydb)
+        elif check(mydb) > 0:
+            sys.exit(1)
+    finally:
+        mydb.close()
+
+
+if __name__ == '__main__':
+    main()
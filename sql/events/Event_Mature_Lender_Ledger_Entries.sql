@@ -0,0 +1,14 @@
+-- This event moves the lender payouts whose rental has ended from pending to the lender's balance (see Lender_Ledgers).
+
+DELIMITER $$
+CREATE EVENT Event_Mature_Lender_Ledger_Entries
+ON SCHEDULE EVERY 1 HOUR
+STARTS CURRENT_TIMESTAMP
+ENDS CURRENT_TIMESTAMP + INTERVAL 10 YEAR
+DO
+BEGIN
+    START TRANSACTION;
+    CALL Lender_Ledger_Mature_Entries(NULL);
+    COMMIT;
+END$$
+DELIMITER ;
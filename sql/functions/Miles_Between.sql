@@ -5,14 +5,14 @@ CREATE DEFINER=`rrickgau_main`@`24.13.68.79` FUNCTION `Miles_Between`(
 ) RETURNS double
     DETERMINISTIC
 BEGIN
-	DECLARE lat1 DECIMAL(11,7);
-	DECLARE lng1 DECIMAL(11,7);
-	DECLARE lat2 DECIMAL(11,7);
-	DECLARE lng2 DECIMAL(11,7);
+	DECLARE result DOUBLE;
     
-    SELECT l.lat, l.lng INTO lat1, lng1 FROM Locations l WHERE l.id = location_id_1;	-- get the first location lat/lng points
-    SELECT l.lat, l.lng INTO lat2, lng2 FROM Locations l WHERE l.id = location_id_2;	-- get the second location lat/lng points
+    -- great circle distance of the 2 points using an earth radius of 3959 miles
+    SELECT ST_Distance_Sphere(l1.coordinates, l2.coordinates, 3959) 
+    INTO result
+    FROM Locations l1, Locations l2 
+    WHERE l1.id = location_id_1 AND l2.id = location_id_2;
     
-RETURN ACOS( SIN(lat1*PI()/180)*SIN(lat2*PI()/180) + COS(lat1*PI()/180)*COS(lat2*PI()/180)*COS(lng2*PI()/180-lng1*PI()/180) ) * 3959;
+RETURN result;
 END$$
 DELIMITER ;
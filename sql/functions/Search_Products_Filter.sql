@@ -8,22 +8,48 @@ CREATE FUNCTION `Search_Products_Filter`(
     DETERMINISTIC
 BEGIN
     DECLARE product_dropoff_distance SMALLINT UNSIGNED;
-    DECLARE product_location_id INT UNSIGNED;
+    DECLARE product_lat DECIMAL(11,7);
+    DECLARE product_lng DECIMAL(11,7);
+    DECLARE dropoff_lat DECIMAL(11,7);
+    DECLARE dropoff_lng DECIMAL(11,7);
+    DECLARE distance_angle DOUBLE;
     
-    SELECT p.dropoff_distance, p.location_id 
-    INTO product_dropoff_distance, product_location_id
+    SELECT p.dropoff_distance, l.lat, l.lng 
+    INTO product_dropoff_distance, product_lat, product_lng
     FROM Products p
+    INNER JOIN Locations l ON l.id = p.location_id
     WHERE p.id = in_product_id;
     
+    SELECT l.lat, l.lng 
+    INTO dropoff_lat, dropoff_lng 
+    FROM Locations l 
+    WHERE l.id = in_dropoff_location_id;
+    
+    SET distance_angle = product_dropoff_distance / 3959;
+    
+    -- bounding box prefilter: the latitudes can't be further apart than the dropoff distance
+    IF ABS(product_lat - dropoff_lat) > DEGREES(distance_angle) THEN
+        RETURN (FALSE);
+    END IF;
+    
+    -- bounding box prefilter: same for the longitudes (the box gets wider away from the equator)
+    IF SIN(distance_angle) < COS(RADIANS(dropoff_lat)) AND 
+        ABS(product_lng - dropoff_lng) > DEGREES(ASIN(SIN(distance_angle) / COS(RADIANS(dropoff_lat)))) THEN
+        RETURN (FALSE);
+    END IF;
+    
+    -- product dropoff distance must be within distance between the renter and the lender (same math as MILES_BETWEEN)
+    IF ACOS(LEAST(1, 
+        SIN(RADIANS(product_lat)) * SIN(RADIANS(dropoff_lat)) + 
+        COS(RADIANS(product_lat)) * COS(RADIANS(dropoff_lat)) * COS(RADIANS(dropoff_lng) - RADIANS(product_lng))
+    )) * 3959 > product_dropoff_distance THEN
+        RETURN (FALSE);
+    END IF;
+    
     -- date ranges don't conflict with any existing product availability records
     IF IS_PRODUCT_AVAILABLE(in_product_id, in_starts_on, in_ends_on) != TRUE THEN
         RETURN (FALSE);
     END IF;
-    
-    -- product dropoff distance must be within distance between the renter and the lender
-     IF MILES_BETWEEN(product_location_id, in_dropoff_location_id) > product_dropoff_distance THEN
-         RETURN (FALSE);
-     END IF;
  
  RETURN (TRUE);
  
@@ -0,0 +1,43 @@
+DELIMITER $$
+CREATE PROCEDURE `Get_Location_Ids_In_Range`(
+    IN location_id INT UNSIGNED,
+    IN num_miles INT UNSIGNED
+)
+BEGIN    
+    DECLARE origin POINT SRID 4326;
+    DECLARE origin_lat DOUBLE;
+    DECLARE origin_lng DOUBLE;
+    DECLARE lat_delta DOUBLE;
+    DECLARE lng_delta DOUBLE;
+    DECLARE search_box POLYGON SRID 4326;
+    
+    SELECT l.coordinates, l.lat, l.lng INTO origin, origin_lat, origin_lng FROM Locations l WHERE l.id = location_id;
+    
+    -- box around the location that contains the whole radius (the spatial index narrows the rows down to it)
+    SET lat_delta = DEGREES(num_miles / 3959);
+    SET lng_delta = IF(
+        SIN(num_miles / 3959) >= COS(RADIANS(origin_lat)), 
+        180,
+        DEGREES(ASIN(SIN(num_miles / 3959) / COS(RADIANS(origin_lat))))
+    );
+    
+    SET search_box = ST_GeomFromText(CONCAT('POLYGON((', 
+        GREATEST(origin_lng - lng_delta, -180), ' ', GREATEST(origin_lat - lat_delta, -90), ',',
+        LEAST(origin_lng + lng_delta, 180),     ' ', GREATEST(origin_lat - lat_delta, -90), ',',
+        LEAST(origin_lng + lng_delta, 180),     ' ', LEAST(origin_lat + lat_delta, 90),     ',',
+        GREATEST(origin_lng - lng_delta, -180), ' ', LEAST(origin_lat + lat_delta, 90),     ',',
+        GREATEST(origin_lng - lng_delta, -180), ' ', GREATEST(origin_lat - lat_delta, -90), 
+    '))'), 4326, 'axis-order=long-lat');
+    
+    -- same as Get_Locations_In_Range, but compares and returns the exact (unrounded) distances
+	SELECT 
+		loc.id                                              AS id,
+		ST_Distance_Sphere(origin, loc.coordinates, 3959)   AS distance
+	FROM Locations loc
+	WHERE 
+        MBRContains(search_box, loc.coordinates)
+        AND loc.id != location_id
+        AND ST_Distance_Sphere(origin, loc.coordinates, 3959) <= num_miles
+	ORDER BY distance ASC; 
+END$$
+DELIMITER ;
@@ -4,22 +4,49 @@ CREATE PROCEDURE `Get_Locations_In_Range`(
     IN num_miles INT UNSIGNED
 )
 BEGIN    
+    DECLARE origin POINT SRID 4326;
+    DECLARE origin_lat DOUBLE;
+    DECLARE origin_lng DOUBLE;
+    DECLARE lat_delta DOUBLE;
+    DECLARE lng_delta DOUBLE;
+    DECLARE search_box POLYGON SRID 4326;
+    DECLARE box_miles DOUBLE DEFAULT num_miles + 1;      -- distances are rounded before the comparison
+    
+    SELECT l.coordinates, l.lat, l.lng INTO origin, origin_lat, origin_lng FROM Locations l WHERE l.id = location_id;
+    
+    -- box around the location that contains the whole radius (the spatial index narrows the rows down to it)
+    SET lat_delta = DEGREES(box_miles / 3959);
+    SET lng_delta = IF(
+        SIN(box_miles / 3959) >= COS(RADIANS(origin_lat)), 
+        180,
+        DEGREES(ASIN(SIN(box_miles / 3959) / COS(RADIANS(origin_lat))))
+    );
+    
+    SET search_box = ST_GeomFromText(CONCAT('POLYGON((', 
+        GREATEST(origin_lng - lng_delta, -180), ' ', GREATEST(origin_lat - lat_delta, -90), ',',
+        LEAST(origin_lng + lng_delta, 180),     ' ', GREATEST(origin_lat - lat_delta, -90), ',',
+        LEAST(origin_lng + lng_delta, 180),     ' ', LEAST(origin_lat + lat_delta, 90),     ',',
+        GREATEST(origin_lng - lng_delta, -180), ' ', LEAST(origin_lat + lat_delta, 90),     ',',
+        GREATEST(origin_lng - lng_delta, -180), ' ', GREATEST(origin_lat - lat_delta, -90), 
+    '))'), 4326, 'axis-order=long-lat');
+    
     -- select only locations that fall within the given mile range
 	SELECT 
-		loc.id                                  AS id,
-		loc.city                                AS city,
-		loc.state_id                            AS state_id,
-		loc.state_name                          AS state_name,
-		loc.lat                                 AS lat,
-		loc.lng                                 AS lng,
-		loc.population                          AS population,
-		loc.ranking                             AS ranking,
-		loc.county_name                         AS county_name,
-		ROUND(MILES_BETWEEN(location_id, id))   AS distance
+		loc.id                                                      AS id,
+		loc.city                                                    AS city,
+		loc.state_id                                                AS state_id,
+		loc.state_name                                              AS state_name,
+		loc.lat                                                     AS lat,
+		loc.lng                                                     AS lng,
+		loc.population                                              AS population,
+		loc.ranking                                                 AS ranking,
+		loc.county_name                                             AS county_name,
+		ROUND(ST_Distance_Sphere(origin, loc.coordinates, 3959))    AS distance
 	FROM Locations loc
-	WHERE loc.id != location_id
-	GROUP BY loc.id
-	HAVING distance <= num_miles
+	WHERE 
+        MBRContains(search_box, loc.coordinates)
+        AND loc.id != location_id
+        AND ROUND(ST_Distance_Sphere(origin, loc.coordinates, 3959)) <= num_miles
 	ORDER BY distance ASC; 
 END$$
 DELIMITER ;
@@ -0,0 +1,52 @@
+DELIMITER $$
+CREATE PROCEDURE `Lender_Ledger_Add_Request`(
+    IN in_product_request_id CHAR(36)
+)
+BEGIN
+    -- records the payout of an accepted request in the lender's ledger (calling it again for the same request does nothing)
+    
+    DECLARE lender_id INT UNSIGNED DEFAULT NULL;
+    DECLARE payout DOUBLE;
+    DECLARE rental_ends_on DATE;
+    
+    SELECT
+        p.user_id,
+        CALCULATE_LENDER_PAYOUT(pay.price_full, pay.fee_lender, pay.starts_on, pay.ends_on),
+        pay.ends_on
+    INTO
+        lender_id,
+        payout,
+        rental_ends_on
+    FROM
+        Product_Requests pr
+        INNER JOIN Payments pay ON pay.id = pr.payment_id
+        INNER JOIN Products p ON p.id = pay.product_id
+    WHERE
+        pr.id = in_product_request_id
+        AND pr.status = 'accepted'
+    LIMIT 
+        1;
+    
+    IF lender_id IS NOT NULL THEN
+        INSERT IGNORE INTO Lender_Ledger_Entries 
+            (product_request_id, user_id, amount, matures_on) 
+        VALUES 
+            (in_product_request_id, lender_id, payout, rental_ends_on);
+        
+        IF ROW_COUNT() = 1 THEN
+            INSERT INTO Lender_Ledgers 
+                (user_id, earnings, pending) 
+            VALUES 
+                (lender_id, payout, payout)
+            ON DUPLICATE KEY UPDATE
+                earnings = earnings + payout,
+                pending  = pending + payout;
+            
+            -- the rental is already over
+            IF rental_ends_on <= CURDATE() THEN
+                CALL Lender_Ledger_Mature_Entries(lender_id);
+            END IF;
+        END IF;
+    END IF;
+END$$
+DELIMITER ;
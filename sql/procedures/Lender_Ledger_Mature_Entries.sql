@@ -0,0 +1,48 @@
+DELIMITER $$
+CREATE PROCEDURE `Lender_Ledger_Mature_Entries`(
+    IN in_user_id INT UNSIGNED     -- NULL for all the lenders
+)
+BEGIN
+    -- moves the pending payouts whose rental has ended into the lenders' balance
+    
+    DROP TEMPORARY TABLE IF EXISTS Temp_Matured_Entries;
+    
+    CREATE TEMPORARY TABLE Temp_Matured_Entries (
+        product_request_id CHAR(36) NOT NULL PRIMARY KEY,
+        user_id INT UNSIGNED NOT NULL,
+        amount DOUBLE NOT NULL
+    );
+    
+    INSERT INTO Temp_Matured_Entries
+    SELECT
+        e.product_request_id,
+        e.user_id,
+        e.amount
+    FROM
+        Lender_Ledger_Entries e
+    WHERE
+        e.matured_on IS NULL
+        AND e.matures_on <= CURDATE()
+        AND (in_user_id IS NULL OR e.user_id = in_user_id)
+    FOR UPDATE;
+    
+    UPDATE 
+        Lender_Ledger_Entries e
+        INNER JOIN Temp_Matured_Entries t ON t.product_request_id = e.product_request_id
+    SET 
+        e.matured_on = CURRENT_TIMESTAMP();
+    
+    UPDATE
+        Lender_Ledgers ll
+        INNER JOIN (
+            SELECT t.user_id, SUM(t.amount) AS total
+            FROM Temp_Matured_Entries t
+            GROUP BY t.user_id
+        ) due ON due.user_id = ll.user_id
+    SET
+        ll.balance = ll.balance + due.total,
+        ll.pending = ll.pending - due.total;
+    
+    DROP TEMPORARY TABLE Temp_Matured_Entries;
+END$$
+DELIMITER ;
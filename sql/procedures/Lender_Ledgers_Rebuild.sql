@@ -0,0 +1,47 @@
+DELIMITER $$
+CREATE PROCEDURE `Lender_Ledgers_Rebuild`()
+BEGIN
+    -- rebuilds the ledgers from the accepted requests and the balance transfers
+    -- (same totals as CALCULATE_LENDER_EARNINGS and CALCULATE_LENDER_BALANCE)
+    
+    START TRANSACTION;
+    
+    DELETE FROM Lender_Ledger_Entries;
+    DELETE FROM Lender_Ledgers;
+    
+    INSERT INTO Lender_Ledger_Entries 
+        (product_request_id, user_id, amount, matures_on, matured_on)
+    SELECT
+        pr.id,
+        p.user_id,
+        CALCULATE_LENDER_PAYOUT(pay.price_full, pay.fee_lender, pay.starts_on, pay.ends_on),
+        pay.ends_on,
+        IF(pay.ends_on <= CURDATE(), CURRENT_TIMESTAMP(), NULL)
+    FROM
+        Product_Requests pr
+        INNER JOIN Payments pay ON pay.id = pr.payment_id
+        INNER JOIN Products p ON p.id = pay.product_id
+    WHERE
+        pr.status = 'accepted';
+    
+    -- the balance only counts the payouts that ended since the lender's last transfer
+    INSERT INTO Lender_Ledgers 
+        (user_id, earnings, pending, balance)
+    SELECT
+        e.user_id,
+        SUM(e.amount),
+        SUM(IF(e.matured_on IS NULL, e.amount, 0)),
+        SUM(IF(e.matured_on IS NOT NULL AND e.matures_on >= COALESCE(bt.last_transfer_on, '2020-01-01'), e.amount, 0))
+    FROM
+        Lender_Ledger_Entries e
+        LEFT JOIN (
+            SELECT b.user_id, MAX(b.created_on) AS last_transfer_on
+            FROM Balance_Transfers b
+            GROUP BY b.user_id
+        ) bt ON bt.user_id = e.user_id
+    GROUP BY
+        e.user_id;
+    
+    COMMIT;
+END$$
+DELIMITER ;
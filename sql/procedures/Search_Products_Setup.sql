@@ -6,17 +6,37 @@ CREATE PROCEDURE `Search_Products_Setup`(
 )
 BEGIN
     
+    DECLARE dropoff_lat DECIMAL(11,7);
+    DECLARE dropoff_lng DECIMAL(11,7);
+    DECLARE max_dropoff_distance SMALLINT UNSIGNED;
+    DECLARE lat_delta DOUBLE;
+    DECLARE lng_delta DOUBLE;
+    
     CREATE TEMPORARY TABLE IF NOT EXISTS tmp_products_available (
 		product_id INT UNSIGNED
 	);
     
     DELETE FROM tmp_products_available;
     
+    -- bounding box around the dropoff location that is big enough for the largest dropoff distance
+    SELECT l.lat, l.lng INTO dropoff_lat, dropoff_lng FROM Locations l WHERE l.id = in_dropoff_location_id;
+    SELECT MAX(p.dropoff_distance) INTO max_dropoff_distance FROM Products p;
+    
+    SET lat_delta = DEGREES(max_dropoff_distance / 3959);
+    SET lng_delta = IF(
+        SIN(max_dropoff_distance / 3959) >= COS(RADIANS(dropoff_lat)), 
+        360,
+        DEGREES(ASIN(SIN(max_dropoff_distance / 3959) / COS(RADIANS(dropoff_lat))))
+    );
+    
     INSERT INTO tmp_products_available (product_id)
     SELECT p.id
 	FROM Products p
+    INNER JOIN Locations pl ON pl.id = p.location_id
     WHERE 
-        IS_PRODUCT_AVAILABLE(p.id, in_starts_on, in_ends_on) = TRUE                         -- date ranges don't conflict with any existing product availability records
+        pl.lat BETWEEN dropoff_lat - lat_delta AND dropoff_lat + lat_delta                 -- bounding box prefilter (uses the Locations lat/lng index)
+        AND pl.lng BETWEEN dropoff_lng - lng_delta AND dropoff_lng + lng_delta
+        AND IS_PRODUCT_AVAILABLE(p.id, in_starts_on, in_ends_on) = TRUE                     -- date ranges don't conflict with any existing product availability records
         AND MILES_BETWEEN(p.location_id, in_dropoff_location_id) <= p.dropoff_distance    	-- product dropoff distance must be within distance between the renter and the lender
         AND Product_Has_Conflicting_Requests(p.id, in_starts_on, in_ends_on) = FALSE		-- product does not have any conflicting product_requests during the given range
         AND Product_Is_Complete(p.id) = TRUE;												-- product has values for all the required columns
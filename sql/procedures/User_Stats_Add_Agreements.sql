@@ -0,0 +1,27 @@
+DELIMITER $$
+CREATE PROCEDURE `User_Stats_Add_Agreements`(
+    IN in_payment_id CHAR(36),
+    IN in_amount INT
+)
+BEGIN
+    -- adds in_amount to the agreements count of the lender who owns the payment's product
+    
+    DECLARE lender_id INT UNSIGNED DEFAULT NULL;
+    
+    SELECT p.user_id
+    INTO lender_id
+    FROM Payments pay
+        INNER JOIN Products p ON p.id = pay.product_id
+    WHERE pay.id = in_payment_id
+    LIMIT 1;
+    
+    IF lender_id IS NOT NULL THEN
+        INSERT INTO User_Stats 
+            (user_id, count_agreements) 
+        VALUES 
+            (lender_id, GREATEST(in_amount, 0))
+        ON DUPLICATE KEY UPDATE 
+            count_agreements = GREATEST(CAST(count_agreements AS SIGNED) + in_amount, 0);
+    END IF;
+END$$
+DELIMITER ;
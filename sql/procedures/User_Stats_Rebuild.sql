@@ -0,0 +1,27 @@
+DELIMITER $$
+CREATE PROCEDURE `User_Stats_Rebuild`()
+BEGIN
+    -- recomputes every user's counters from the Products/Product_Requests tables
+    
+    START TRANSACTION;
+    
+    DELETE FROM User_Stats;
+    
+    INSERT INTO User_Stats 
+        (user_id, count_products, count_agreements)
+    SELECT
+        u.id,
+        (SELECT COUNT(*) FROM Products p WHERE p.user_id = u.id),
+        (
+            SELECT COUNT(*)
+            FROM Products p
+                INNER JOIN Payments pay ON pay.product_id = p.id
+                INNER JOIN Product_Requests pr ON pr.payment_id = pay.id AND pr.status = 'accepted'
+            WHERE p.user_id = u.id
+        )
+    FROM
+        Users u;
+    
+    COMMIT;
+END$$
+DELIMITER ;
@@ -10,3 +10,12 @@ CREATE TABLE `Balance_Transfers` (
   KEY `user_id` (`user_id`),
   CONSTRAINT `Balance_Transfers_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `Users` (`id`) ON UPDATE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+
+-- transfers are reserved (balance taken out of the ledger) before they're sent to stripe
+--  status:   pending (reserved, not confirmed by stripe yet) -> sent/failed (failed ones are put back in the balance)
+--  batch_id: the scheduled payout run that created the transfer (NULL for on-demand transfers)
+ALTER TABLE Balance_Transfers
+    ADD COLUMN status ENUM('pending','sent','failed') NOT NULL DEFAULT 'sent',
+    ADD COLUMN batch_id CHAR(36) NULL DEFAULT NULL,
+    ADD KEY status (status, created_on);
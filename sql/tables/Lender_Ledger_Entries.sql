@@ -0,0 +1,16 @@
+-- One payout per accepted product request (Lender_Ledgers is the sum of these)
+--  matures_on: the payment's ends_on, the payout is added to the balance once this day is reached
+--  matured_on: when the payout was added to the balance (NULL while it's pending)
+CREATE TABLE Lender_Ledger_Entries (
+    product_request_id CHAR(36) NOT NULL,
+    user_id INT UNSIGNED NOT NULL,
+    amount DOUBLE NOT NULL,
+    matures_on DATE NOT NULL,
+    matured_on TIMESTAMP NULL DEFAULT NULL,
+    created_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (product_request_id),
+    KEY pending (matured_on, matures_on),
+    KEY user_id (user_id, matured_on),
+    FOREIGN KEY (product_request_id) REFERENCES Product_Requests(id) ON UPDATE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON UPDATE CASCADE ON DELETE CASCADE
+);
@@ -0,0 +1,17 @@
+-- Running totals of every lender's earnings (replaces CALCULATE_LENDER_EARNINGS/CALCULATE_LENDER_BALANCE in View_Users)
+--  earnings: payouts of all the accepted requests
+--  pending:  payouts of the accepted requests whose rental has not ended yet
+--  balance:  payouts that matured (rental ended) minus the balance transfers
+CREATE TABLE Lender_Ledgers (
+    user_id INT UNSIGNED NOT NULL,
+    earnings DOUBLE NOT NULL DEFAULT 0,
+    pending DOUBLE NOT NULL DEFAULT 0,
+    balance DOUBLE NOT NULL DEFAULT 0,
+    updated_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id),
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON UPDATE CASCADE ON DELETE CASCADE
+);
+
+
+-- the scheduled payouts look up every lender above the payout threshold
+ALTER TABLE Lender_Ledgers ADD KEY balance (balance);
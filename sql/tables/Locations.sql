@@ -12,3 +12,14 @@ CREATE TABLE `Locations` (
     UNIQUE KEY `id` (`id`),
     FULLTEXT KEY `fts_locations` (`city`,`state_id`,`state_name`)
 ) ENGINE=INNODB DEFAULT CHARSET=UTF8 COLLATE=UTF8_UNICODE_CI;
+
+
+-- bounding box prefilter for the product search: lat range scan, lng checked from the index
+ALTER TABLE Locations ADD INDEX lat_lng (lat, lng);
+
+
+-- spatial distance queries: SRID 4326 point + SPATIAL INDEX (kept in sync by the Locations_Coordinates triggers)
+ALTER TABLE Locations ADD COLUMN coordinates POINT SRID 4326 NULL;
+UPDATE Locations SET coordinates = ST_GeomFromText(CONCAT('POINT(', lng, ' ', lat, ')'), 4326, 'axis-order=long-lat');
+ALTER TABLE Locations MODIFY coordinates POINT SRID 4326 NOT NULL;
+ALTER TABLE Locations ADD SPATIAL INDEX coordinates (coordinates);
@@ -0,0 +1,24 @@
+-- Outbox of the stripe payment actions (capture/cancel) that a lender's response to a request needs.
+-- Rows are inserted in the same transaction as the request's status change and processed by the api's payment worker.
+--  status:          pending -> processing -> succeeded/failed (back to pending with a later next_attempt_on after an error)
+--  locked_until:    lease of the worker that is processing it (an expired lease makes the row claimable again)
+--  idempotency_key: sent to stripe so a retried action is never applied twice
+CREATE TABLE Payment_Actions (
+    id CHAR(36) NOT NULL,
+    product_request_id CHAR(36) NOT NULL,
+    action ENUM('capture','cancel') NOT NULL,
+    session_id CHAR(255) NOT NULL,
+    idempotency_key CHAR(64) NOT NULL,
+    status ENUM('pending','processing','succeeded','failed') NOT NULL DEFAULT 'pending',
+    attempts INT UNSIGNED NOT NULL DEFAULT 0,
+    next_attempt_on DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until DATETIME NULL DEFAULT NULL,
+    payment_intent_id CHAR(255) NULL DEFAULT NULL,
+    last_error TEXT NULL,
+    created_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    UNIQUE KEY product_request_action (product_request_id, action),
+    KEY due (status, next_attempt_on),
+    FOREIGN KEY (product_request_id) REFERENCES Product_Requests(id) ON UPDATE CASCADE
+);
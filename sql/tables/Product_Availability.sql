@@ -9,3 +9,7 @@ CREATE TABLE `Product_Availability` (
     KEY `product_id` (`product_id`),
     CONSTRAINT `Product_Availability_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `Products` (`id`) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=INNODB DEFAULT CHARSET=UTF8 COLLATE=UTF8_UNICODE_CI;
+
+
+-- set-based product search: lets the NOT EXISTS range check seek on (product_id, starts_on)
+ALTER TABLE Product_Availability ADD INDEX product_id_starts_on_ends_on (product_id, starts_on, ends_on);
@@ -7,4 +7,8 @@ CREATE TABLE Product_Requests (
     created_on TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     PRIMARY KEY (id),
     FOREIGN KEY (payment_id) REFERENCES Payments(id) ON UPDATE CASCADE
-);
\ No newline at end of file
+);
+
+
+-- result of the capture/cancel of the request's payment (see Payment_Actions)
+ALTER TABLE Product_Requests ADD COLUMN payment_status ENUM('pending','captured','canceled','failed') NULL DEFAULT NULL;
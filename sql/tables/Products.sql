@@ -20,3 +20,8 @@ CREATE TABLE `Products` (
 
 -- #147
 ALTER TABLE Products DROP COLUMN price_half;
+
+
+-- bounding box prefilter for the product search: join from the boxed locations, cheap MAX(dropoff_distance)
+ALTER TABLE Products ADD INDEX location_id (location_id);
+ALTER TABLE Products ADD INDEX dropoff_distance (dropoff_distance);
@@ -0,0 +1,11 @@
+-- Materialized View_Users counters (kept up to date by the User_Stats_* triggers, rebuilt by User_Stats_Rebuild)
+--  count_products:   number of products the user owns
+--  count_agreements: number of accepted requests for the user's products
+CREATE TABLE User_Stats (
+    user_id INT UNSIGNED NOT NULL,
+    count_products INT UNSIGNED NOT NULL DEFAULT 0,
+    count_agreements INT UNSIGNED NOT NULL DEFAULT 0,
+    updated_on TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id),
+    FOREIGN KEY (user_id) REFERENCES Users(id) ON UPDATE CASCADE ON DELETE CASCADE
+);
@@ -0,0 +1,9 @@
+DELIMITER $$
+CREATE TRIGGER `Locations_Coordinates_Insert` 
+BEFORE INSERT ON Locations
+FOR EACH ROW
+BEGIN
+    -- keep the spatial column in sync with lat/lng
+    SET NEW.coordinates = ST_GeomFromText(CONCAT('POINT(', NEW.lng, ' ', NEW.lat, ')'), 4326, 'axis-order=long-lat');
+END$$
+DELIMITER ;
@@ -0,0 +1,11 @@
+DELIMITER $$
+CREATE TRIGGER `Locations_Coordinates_Update` 
+BEFORE UPDATE ON Locations
+FOR EACH ROW
+BEGIN
+    -- keep the spatial column in sync with lat/lng
+    IF NEW.lat <> OLD.lat OR NEW.lng <> OLD.lng THEN
+        SET NEW.coordinates = ST_GeomFromText(CONCAT('POINT(', NEW.lng, ' ', NEW.lat, ')'), 4326, 'axis-order=long-lat');
+    END IF;
+END$$
+DELIMITER ;
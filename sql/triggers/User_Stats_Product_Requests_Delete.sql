@@ -0,0 +1,10 @@
+DELIMITER $$
+CREATE TRIGGER `User_Stats_Product_Requests_Delete` 
+AFTER DELETE ON Product_Requests
+FOR EACH ROW
+BEGIN
+    IF OLD.status = 'accepted' THEN
+        CALL User_Stats_Add_Agreements(OLD.payment_id, -1);
+    END IF;
+END$$
+DELIMITER ;
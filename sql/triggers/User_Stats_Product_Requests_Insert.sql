@@ -0,0 +1,10 @@
+DELIMITER $$
+CREATE TRIGGER `User_Stats_Product_Requests_Insert` 
+AFTER INSERT ON Product_Requests
+FOR EACH ROW
+BEGIN
+    IF NEW.status = 'accepted' THEN
+        CALL User_Stats_Add_Agreements(NEW.payment_id, 1);
+    END IF;
+END$$
+DELIMITER ;
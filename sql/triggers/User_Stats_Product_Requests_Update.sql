@@ -0,0 +1,14 @@
+DELIMITER $$
+CREATE TRIGGER `User_Stats_Product_Requests_Update` 
+AFTER UPDATE ON Product_Requests
+FOR EACH ROW
+BEGIN
+    IF OLD.status = 'accepted' AND (NEW.status <> 'accepted' OR NEW.payment_id <> OLD.payment_id) THEN
+        CALL User_Stats_Add_Agreements(OLD.payment_id, -1);
+    END IF;
+    
+    IF NEW.status = 'accepted' AND (OLD.status <> 'accepted' OR NEW.payment_id <> OLD.payment_id) THEN
+        CALL User_Stats_Add_Agreements(NEW.payment_id, 1);
+    END IF;
+END$$
+DELIMITER ;
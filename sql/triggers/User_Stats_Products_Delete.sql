@@ -0,0 +1,10 @@
+DELIMITER $$
+CREATE TRIGGER `User_Stats_Products_Delete` 
+AFTER DELETE ON Products
+FOR EACH ROW
+BEGIN
+    UPDATE User_Stats 
+    SET count_products = GREATEST(CAST(count_products AS SIGNED) - 1, 0)
+    WHERE user_id = OLD.user_id;
+END$$
+DELIMITER ;
@@ -0,0 +1,13 @@
+DELIMITER $$
+CREATE TRIGGER `User_Stats_Products_Insert` 
+AFTER INSERT ON Products
+FOR EACH ROW
+BEGIN
+    INSERT INTO User_Stats 
+        (user_id, count_products) 
+    VALUES 
+        (NEW.user_id, 1)
+    ON DUPLICATE KEY UPDATE 
+        count_products = count_products + 1;
+END$$
+DELIMITER ;
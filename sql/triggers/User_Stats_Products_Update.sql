@@ -0,0 +1,20 @@
+DELIMITER $$
+CREATE TRIGGER `User_Stats_Products_Update` 
+AFTER UPDATE ON Products
+FOR EACH ROW
+BEGIN
+    -- the product changed owners
+    IF NEW.user_id <> OLD.user_id THEN
+        UPDATE User_Stats 
+        SET count_products = GREATEST(CAST(count_products AS SIGNED) - 1, 0)
+        WHERE user_id = OLD.user_id;
+        
+        INSERT INTO User_Stats 
+            (user_id, count_products) 
+        VALUES 
+            (NEW.user_id, 1)
+        ON DUPLICATE KEY UPDATE 
+            count_products = count_products + 1;
+    END IF;
+END$$
+DELIMITER ;
@@ -2,6 +2,7 @@ CREATE VIEW View_Requests_Lender AS
 SELECT
     r.id AS id,
     r.status AS status,
+    r.payment_status AS payment_status,
     r.created_on AS created_on,
     DATE_ADD(r.created_on, INTERVAL 1 DAY) AS expires_on,
     pay.product_id AS product_id,
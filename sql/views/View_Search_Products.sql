@@ -9,6 +9,8 @@ CREATE VIEW `View_Search_Products` AS
         `minor`.`name` AS `product_categories_minor_name`,
         `minor`.`product_categories_major_id` AS `product_categories_major_id`,
         `major`.`name` AS `product_categories_major_name`,
+        `p`.`location_id` AS `location_id`,
+        `p`.`dropoff_distance` AS `dropoff_distance`,
         `p`.`price_full` AS `price_full`,
         `p`.`image` AS `image`,
         `p`.`minimum_age` AS `minimum_age`,
@@ -6,22 +6,19 @@ SELECT
     `u`.`name_last` AS `name_last`,
     `u`.`birth_date` AS `birth_date`,
     `u`.`created_on` AS `created_on`,
+    COALESCE(`us`.`count_products`, 0) AS `count_products`,
+    COALESCE(`us`.`count_agreements`, 0) AS `count_agreements`,
+    COALESCE(`ll`.`earnings`, 0) AS `lender_earnings`,
+    COALESCE(`ll`.`balance`, 0) AS `lender_balance`,
     (SELECT 
-            COUNT(0)
+            `pa`.`account_id`
         FROM
-            `Products` `p2`
+            `Payout_Accounts` `pa`
         WHERE
-            (`p2`.`user_id` = `u`.`id`)) AS `count_products`,
-    COUNT(`pr`.`id`) AS `count_agreements`,
-    CALCULATE_LENDER_EARNINGS(`u`.`id`) AS `lender_earnings`,
-    CALCULATE_LENDER_BALANCE(`u`.`id`) AS `lender_balance`,
-    `pa`.`account_id` AS `payout_account_id`
+            ((`pa`.`user_id` = `u`.`id`)
+                AND (`pa`.`confirmed` = TRUE))
+        LIMIT 1) AS `payout_account_id`
 FROM
-    ((((`Users` `u`
-    LEFT JOIN `Products` `p` ON ((`p`.`user_id` = `u`.`id`)))
-    LEFT JOIN `Payments` `pay` ON ((`pay`.`product_id` = `p`.`id`)))
-    LEFT JOIN `Product_Requests` `pr` ON (((`pr`.`payment_id` = `pay`.`id`)
-        AND (`pr`.`status` = 'accepted'))))
-    LEFT JOIN `Payout_Accounts` `pa` ON (((`pa`.`user_id` = `u`.`id`)
-        AND (`pa`.`confirmed` = TRUE))))
-GROUP BY `u`.`id`;
\ No newline at end of file
+    ((`Users` `u`
+    LEFT JOIN `User_Stats` `us` ON ((`us`.`user_id` = `u`.`id`)))
+    LEFT JOIN `Lender_Ledgers` `ll` ON ((`ll`.`user_id` = `u`.`id`)));
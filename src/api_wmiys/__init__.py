@@ -12,19 +12,34 @@ Listings             | /listings/:product_id
 Product Categories   | /product-categories
 Login                | /login
 Locations            | /locations/:location_id
+Locations Batch      | /locations?ids=:location_ids
+Locations Radius     | /locations/:location_id/radius
+Locations Nearby     | /locations/:location_id/nearby
 Search Locations     | /search/locations
 Search Products      | /search/products
 Requests Received    | /requests/received/:request_id/:status
 Requests Submitted   | /requests/submitted/:request_id
 Payments             | /payments
+Metrics              | /metrics
 
 """
 
 from flask import Flask
 from flask_cors import CORS
 import wmiys_common
-import pymysql
-from api_wmiys.common import CustomJSONEncoder, images
+from api_wmiys import db
+from api_wmiys import payments
+from api_wmiys.common import CustomJSONEncoder, images, caching, security, tokens, metrics
+from api_wmiys.domain.enums.search_products import SearchEngines, CountModes
+from api_wmiys.domain.enums.search_locations import SearchLocationsEngines
+from api_wmiys.repository import search_products as search_products_repo
+from api_wmiys.services import search_products as search_products_services
+from api_wmiys.services import search_locations as search_locations_services
+from api_wmiys.services import locations as location_services
+from api_wmiys.services import product_categories as product_categories_services
+from api_wmiys.services import balance_transfers as balance_transfer_services
+from api_wmiys.indexes import spatial, availability, location_names
+from api_wmiys.payments import outbox as payment_outbox
 from . import routes
 
 
@@ -46,6 +61,17 @@ def configureApp(flask_app: Flask):
 
     configureStaticUrl(flask_app)
     configureDatabaseConnection(flask_app)
+    configureDatabaseSession(flask_app)
+    configureAuthTokens(flask_app)
+    configureSearchProducts(flask_app)
+    configureSearchLocations(flask_app)
+    configureLocations(flask_app)
+    configureProductCategories(flask_app)
+    configureIndexes(flask_app)
+    configurePayments(flask_app)
+    configurePaymentOutbox(flask_app)
+    configurePayouts(flask_app)
+    configureMetrics(flask_app)
 
 #----------------------------------------------------------
 # Set some static url prefix values
@@ -55,15 +81,177 @@ def configureStaticUrl(flask_app: Flask):
     images.STATIC_URL_PREFIX = f'{api_url}/'
 
 #----------------------------------------------------------
-# set the database credentials
+# set the database credentials and connection pool options
 #----------------------------------------------------------
 def configureDatabaseConnection(flask_app: Flask):
     db_config = flask_app.config.get_namespace('DB_', lowercase=False)
 
-    pymysql.credentials.USER     = db_config.get('USER')
-    pymysql.credentials.PASSWORD = db_config.get('PASSWORD')
-    pymysql.credentials.DATABASE = db_config.get('NAME')
-    pymysql.credentials.HOST     = db_config.get('HOST')
+    db.credentials.USER     = db_config.get('USER')
+    db.credentials.PASSWORD = db_config.get('PASSWORD')
+    db.credentials.DATABASE = db_config.get('NAME')
+    db.credentials.HOST     = db_config.get('HOST')
+
+    db.pool.MIN_SIZE                  = db_config.get('POOL_MIN_SIZE', db.pool.MIN_SIZE)
+    db.pool.MAX_SIZE                  = db_config.get('POOL_MAX_SIZE', db.pool.MAX_SIZE)
+    db.pool.MAX_LIFETIME_SECONDS      = db_config.get('POOL_MAX_LIFETIME_SECONDS', db.pool.MAX_LIFETIME_SECONDS)
+    db.pool.HEALTH_CHECK_IDLE_SECONDS = db_config.get('POOL_HEALTH_CHECK_IDLE_SECONDS', db.pool.HEALTH_CHECK_IDLE_SECONDS)
+    db.pool.CHECKOUT_TIMEOUT_SECONDS  = db_config.get('POOL_CHECKOUT_TIMEOUT_SECONDS', db.pool.CHECKOUT_TIMEOUT_SECONDS)
+
+    # any pool created before now used the old options
+    db.pool.reset()
+
+#----------------------------------------------------------
+# Run each request's sql commands in a single connection/transaction
+#----------------------------------------------------------
+def configureDatabaseSession(flask_app: Flask):
+    db.session.ENABLED = flask_app.config.get('DB_REQUEST_SESSION', True)
+
+    flask_app.after_request(db.session.afterRequest)
+    flask_app.teardown_request(db.session.teardownRequest)
+
+#----------------------------------------------------------
+# Set the access token signing keys and the basic auth credentials cache.
+#
+# AUTH_TOKEN_KEYS is a dict of key id -> secret. New tokens are signed with AUTH_TOKEN_ACTIVE_KEY_ID
+# (defaults to the last key id), tokens signed with any of the keys are accepted.
+#----------------------------------------------------------
+def configureAuthTokens(flask_app: Flask):
+    keys = flask_app.config.get('AUTH_TOKEN_KEYS') or {}
+
+    tokens.KEYS          = {str(kid): str(secret).encode() for kid, secret in keys.items()}
+    tokens.ACTIVE_KEY_ID = flask_app.config.get('AUTH_TOKEN_ACTIVE_KEY_ID') or next(reversed(tokens.KEYS), None)
+    tokens.TTL_SECONDS   = flask_app.config.get('AUTH_TOKEN_TTL_SECONDS', tokens.TTL_SECONDS)
+
+    security.BASIC_AUTH_ENABLED = flask_app.config.get('AUTH_BASIC_ENABLED', True)
+
+    caching.credentials.configure(
+        max_size    = flask_app.config.get('AUTH_CREDENTIALS_CACHE_MAX_SIZE', caching.credentials.max_size),
+        ttl_seconds = flask_app.config.get('AUTH_CREDENTIALS_CACHE_TTL_SECONDS', caching.credentials.ttl_seconds),
+    )
+
+#----------------------------------------------------------
+# Set the product search options for this deployment
+#----------------------------------------------------------
+def configureSearchProducts(flask_app: Flask):
+    engine = flask_app.config.get('SEARCH_PRODUCTS_ENGINE', SearchEngines.SET_BASED.value)
+    search_products_repo.ENGINE = SearchEngines(engine)
+
+    count_mode = flask_app.config.get('SEARCH_PRODUCTS_COUNT_MODE', CountModes.WINDOW.value)
+    search_products_services.COUNT_MODE = CountModes(count_mode)
+
+    caching.search_products.configure(
+        max_size    = flask_app.config.get('SEARCH_PRODUCTS_CACHE_MAX_SIZE', 1000),
+        ttl_seconds = flask_app.config.get('SEARCH_PRODUCTS_CACHE_TTL_SECONDS', 30),
+    )
+
+#----------------------------------------------------------
+# Set the location search (autocomplete) options for this deployment
+#----------------------------------------------------------
+def configureSearchLocations(flask_app: Flask):
+    engine = flask_app.config.get('SEARCH_LOCATIONS_ENGINE', SearchLocationsEngines.PREFIX_INDEX.value)
+    search_locations_services.ENGINE = SearchLocationsEngines(engine)
+
+    location_names.TTL_SECONDS = flask_app.config.get('SEARCH_LOCATIONS_INDEX_TTL_SECONDS', location_names.TTL_SECONDS)
+
+#----------------------------------------------------------
+# Set the location lookup cache and HTTP caching options
+#----------------------------------------------------------
+def configureLocations(flask_app: Flask):
+    location_services.CACHE_MAX_AGE_SECONDS = flask_app.config.get('LOCATIONS_CACHE_MAX_AGE_SECONDS', location_services.CACHE_MAX_AGE_SECONDS)
+
+    caching.locations.configure(
+        max_size    = flask_app.config.get('LOCATIONS_CACHE_MAX_SIZE', caching.locations.max_size),
+        ttl_seconds = flask_app.config.get('LOCATIONS_CACHE_TTL_SECONDS', caching.locations.ttl_seconds),
+    )
+
+#----------------------------------------------------------
+# Set the product category tree cache options
+#----------------------------------------------------------
+def configureProductCategories(flask_app: Flask):
+    product_categories_services.FINGERPRINT_CHECK_SECONDS = flask_app.config.get('PRODUCT_CATEGORIES_FINGERPRINT_CHECK_SECONDS', product_categories_services.FINGERPRINT_CHECK_SECONDS)
+    product_categories_services.CACHE_MAX_AGE_SECONDS     = flask_app.config.get('PRODUCT_CATEGORIES_CACHE_MAX_AGE_SECONDS', product_categories_services.CACHE_MAX_AGE_SECONDS)
+
+#----------------------------------------------------------
+# Load the in-memory indexes when the worker starts.
+# If the database is not reachable, they are loaded on first use instead.
+# Adds the flask build-locations-snapshot command (run it after the Locations data changes).
+#----------------------------------------------------------
+def configureIndexes(flask_app: Flask):
+    availability.HORIZON_DAYS = flask_app.config.get('AVAILABILITY_CALENDAR_HORIZON_DAYS', availability.HORIZON_DAYS)
+    availability.TTL_SECONDS  = flask_app.config.get('AVAILABILITY_CALENDAR_TTL_SECONDS', availability.TTL_SECONDS)
+
+    location_names.SNAPSHOT_PATH = flask_app.config.get('LOCATIONS_SNAPSHOT_PATH', location_names.SNAPSHOT_PATH)
+
+    @flask_app.cli.command('build-locations-snapshot')
+    def buildLocationsSnapshot():
+        """Write the locations snapshot file (LOCATIONS_SNAPSHOT_PATH) the worker processes map."""
+        num_locations = location_names.writeSnapshot()
+        print(f'{num_locations} locations written to {location_names.SNAPSHOT_PATH}')
+
+    if not flask_app.config.get('INDEXES_LOAD_ON_START', True):
+        return
+
+    # location_names also serves the fuzzy location searches, whatever the engine
+    for index_module in [spatial, availability, location_names]:
+        try:
+            index_module.load()
+        except Exception as ex:
+            print(ex)
+
+#----------------------------------------------------------
+# Set the stripe http client timeouts and connection reuse
+#----------------------------------------------------------
+def configurePayments(flask_app: Flask):
+    stripe_config = flask_app.config.get_namespace('STRIPE_', lowercase=False)
+
+    payments.routines.CONNECT_TIMEOUT_SECONDS = stripe_config.get('CONNECT_TIMEOUT_SECONDS', payments.routines.CONNECT_TIMEOUT_SECONDS)
+    payments.routines.READ_TIMEOUT_SECONDS    = stripe_config.get('READ_TIMEOUT_SECONDS', payments.routines.READ_TIMEOUT_SECONDS)
+    payments.routines.MAX_NETWORK_RETRIES     = stripe_config.get('MAX_NETWORK_RETRIES', payments.routines.MAX_NETWORK_RETRIES)
+    payments.routines.MAX_CONNECTIONS         = stripe_config.get('MAX_CONNECTIONS', payments.routines.MAX_CONNECTIONS)
+
+    payments.configureHttpClient()
+
+#----------------------------------------------------------
+# Set the payment outbox options. The process's worker is started by its first request.
+# Set PAYMENT_OUTBOX_WORKER_ENABLED to False in processes that should only enqueue.
+#----------------------------------------------------------
+def configurePaymentOutbox(flask_app: Flask):
+    outbox_config = flask_app.config.get_namespace('PAYMENT_OUTBOX_', lowercase=False)
+
+    payment_outbox.WORKER_ENABLED       = outbox_config.get('WORKER_ENABLED', payment_outbox.WORKER_ENABLED)
+    payment_outbox.POLL_SECONDS         = outbox_config.get('POLL_SECONDS', payment_outbox.POLL_SECONDS)
+    payment_outbox.BATCH_SIZE           = outbox_config.get('BATCH_SIZE', payment_outbox.BATCH_SIZE)
+    payment_outbox.MAX_ATTEMPTS         = outbox_config.get('MAX_ATTEMPTS', payment_outbox.MAX_ATTEMPTS)
+    payment_outbox.LEASE_SECONDS        = outbox_config.get('LEASE_SECONDS', payment_outbox.LEASE_SECONDS)
+    payment_outbox.BACKOFF_BASE_SECONDS = outbox_config.get('BACKOFF_BASE_SECONDS', payment_outbox.BACKOFF_BASE_SECONDS)
+    payment_outbox.BACKOFF_MAX_SECONDS  = outbox_config.get('BACKOFF_MAX_SECONDS', payment_outbox.BACKOFF_MAX_SECONDS)
+
+    flask_app.before_request(payment_outbox.beforeRequest)
+
+#----------------------------------------------------------
+# Set the scheduled payout options and add the flask send-payouts command (run it from cron)
+#----------------------------------------------------------
+def configurePayouts(flask_app: Flask):
+    payouts_config = flask_app.config.get_namespace('PAYOUTS_', lowercase=False)
+
+    balance_transfer_services.PAYOUT_MIN_BALANCE        = payouts_config.get('MIN_BALANCE', balance_transfer_services.PAYOUT_MIN_BALANCE)
+    balance_transfer_services.PAYOUT_CONCURRENCY        = payouts_config.get('CONCURRENCY', balance_transfer_services.PAYOUT_CONCURRENCY)
+    balance_transfer_services.STALE_PENDING_SECONDS     = payouts_config.get('STALE_PENDING_SECONDS', balance_transfer_services.STALE_PENDING_SECONDS)
+    balance_transfer_services.STALE_PENDING_MAX_SECONDS = payouts_config.get('STALE_PENDING_MAX_SECONDS', balance_transfer_services.STALE_PENDING_MAX_SECONDS)
+
+    @flask_app.cli.command('send-payouts')
+    def sendPayouts():
+        """Transfer the balance of every lender above the payout threshold."""
+        summary = balance_transfer_services.sendScheduledPayouts()
+
+        for key, value in summary.items():
+            print(f'{key}: {value}')
+
+#----------------------------------------------------------
+# Expose the process metrics on /metrics
+#----------------------------------------------------------
+def configureMetrics(flask_app: Flask):
+    metrics.ENABLED = flask_app.config.get('METRICS_ENABLED', metrics.ENABLED)
 
 
 #----------------------------------------------------------
@@ -86,6 +274,7 @@ def registerBlueprints(flask_app: Flask):
     flask_app.register_blueprint(routes.payout_accounts.bp_payout_accounts, url_prefix='/payout-accounts')
     flask_app.register_blueprint(routes.balance_transfers.bp_balance_transfers, url_prefix='/balance-transfers')
     flask_app.register_blueprint(routes.password_resets.bp_password_resets, url_prefix='/password-resets')
+    flask_app.register_blueprint(routes.metrics.bp_metrics, url_prefix='/metrics')
 
     flask_app.register_blueprint(routes.test.bp_test, url_prefix='/test')
     
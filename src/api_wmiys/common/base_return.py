@@ -25,3 +25,4 @@ class FilteredDataReturn(BaseReturn):
     data          : list[dict] = None
     count_records : int        = 0
     count_pages   : int        = 0
+    next_cursor   : str        = None
@@ -0,0 +1,162 @@
+"""
+**********************************************************************************************
+
+In-process caches.
+
+TtlLruCache is a bounded cache:
+    - the least recently used entry is evicted once it's full
+    - entries expire ttl_seconds after they were stored
+    - hits, misses and evictions are counted
+
+Every worker process has its own instances, so an entry can only be stale (because of a write
+handled by another process) for up to ttl_seconds.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+import threading
+import time
+
+
+class TtlLruCache:
+
+    #------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   - max_size: max number of entries (0 disables the cache)
+    #   - ttl_seconds: number of seconds an entry is valid for
+    #------------------------------------------------------
+    def __init__(self, max_size: int=1000, ttl_seconds: float=30):
+        self.max_size    = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+        # incremented on every clear so results computed before it can be discarded
+        self.generation = 0
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    #------------------------------------------------------
+    # Get the value of the key.
+    # Returns the default if it's not cached or it expired.
+    #------------------------------------------------------
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    #------------------------------------------------------
+    # Cache the value.
+    #
+    # If generation is given and the cache was cleared since then,
+    # the value is not stored (it could have been computed from stale data).
+    #------------------------------------------------------
+    def set(self, key, value, generation: int=None):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    #------------------------------------------------------
+    # Remove all the entries
+    #------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    #------------------------------------------------------
+    # Remove the entries whose value matches the predicate
+    #------------------------------------------------------
+    def removeWhere(self, predicate):
+        with self._lock:
+            keys = [key for key, (_, value) in self._entries.items() if predicate(value)]
+
+            for key in keys:
+                del self._entries[key]
+
+            self.generation += 1
+
+    #------------------------------------------------------
+    # Change the size/ttl (clears the cache)
+    #------------------------------------------------------
+    def configure(self, max_size: int, ttl_seconds: float):
+        with self._lock:
+            self.max_size    = max_size
+            self.ttl_seconds = ttl_seconds
+            self._entries.clear()
+            self.generation += 1
+
+    #------------------------------------------------------
+    # Get the cache counters
+    #------------------------------------------------------
+    def getStats(self) -> dict:
+        return dict(
+            size        = len(self._entries),
+            max_size    = self.max_size,
+            ttl_seconds = self.ttl_seconds,
+            hits        = self.hits,
+            misses      = self.misses,
+            evictions   = self.evictions,
+        )
+
+
+
+#------------------------------------------------------
+# Product search results (see services.search_products)
+#
+# Cleared by every product, product availability and product request write.
+#------------------------------------------------------
+search_products = TtlLruCache()
+
+#------------------------------------------------------
+# Largest dropoff distance of all the products (product search bounding box size)
+#
+# Cleared by every product write.
+#------------------------------------------------------
+max_dropoff_distance = TtlLruCache(max_size=1, ttl_seconds=3600)
+
+#------------------------------------------------------
+# Verified basic auth credentials: salted digest of (email, password) -> user id (see common.security)
+#
+# Entries of a user are removed when the user is updated, and everything is cleared by a password reset.
+#------------------------------------------------------
+credentials = TtlLruCache(max_size=10000, ttl_seconds=60)
+
+#------------------------------------------------------
+# Location records (locations_repo.select rows) by id, for when the location names index is not loaded
+#
+# The Locations reference data does not change while the app is running.
+#------------------------------------------------------
+locations = TtlLruCache(max_size=20000, ttl_seconds=86400)
@@ -0,0 +1,156 @@
+"""
+**********************************************************************************************
+
+In-process latency metrics.
+
+A LatencyHistogram counts the durations of an operation in fixed buckets (milliseconds), so
+percentiles can be estimated without keeping every sample around. The histograms are kept by
+name in a registry:
+
+    with metrics.timed('stripe.capture'):
+        ...
+
+Every worker process has its own histograms (see the /metrics route).
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+# expose the metrics on the /metrics route (set by api_wmiys.configureMetrics)
+ENABLED = False
+
+# upper bounds (milliseconds) of the histogram buckets, the last bucket has no upper bound
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class LatencyHistogram:
+
+    #------------------------------------------------------
+    # Constructor
+    #------------------------------------------------------
+    def __init__(self, bucket_bounds_ms: tuple=BUCKET_BOUNDS_MS):
+        self.bucket_bounds_ms = tuple(bucket_bounds_ms)
+
+        self.count    = 0
+        self.errors   = 0
+        self.total_ms = 0.0
+        self.max_ms   = 0.0
+
+        self._buckets = [0] * (len(self.bucket_bounds_ms) + 1)
+        self._lock    = threading.Lock()
+
+    #------------------------------------------------------
+    # Record the duration of one operation
+    #------------------------------------------------------
+    def observe(self, seconds: float, error: bool=False):
+        elapsed_ms = seconds * 1000
+        bucket = bisect.bisect_left(self.bucket_bounds_ms, elapsed_ms)
+
+        with self._lock:
+            self._buckets[bucket] += 1
+            self.count    += 1
+            self.total_ms += elapsed_ms
+            self.max_ms    = max(self.max_ms, elapsed_ms)
+
+            if error:
+                self.errors += 1
+
+    #------------------------------------------------------
+    # Estimate the given percentile (0-100) in milliseconds.
+    # Returns the upper bound of the bucket it falls in (max_ms for the last one).
+    #------------------------------------------------------
+    def getPercentile(self, percentile: float) -> float | None:
+        with self._lock:
+            buckets = list(self._buckets)
+            count   = self.count
+            max_ms  = self.max_ms
+
+        if count == 0:
+            return None
+
+        rank = percentile / 100 * count
+        cumulative = 0
+
+        for index, bucket_count in enumerate(buckets):
+            cumulative += bucket_count
+
+            if cumulative >= rank and index < len(self.bucket_bounds_ms):
+                return min(self.bucket_bounds_ms[index], max_ms)
+
+        return max_ms
+
+    #------------------------------------------------------
+    # Get the histogram's counts and percentile estimates
+    #------------------------------------------------------
+    def getStats(self) -> dict:
+        with self._lock:
+            buckets  = list(self._buckets)
+            count    = self.count
+            errors   = self.errors
+            total_ms = self.total_ms
+            max_ms   = self.max_ms
+
+        bucket_labels = [f'le_{bound}' for bound in self.bucket_bounds_ms] + ['inf']
+
+        return dict(
+            count   = count,
+            errors  = errors,
+            avg_ms  = (total_ms / count) if count else 0.0,
+            max_ms  = max_ms,
+            p50_ms  = self.getPercentile(50),
+            p95_ms  = self.getPercentile(95),
+            p99_ms  = self.getPercentile(99),
+            buckets = dict(zip(bucket_labels, buckets)),
+        )
+
+
+
+#------------------------------------------------------
+# Histogram registry
+#------------------------------------------------------
+
+_histograms: dict[str, LatencyHistogram] = {}
+_histograms_lock = threading.Lock()
+
+
+#------------------------------------------------------
+# Get the histogram with the given name (created on first use)
+#------------------------------------------------------
+def getHistogram(name: str) -> LatencyHistogram:
+    histogram = _histograms.get(name)
+
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, LatencyHistogram())
+
+    return histogram
+
+#------------------------------------------------------
+# Time the body of the with statement into the named histogram.
+# An exception is recorded as an error (and re-raised).
+#------------------------------------------------------
+@contextmanager
+def timed(name: str):
+    start = time.perf_counter()
+
+    try:
+        yield
+    except BaseException:
+        getHistogram(name).observe(time.perf_counter() - start, error=True)
+        raise
+
+    getHistogram(name).observe(time.perf_counter() - start)
+
+#------------------------------------------------------
+# Get the stats of every histogram
+#------------------------------------------------------
+def getStats() -> dict:
+    with _histograms_lock:
+        histograms = dict(_histograms)
+
+    return {name: histogram.getStats() for name, histogram in sorted(histograms.items())}
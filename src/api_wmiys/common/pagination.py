@@ -6,10 +6,19 @@ The 2 main data members are:
 - page
 - per_page
 
+KeysetPagination is the cursor based alternative: instead of an OFFSET, the next page 
+starts right after the last row of the previous page (its sort value and id), so any page 
+costs the same as the first one.
+
 """
 
+from __future__ import annotations
+import base64
+import json
 import math
 import flask
+from .sorting import Sorting
+
 
 class Pagination:
 
@@ -18,6 +27,9 @@ class Pagination:
     DEFAULT_PER_PAGE = 20
     MAX_PER_PAGE     = 100
 
+    # name of the column added by getSqlStmtWindowCount
+    TOTAL_COUNT_COLUMN = 'total_records'
+
     #----------------------------------------------------------
     # Constructor
     #----------------------------------------------------------
@@ -87,6 +99,22 @@ class Pagination:
     #----------------------------------------------------------
     def getSqlStmtTotalCount(self, original_sql_stmt: str) -> str:
         return f"SELECT COUNT(*) AS count FROM ({original_sql_stmt}) t"
+
+    #----------------------------------------------------------
+    # Generate an SQL statement that selects all the columns of another 
+    # sql statement plus a column with the total record count.
+    #
+    # The window count is computed before any ORDER BY/LIMIT clause that 
+    # gets appended, so every row of a page has the total for all the pages.
+    #
+    # Parms:
+    #   original_sql_stmt: the original sql statement (no ORDER BY/LIMIT)
+    #
+    # Returns a str:
+    #   an sql statement with the extra TOTAL_COUNT_COLUMN column.
+    #----------------------------------------------------------
+    def getSqlStmtWindowCount(self, original_sql_stmt: str) -> str:
+        return f"SELECT t.*, COUNT(*) OVER() AS {self.TOTAL_COUNT_COLUMN} FROM ({original_sql_stmt}) t"
     
 
     #----------------------------------------------------------
@@ -134,6 +162,155 @@ class Pagination:
         return math.ceil(totalRecords / self.per_page)
 
 
+
+#----------------------------------------------------------
+# Position of the last row of a page
+#----------------------------------------------------------
+class Cursor:
+
+    #----------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   sort_field: the field the results are sorted by
+    #   sort_type: ASC or DESC
+    #   value: the last row's sort field value
+    #   id: the last row's id (tie breaker)
+    #   total_records: the total record count from the first page
+    #----------------------------------------------------------
+    def __init__(self, sort_field: str, sort_type: str, value, id, total_records: int=None):
+        self.sort_field    = sort_field
+        self.sort_type     = sort_type
+        self.value         = value
+        self.id            = id
+        self.total_records = total_records
+
+    #----------------------------------------------------------
+    # Encode the cursor into an opaque url safe token
+    #----------------------------------------------------------
+    def encode(self) -> str:
+        payload = [self.sort_field, self.sort_type, self.value, self.id, self.total_records]
+        raw = json.dumps(payload, default=str, separators=(',', ':')).encode()
+
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    #----------------------------------------------------------
+    # Decode the token generated by encode.
+    # Raises a ValueError if it is not a valid token.
+    #----------------------------------------------------------
+    @staticmethod
+    def decode(token: str) -> Cursor:
+        try:
+            padding = '=' * (-len(token) % 4)
+            raw = base64.urlsafe_b64decode(token + padding)
+            sort_field, sort_type, value, id, total_records = json.loads(raw)
+        except Exception:
+            raise ValueError('Invalid cursor')
+        
+        if not isinstance(total_records, (int, type(None))):
+            raise ValueError('Invalid cursor')
+
+        return Cursor(sort_field, sort_type, value, id, total_records)
+
+
+class KeysetPagination(Pagination):
+
+    # column used as the tie breaker
+    ID_COLUMN = 'id'
+
+    #----------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   per_page: number of records per page
+    #   cursor: where the page starts (None for the first page)
+    #----------------------------------------------------------
+    def __init__(self, per_page: int=None, cursor: Cursor=None):
+        super().__init__(page=self.DEFAULT_PAGE, per_page=per_page)
+        self.cursor = cursor
+
+        # set when the client's cursor could not be decoded
+        self.is_cursor_invalid = False
+
+    #----------------------------------------------------------
+    # There is no offset in keyset pagination
+    #----------------------------------------------------------
+    @property
+    def offset(self) -> int:
+        return 0
+
+    #----------------------------------------------------------
+    # Check if the cursor was generated for the given sorting
+    #----------------------------------------------------------
+    def isCursorValid(self, sorting) -> bool:
+        if self.is_cursor_invalid:
+            return False
+        elif not self.cursor:
+            return True
+        
+        return self.cursor.sort_field == sorting.field and self.cursor.sort_type == sorting.type
+
+    #----------------------------------------------------------
+    # Generate the sql statement that returns the page after the cursor.
+    #
+    # One extra record is fetched so the caller knows if there is a next page.
+    #
+    # NULL values are sorted first (ASC) and last (DESC) by MySQL, so the seek 
+    # predicate has to account for them as well.
+    #
+    # Parms:
+    #   original_sql_stmt: the original sql statement (no ORDER BY/LIMIT)
+    #   sorting: a Sorting object (field has to be one of its acceptable fields)
+    #
+    # Returns a tuple: (sql statement, parms for the seek predicate)
+    #----------------------------------------------------------
+    def getSqlStmtSeek(self, original_sql_stmt: str, sorting) -> tuple[str, tuple]:
+        field     = f't.{sorting.field}'
+        id_column = f't.{self.ID_COLUMN}'
+        
+        where_clause, parms = self._getSeekPredicate(field, id_column, sorting.type)
+
+        sql = f"""
+            SELECT t.* FROM ({original_sql_stmt}) t 
+            {where_clause} 
+            ORDER BY {field} {sorting.type}, {id_column} {sorting.type} 
+            LIMIT {self.per_page + 1}
+        """
+
+        return (sql, parms)
+
+    #----------------------------------------------------------
+    # Get the WHERE clause that skips every row up to and including the cursor's row
+    #----------------------------------------------------------
+    def _getSeekPredicate(self, field: str, id_column: str, sort_type: str) -> tuple[str, tuple]:
+        if not self.cursor:
+            return ('', tuple())
+        
+        value = self.cursor.value
+        id    = self.cursor.id
+
+        if sort_type == Sorting.TYPE_DESC and value is None:
+            return (f'WHERE {field} IS NULL AND {id_column} < %s', (id,))
+        elif sort_type == Sorting.TYPE_DESC:
+            return (f'WHERE ({field} < %s OR ({field} = %s AND {id_column} < %s) OR {field} IS NULL)', (value, value, id))
+        elif value is None:
+            return (f'WHERE (({field} IS NULL AND {id_column} > %s) OR {field} IS NOT NULL)', (id,))
+        else:
+            return (f'WHERE ({field} > %s OR ({field} = %s AND {id_column} > %s))', (value, value, id))
+
+    #----------------------------------------------------------
+    # Generate the cursor that points at the given record (last one of the page)
+    #----------------------------------------------------------
+    def getNextCursor(self, last_record: dict, sorting, total_records: int) -> Cursor:
+        return Cursor(
+            sort_field    = sorting.field,
+            sort_type     = sorting.type,
+            value         = last_record.get(sorting.field),
+            id            = last_record.get(self.ID_COLUMN),
+            total_records = total_records,
+        )
+
+
 #----------------------------------------------------------
 # Generate a Pagination object from the current request's url parms
 #----------------------------------------------------------
@@ -152,3 +329,26 @@ def getRequestPaginationParms() -> Pagination:
 
     return pagination
 
+
+#----------------------------------------------------------
+# Generate a KeysetPagination object from the current request's url parms
+#----------------------------------------------------------
+def getRequestKeysetPaginationParms() -> KeysetPagination:
+    pagination = KeysetPagination()
+
+    try:
+        pagination.per_page = int(flask.request.args.get('per_page'))
+    except Exception:
+        pagination.per_page = Pagination.DEFAULT_PER_PAGE
+
+    token = flask.request.args.get('cursor') or None
+
+    if not token:
+        return pagination
+
+    try:
+        pagination.cursor = Cursor.decode(token)
+    except ValueError:
+        pagination.is_cursor_invalid = True
+
+    return pagination
@@ -11,6 +11,7 @@ A flask response is a tuple that consists of:
 """
 
 from http import HTTPStatus
+import hashlib
 import flask
 
 
@@ -20,6 +21,29 @@ import flask
 def get(output=None) -> flask.Response:
     return _standardReturn(output, HTTPStatus.OK)
 
+#----------------------------------------------------------
+# Resource successfully GET, for resources that (practically) never change.
+#
+# The response has a strong ETag (hash of the body) and a public Cache-Control max-age,
+# so browsers and proxies can reuse it. Answers 304 (no body) when the client's
+# If-None-Match has the same ETag.
+#----------------------------------------------------------
+def getCacheable(output, max_age_seconds: int) -> flask.Response:
+    body = flask.jsonify(output).get_data()
+    return getCacheableJson(body, hashlib.sha256(body).hexdigest()[:32], max_age_seconds)
+
+#----------------------------------------------------------
+# getCacheable for an already encoded json body and its ETag
+#----------------------------------------------------------
+def getCacheableJson(body: bytes, etag: str, max_age_seconds: int) -> flask.Response:
+    response = flask.Response(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.cache_control.public  = True
+    response.cache_control.max_age = max_age_seconds
+
+    return response.make_conditional(flask.request)
+
 #----------------------------------------------------------
 # Resource was successfully UPDATED
 #----------------------------------------------------------
@@ -2,13 +2,27 @@ from __future__ import annotations
 from http.client import responses
 import flask
 from functools import wraps
+import hashlib
+import hmac
+import secrets
 from wmiys_common import keys
 from api_wmiys.services import products as product_services
 from api_wmiys.services import users as user_services
 from api_wmiys.common import responses
+from api_wmiys.common import tokens
+from api_wmiys.common import caching
 
 CLIENT_CUSTOM_HEADER_KEY = 'x-client-key'
 
+# authorization header scheme for the signed access tokens
+BEARER_SCHEME = 'Bearer'
+
+# accept basic authentication (email/password) when there is no token (set by api_wmiys.configureAuthTokens)
+BASIC_AUTH_ENABLED = True
+
+# salt for the credentials cache keys (different in every process, never leaves memory)
+_CREDENTIALS_CACHE_SALT = secrets.token_bytes(32)
+
 
 #------------------------------------------------------
 # Decorator for verify_authorization_credentials
@@ -22,13 +36,19 @@ def login_required(f):
 
 
 #------------------------------------------------------
-# Verifies that:
-#   - client request has basic authentication header fields
-#   - the credentials are correct
+# Verifies that either:
+#   - client request has a valid access token (Bearer)
+#   - client request has basic authentication header fields and the credentials are correct
 #------------------------------------------------------
 def verify_authorization_credentials():
+    access_token = getBearerToken()
+
+    if access_token is not None:
+        verify_access_token(access_token)
+        return
+
     # if user is not logged in, redirect to login page
-    if not flask.request.authorization:
+    if not flask.request.authorization or not BASIC_AUTH_ENABLED:
         flask.abort(401)
     
     # make sure the user is authorized
@@ -43,6 +63,35 @@ def verify_authorization_credentials():
     flask.g.client_email    = flask.request.authorization.username
 
 
+#------------------------------------------------------
+# Verify the access token (no database access).
+# An invalid or expired token is a 401 so the client knows to login again.
+#------------------------------------------------------
+def verify_access_token(access_token: str):
+    claims = tokens.verifyToken(access_token)
+
+    if claims is None:
+        flask.abort(401)
+
+    # the password is not known with token authentication
+    flask.g.client_id       = claims.user_id
+    flask.g.client_password = None
+    flask.g.client_email    = claims.email
+
+#------------------------------------------------------
+# Get the token in the request's 'Authorization: Bearer <token>' header.
+# Returns None if there isn't one.
+#------------------------------------------------------
+def getBearerToken() -> str | None:
+    header_value = flask.request.headers.get('Authorization', '', str)
+    scheme, _, token = header_value.partition(' ')
+
+    if scheme.lower() != BEARER_SCHEME.lower() or not token.strip():
+        return None
+
+    return token.strip()
+
+
 #------------------------------------------------------
 # Get a user's id from their email/password combination
 #
@@ -55,6 +104,14 @@ def verify_authorization_credentials():
 #   None - (INCORRECT email/password combo)
 #------------------------------------------------------
 def getUserID(email: str, password: str) -> int | None:
+    cache_key = _getCredentialsCacheKey(email, password)
+    user_id = caching.credentials.get(cache_key)
+
+    if user_id is not None:
+        return user_id
+
+    generation = caching.credentials.generation
+
     try:
         user = user_services.getUserByEmailAndPassword(email, password)
     except Exception as ex:
@@ -64,8 +121,17 @@ def getUserID(email: str, password: str) -> int | None:
     if not user:
         return None
     
+    caching.credentials.set(cache_key, user.id, generation)
+    
     return user.id
 
+#------------------------------------------------------
+# Get the credentials cache key: a salted digest, so the cache never holds the password itself
+#------------------------------------------------------
+def _getCredentialsCacheKey(email: str, password: str) -> bytes:
+    message = f'{email}\0{password}'.encode()
+    return hmac.new(_CREDENTIALS_CACHE_SALT, message, hashlib.sha256).digest()
+
 #------------------------------------------------------
 # Verify that the incoming request was made from the website
 # and not some 3rd party rest service.
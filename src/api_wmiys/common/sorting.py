@@ -79,11 +79,14 @@ class SortingSearchProducts(Sorting):
     
 
     DEFAULT_FIELD = 'name'
+
+    # renter to lender distance (computed by the search service, not a view column)
+    DISTANCE_FIELD = 'distance'
     
     ACCEPTABLE_FIELDS = ['id', 'name', 'description', 'product_categories_sub_id', 'product_categories_sub_name', 
         'product_categories_minor_id', 'product_categories_minor_name', 'product_categories_major_id', 
         'product_categories_major_name', 'dropoff_distance', 'price_full', 'price_half', 'image', 
-        'minimum_age', 'user_id', 'user_name_first', 'user_name_last']
+        'minimum_age', 'user_id', 'user_name_first', 'user_name_last', DISTANCE_FIELD]
 
     def __init__(self, acceptable_fields, default_field, field=None, type=Sorting.TYPE_ASC):
         super().__init__(acceptable_fields, default_field, field=field, sort_type=type)
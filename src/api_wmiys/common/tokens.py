@@ -0,0 +1,131 @@
+"""
+**********************************************************************************************
+
+Signed access tokens.
+
+The /login route hands out a token that the client sends back in the authorization header
+(Bearer <token>) instead of its email/password, so login_required can identify the client
+without going to the database.
+
+Token format: <payload>.<signature>
+    - payload: base64url json with the user id (sub), email, key id (kid), issued at (iat) and expiration (exp)
+    - signature: base64url HMAC-SHA256 of the encoded payload with the key named by kid
+
+Key rotation: new tokens are always signed with ACTIVE_KEY_ID, but a token signed with any of
+the KEYS still verifies. To rotate, add the new key, make it the active one, and remove the old
+key once TTL_SECONDS have gone by.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+# key id -> secret (set by api_wmiys.configureAuthTokens)
+KEYS: dict[str, bytes] = {}
+
+# key id used to sign new tokens
+ACTIVE_KEY_ID: str = None
+
+# number of seconds a token is valid for
+TTL_SECONDS = 3600
+
+
+#------------------------------------------------------
+# The verified contents of a token
+#------------------------------------------------------
+@dataclass
+class TokenClaims:
+    user_id: int
+    email: str
+    issued_at: int
+    expires_at: int
+
+
+#------------------------------------------------------
+# Check if tokens can be issued
+#------------------------------------------------------
+def isEnabled() -> bool:
+    return ACTIVE_KEY_ID is not None and ACTIVE_KEY_ID in KEYS
+
+#------------------------------------------------------
+# Create a new signed token for the user.
+# Returns None if no signing key is configured.
+#------------------------------------------------------
+def createToken(user_id: int, email: str=None) -> str | None:
+    if not isEnabled():
+        return None
+
+    issued_at = int(time.time())
+
+    payload = dict(
+        sub   = user_id,
+        email = email,
+        kid   = ACTIVE_KEY_ID,
+        iat   = issued_at,
+        exp   = issued_at + TTL_SECONDS,
+    )
+
+    encoded_payload = _encode(json.dumps(payload, separators=(',', ':')).encode())
+    signature = _sign(encoded_payload, KEYS[ACTIVE_KEY_ID])
+
+    return f'{encoded_payload}.{signature}'
+
+#------------------------------------------------------
+# Verify the token's signature and expiration.
+# Returns None if the token is malformed, tampered with, signed with an unknown key, or expired.
+#------------------------------------------------------
+def verifyToken(token: str) -> TokenClaims | None:
+    try:
+        encoded_payload, signature = token.split('.')
+        payload = json.loads(_decode(encoded_payload))
+        key = KEYS.get(payload.get('kid'))
+    except Exception:
+        return None
+
+    if key is None:
+        return None
+
+    if not hmac.compare_digest(signature, _sign(encoded_payload, key)):
+        return None
+
+    try:
+        claims = TokenClaims(
+            user_id    = int(payload['sub']),
+            email      = payload.get('email'),
+            issued_at  = int(payload['iat']),
+            expires_at = int(payload['exp']),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if claims.expires_at <= time.time():
+        return None
+
+    return claims
+
+
+#------------------------------------------------------
+# HMAC-SHA256 signature of the encoded payload
+#------------------------------------------------------
+def _sign(encoded_payload: str, key: bytes) -> str:
+    digest = hmac.new(key, encoded_payload.encode(), hashlib.sha256).digest()
+    return _encode(digest)
+
+#------------------------------------------------------
+# Unpadded base64url encode
+#------------------------------------------------------
+def _encode(value: bytes) -> str:
+    return base64.urlsafe_b64encode(value).rstrip(b'=').decode()
+
+#------------------------------------------------------
+# Unpadded base64url decode
+#------------------------------------------------------
+def _decode(value: str) -> bytes:
+    padding = '=' * (-len(value) % 4)
+    return base64.urlsafe_b64decode(value + padding)
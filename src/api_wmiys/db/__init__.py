@@ -1 +1,6 @@
-from . import credentials as credentials
\ No newline at end of file
+from . import credentials as credentials
+from . import pool as pool
+from . import session as session
+from . import identity_map as identity_map
+from . import connection as connection
+from . import commands as commands
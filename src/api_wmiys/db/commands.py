@@ -0,0 +1,112 @@
+"""
+**********************************************************************************************
+
+Sql commands.
+
+Drop-in replacement for pymysql.commands that runs every statement on a pooled connection
+(the request's session connection during a request, see db.session).
+Each function returns a DbOperationResult:
+
+    - select:       data is the first row (dict) or None
+    - selectAll:    data is a list of rows (dicts)
+    - modify:       data is the number of affected rows
+
+During a request, identical selects are answered by the request's identity map and modify
+invalidates the entries of the table it changed (see db.identity_map).
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from pymysql.structs import DbOperationResult
+
+from .connection import ConnectionDict
+from . import session as db_session
+
+
+#------------------------------------------------------
+# The commands keep the identity map up to date themselves
+#------------------------------------------------------
+class _CommandConnection(ConnectionDict):
+    CLEARS_IDENTITY_MAP = False
+
+
+#------------------------------------------------------
+# Select a single row
+#------------------------------------------------------
+def select(sql: str, parms: tuple=None) -> DbOperationResult:
+    return _executeSelect(sql, parms, lambda cursor: cursor.fetchone())
+
+#------------------------------------------------------
+# Select all the rows
+#------------------------------------------------------
+def selectAll(sql: str, parms: tuple=None) -> DbOperationResult:
+    return _executeSelect(sql, parms, lambda cursor: cursor.fetchall())
+
+#------------------------------------------------------
+# Run an insert/update/delete statement and commit it
+#------------------------------------------------------
+def modify(sql: str, parms: tuple=None) -> DbOperationResult:
+    session = db_session.getSession()
+
+    try:
+        return _execute(sql, parms, lambda cursor: cursor.rowcount, commit=True)
+    finally:
+        if session is not None:
+            session.identity_map.invalidate(sql)
+
+#------------------------------------------------------
+# Execute the select statement.
+# During a request the result is looked up in/saved to the identity map.
+#------------------------------------------------------
+def _executeSelect(sql: str, parms: tuple, fetch_callback) -> DbOperationResult:
+    session = db_session.getSession()
+
+    if session is None:
+        return _execute(sql, parms, fetch_callback)
+
+    found, data = session.identity_map.get(sql, parms)
+
+    if found:
+        db_result = DbOperationResult(successful=True)
+        db_result.data = data
+        return db_result
+
+    db_result = _execute(sql, parms, fetch_callback)
+
+    if db_result.successful:
+        session.identity_map.set(sql, parms, db_result.data)
+
+    return db_result
+
+#------------------------------------------------------
+# Execute the statement on a pooled connection
+#
+# Parms:
+#   - sql: the statement
+#   - parms: the statement parms
+#   - fetch_callback: gets the result data out of the cursor
+#   - commit: commit after executing
+#------------------------------------------------------
+def _execute(sql: str, parms: tuple, fetch_callback, commit: bool=False) -> DbOperationResult:
+    db_result = DbOperationResult(successful=True)
+    db = _CommandConnection()
+
+    try:
+        db.connect()
+        cursor = db.getCursor()
+        cursor.execute(sql, parms)
+        db_result.data = fetch_callback(cursor)
+
+        if commit:
+            db.commit()
+    
+    except Exception as e:
+        db_result.successful = False
+        db_result.data       = None
+        db_result.error      = e
+    
+    finally:
+        db.close()
+    
+    return db_result
@@ -0,0 +1,122 @@
+"""
+**********************************************************************************************
+
+Database connections.
+
+Drop-in replacements for the pymysql.connection classes that check a connection out of the
+process's pool on connect() and return it on close().
+
+During a request they use the request's session connection instead (see db.session): commit()
+is deferred to the end of the request and close() does not return the connection. Since the
+statements run through these classes can write to any table, close() also clears the request's
+identity map. Subclasses with USES_SESSION = False always get their own pooled connection, for
+work that has to be committed before the request ends (e.g. before calling stripe).
+
+    - ConnectionBase:       default cursors
+    - ConnectionDict:       cursors return dictionaries
+    - ConnectionPrepared:   cursors use prepared statements
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+
+from . import pool
+from . import session as db_session
+
+
+class ConnectionBase:
+
+    # mysql.connector cursor() keyword args
+    CURSOR_ARGS = dict()
+
+    # clear the request's identity map on close
+    CLEARS_IDENTITY_MAP = True
+
+    # use the request's session connection (and transaction) during a request
+    USES_SESSION = True
+
+    #------------------------------------------------------
+    # Constructor
+    #------------------------------------------------------
+    def __init__(self):
+        self.connection = None
+        self._pooled_connection: pool.PooledConnection = None
+        self._session: db_session.Session = None
+        self._cursors = []
+
+    #------------------------------------------------------
+    # Check a connection out of the pool
+    #------------------------------------------------------
+    def connect(self):
+        if self.connection is not None:
+            return
+
+        self._session = db_session.getSession() if self.USES_SESSION else None
+
+        if self._session is not None:
+            self.connection = self._session.getConnection()
+        else:
+            self._pooled_connection = pool.getPool().checkout()
+            self.connection = self._pooled_connection.connection
+
+    #------------------------------------------------------
+    # Get a new cursor (it gets closed along with the connection)
+    #------------------------------------------------------
+    def getCursor(self):
+        cursor = self.connection.cursor(**self.CURSOR_ARGS)
+        self._cursors.append(cursor)
+
+        return cursor
+
+    #------------------------------------------------------
+    # Commit the current transaction (deferred to the end of the request when in a session)
+    #------------------------------------------------------
+    def commit(self):
+        if self._session is None:
+            self.connection.commit()
+
+    #------------------------------------------------------
+    # Rollback the current transaction (the whole request's work when in a session).
+    # In a session it's only marked rollback only: rolling the shared connection back now would
+    # leave it in autocommit mode, and the request's next statements would be committed right away.
+    #------------------------------------------------------
+    def rollback(self):
+        if self._session is not None:
+            self._session.markRollbackOnly()
+        else:
+            self.connection.rollback()
+
+    #------------------------------------------------------
+    # Close the cursors and return the connection to the pool (the session keeps its connection)
+    #------------------------------------------------------
+    def close(self):
+        if self.connection is None:
+            return
+
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+        if self._session is not None and self.CLEARS_IDENTITY_MAP:
+            self._session.identity_map.clear()
+
+        pooled_connection = self._pooled_connection
+
+        self._cursors = []
+        self._pooled_connection = None
+        self._session = None
+        self.connection = None
+
+        if pooled_connection is not None:
+            pooled_connection.pool.checkin(pooled_connection)
+
+
+class ConnectionDict(ConnectionBase):
+    CURSOR_ARGS = dict(dictionary=True)
+
+
+class ConnectionPrepared(ConnectionBase):
+    CURSOR_ARGS = dict(prepared=True)
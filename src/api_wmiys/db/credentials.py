@@ -0,0 +1,14 @@
+"""
+**********************************************************************************************
+
+Database credentials.
+
+These are set by api_wmiys.configureDatabaseConnection when the app starts.
+
+**********************************************************************************************
+"""
+
+USER     = None
+PASSWORD = None
+DATABASE = None
+HOST     = None
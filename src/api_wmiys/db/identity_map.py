@@ -0,0 +1,202 @@
+"""
+**********************************************************************************************
+
+Request-scoped identity map.
+
+The results of the select commands run during a request are remembered (keyed on the sql
+statement + parms), so repeating an identical select in the same request returns the rows that
+were already fetched instead of going back to the database. Callers always get their own copy.
+
+Every entry knows which tables it read from. The tables are parsed out of the statement and the
+views/functions it uses are expanded into their base tables (see DEPENDENCIES). A write removes
+all the entries that read from the table it changed (or that its triggers change, see
+TRIGGER_WRITES), so a select that follows a write in the same request still sees the new data.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+import re
+
+#------------------------------------------------------
+# Base tables read by each view/function (sql/views, sql/functions).
+# Keep in sync when a view or function changes.
+#------------------------------------------------------
+DEPENDENCIES = {
+    'ALL_CATEGORIES'                   : {'PRODUCT_CATEGORIES_MAJOR', 'PRODUCT_CATEGORIES_MINOR', 'PRODUCT_CATEGORIES_SUB'},
+    'VIEW_PAYMENTS_INTERNAL'           : {'PAYMENTS', 'PRODUCTS', 'USERS'},
+    'VIEW_PRODUCT_AVAILABILITY'        : {'PRODUCT_AVAILABILITY'},
+    'VIEW_PRODUCT_LISTINGS'            : {'PRODUCTS', 'PRODUCT_CATEGORIES_MAJOR', 'PRODUCT_CATEGORIES_MINOR', 'PRODUCT_CATEGORIES_SUB', 'USERS'},
+    'VIEW_PRODUCT_REQUESTS_INTERNAL'   : {'PAYMENTS', 'PRODUCT_REQUESTS', 'PRODUCTS', 'USERS'},
+    'VIEW_PRODUCTS'                    : {'LOCATIONS', 'PRODUCTS', 'PRODUCT_CATEGORIES_MAJOR', 'PRODUCT_CATEGORIES_MINOR', 'PRODUCT_CATEGORIES_SUB', 'USERS'},
+    'VIEW_REQUESTS_LENDER'             : {'LOCATIONS', 'PAYMENTS', 'PRODUCT_REQUESTS', 'PRODUCTS'},
+    'VIEW_REQUESTS_RENTER'             : {'LOCATIONS', 'PAYMENTS', 'PRODUCT_REQUESTS', 'PRODUCTS'},
+    'VIEW_SEARCH_PRODUCTS'             : {'PRODUCTS', 'PRODUCT_CATEGORIES_MAJOR', 'PRODUCT_CATEGORIES_MINOR', 'PRODUCT_CATEGORIES_SUB', 'USERS'},
+    'VIEW_USERS'                       : {'PAYOUT_ACCOUNTS', 'USERS', 'USER_STATS', 'LENDER_LEDGERS'},
+    'CALCULATE_LENDER_BALANCE'         : {'BALANCE_TRANSFERS', 'PAYMENTS', 'PRODUCT_REQUESTS', 'PRODUCTS'},
+    'CALCULATE_LENDER_EARNINGS'        : {'PAYMENTS', 'PRODUCT_REQUESTS', 'PRODUCTS'},
+    'IS_PRODUCT_AVAILABLE'             : {'PRODUCT_AVAILABILITY'},
+    'MILES_BETWEEN'                    : {'LOCATIONS'},
+    'PRODUCT_HAS_CONFLICTING_REQUESTS' : {'PAYMENTS', 'PRODUCT_REQUESTS'},
+    'PRODUCT_IS_COMPLETE'              : {'PRODUCTS'},
+    'SEARCH_PRODUCTS_FILTER'           : {'LOCATIONS', 'PRODUCTS', 'IS_PRODUCT_AVAILABLE'},
+    'TABLE_TO_TEXT'                    : {'USERS'},
+}
+
+#------------------------------------------------------
+# Other tables changed by the triggers of a table (sql/triggers)
+#------------------------------------------------------
+TRIGGER_WRITES = {
+    'PRODUCTS'         : {'USER_STATS'},
+    'PRODUCT_REQUESTS' : {'USER_STATS'},
+}
+
+# tables/views a statement reads from
+_RE_READ_TABLES = re.compile(r'\b(?:FROM|JOIN)[\s(]+`?(\w+)', re.IGNORECASE)
+
+# functions a statement calls
+_RE_FUNCTION_CALLS = re.compile(r'\b(\w+)\s*\(')
+
+# table a statement writes to
+_RE_WRITE_TABLE = re.compile(r'^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)', re.IGNORECASE)
+
+# multi-table write (UPDATE a INNER JOIN b ... / UPDATE a, b ...): any of the tables can be changed
+_RE_MULTI_TABLE_WRITE = re.compile(r'\bJOIN\b|^\s*UPDATE\s+`?\w+`?(?:\s+(?:AS\s+)?(?!SET\b)\w+)?\s*,', re.IGNORECASE)
+
+
+class IdentityMap:
+
+    #------------------------------------------------------
+    # Constructor
+    #------------------------------------------------------
+    def __init__(self):
+        self.hits   = 0
+        self.misses = 0
+
+        # (sql, parms) -> (tables, data)
+        self._entries: dict[tuple, tuple[frozenset, object]] = {}
+
+    #------------------------------------------------------
+    # Get the remembered result of the select.
+    #
+    # Returns a tuple: (found, copy of the data)
+    #------------------------------------------------------
+    def get(self, sql: str, parms) -> tuple[bool, object]:
+        key = _getKey(sql, parms)
+        entry = self._entries.get(key) if key is not None else None
+
+        if entry is None:
+            self.misses += 1
+            return (False, None)
+
+        self.hits += 1
+
+        return (True, _copyData(entry[1]))
+
+    #------------------------------------------------------
+    # Remember the result of the select
+    #------------------------------------------------------
+    def set(self, sql: str, parms, data):
+        key = _getKey(sql, parms)
+
+        if key is not None:
+            self._entries[key] = (getReadTables(sql), _copyData(data))
+
+    #------------------------------------------------------
+    # Forget the results that depend on the table the write statement changes.
+    # If the table can't be determined (or the statement writes to several tables), everything is forgotten.
+    #------------------------------------------------------
+    def invalidate(self, write_sql: str):
+        table = getWriteTable(write_sql)
+
+        if table is None:
+            self.clear()
+            return
+
+        changed_tables = {table} | TRIGGER_WRITES.get(table, set())
+        stale_keys = [key for key, (tables, _) in self._entries.items() if not tables.isdisjoint(changed_tables)]
+
+        for key in stale_keys:
+            del self._entries[key]
+
+    #------------------------------------------------------
+    # Forget everything
+    #------------------------------------------------------
+    def clear(self):
+        self._entries.clear()
+
+    #------------------------------------------------------
+    # Number of remembered results
+    #------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+#------------------------------------------------------
+# Get the base tables the select statement reads (views and functions are expanded)
+#------------------------------------------------------
+def getReadTables(sql: str) -> frozenset:
+    names = {name.upper() for name in _RE_READ_TABLES.findall(sql)}
+    names.update(name.upper() for name in _RE_FUNCTION_CALLS.findall(sql) if name.upper() in DEPENDENCIES)
+
+    return frozenset(_expandDependencies(names))
+
+#------------------------------------------------------
+# Get the table the insert/update/delete statement writes to
+# (None if it can't be parsed, or if it may write to more than one table)
+#------------------------------------------------------
+def getWriteTable(sql: str) -> str | None:
+    match = _RE_WRITE_TABLE.match(sql)
+
+    if match is None or _RE_MULTI_TABLE_WRITE.search(sql):
+        return None
+
+    return match.group(1).upper()
+
+#------------------------------------------------------
+# Replace the views/functions with the base tables they read from
+#------------------------------------------------------
+def _expandDependencies(names: set[str]) -> set[str]:
+    tables  = set()
+    pending = list(names)
+    visited = set()
+
+    while pending:
+        name = pending.pop()
+
+        if name in visited:
+            continue
+
+        visited.add(name)
+
+        if name in DEPENDENCIES:
+            pending.extend(DEPENDENCIES[name])
+        else:
+            tables.add(name)
+
+    return tables
+
+#------------------------------------------------------
+# Identity map key.
+# Returns None if the parms are not hashable (the result is not remembered).
+#------------------------------------------------------
+def _getKey(sql: str, parms) -> tuple | None:
+    key = (sql, tuple(parms) if parms is not None else None)
+
+    try:
+        hash(key)
+    except TypeError:
+        return None
+
+    return key
+
+#------------------------------------------------------
+# Copy of a select result: a row (dict), a list of rows, or None
+#------------------------------------------------------
+def _copyData(data):
+    if isinstance(data, dict):
+        return dict(data)
+    elif isinstance(data, list):
+        return [dict(row) if isinstance(row, dict) else row for row in data]
+    else:
+        return data
@@ -0,0 +1,404 @@
+"""
+**********************************************************************************************
+
+Database connection pool.
+
+Every worker process keeps a pool of open MySQL connections that all the repositories share,
+so a request does not pay for a TCP connect + authentication on every sql command.
+
+    - min/max size: MIN_SIZE connections are opened up front, never more than MAX_SIZE are open
+    - checkout health check: a connection that was idle for HEALTH_CHECK_IDLE_SECONDS gets pinged first
+    - max lifetime: connections older than MAX_LIFETIME_SECONDS are closed instead of reused
+    - wait metrics: how many checkouts had to wait for a connection, and for how long
+
+mod_wsgi runs several processes. Each process gets its own pool: getPool() creates a new one
+whenever the process id changes, so connections inherited through a fork are never shared.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from collections import deque
+from dataclasses import dataclass, field
+import os
+import threading
+import time
+
+import mysql.connector
+
+from . import credentials
+
+# pool options (set by api_wmiys.configureDatabaseConnection)
+MIN_SIZE                  = 1
+MAX_SIZE                  = 10
+MAX_LIFETIME_SECONDS      = 1800
+HEALTH_CHECK_IDLE_SECONDS = 30
+CHECKOUT_TIMEOUT_SECONDS  = 10
+
+
+#------------------------------------------------------
+# Raised when no connection became available before the checkout timeout
+#------------------------------------------------------
+class PoolTimeoutError(Exception):
+    pass
+
+
+#------------------------------------------------------
+# An open connection that belongs to the pool
+#------------------------------------------------------
+@dataclass
+class PooledConnection:
+    connection: mysql.connector.MySQLConnection
+    pool: ConnectionPool
+    created_at: float   = field(default_factory=time.monotonic)
+    last_used_at: float = field(default_factory=time.monotonic)
+
+    #------------------------------------------------------
+    # Check if the connection is past the max lifetime
+    #------------------------------------------------------
+    def isExpired(self, max_lifetime_seconds: float) -> bool:
+        return (time.monotonic() - self.created_at) > max_lifetime_seconds
+
+    #------------------------------------------------------
+    # Number of seconds since the connection was returned to the pool
+    #------------------------------------------------------
+    def getIdleSeconds(self) -> float:
+        return time.monotonic() - self.last_used_at
+
+
+class ConnectionPool:
+
+    #------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   - connect_args: mysql.connector.connect keyword args
+    #   - min_size: number of connections opened by fill()
+    #   - max_size: max number of open connections (idle + checked out)
+    #   - max_lifetime_seconds: connections older than this are closed when they are returned
+    #   - health_check_idle_seconds: connections idle for longer than this are pinged on checkout
+    #   - checkout_timeout_seconds: max number of seconds a checkout waits for a connection
+    #------------------------------------------------------
+    def __init__(self, connect_args: dict, min_size: int=MIN_SIZE, max_size: int=MAX_SIZE, max_lifetime_seconds: float=MAX_LIFETIME_SECONDS, health_check_idle_seconds: float=HEALTH_CHECK_IDLE_SECONDS, checkout_timeout_seconds: float=CHECKOUT_TIMEOUT_SECONDS):
+        self.connect_args              = connect_args
+        self.min_size                  = min(min_size, max_size)
+        self.max_size                  = max_size
+        self.max_lifetime_seconds      = max_lifetime_seconds
+        self.health_check_idle_seconds = health_check_idle_seconds
+        self.checkout_timeout_seconds  = checkout_timeout_seconds
+        self.pid                       = os.getpid()
+        self.is_closed                 = False
+
+        # metrics
+        self.checkouts          = 0
+        self.waits              = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max   = 0.0
+        self.timeouts           = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.health_check_fails = 0
+
+        self._idle: deque[PooledConnection] = deque()
+        self._num_open  = 0
+        self._condition = threading.Condition()
+
+    #------------------------------------------------------
+    # Open connections until there are min_size of them
+    #------------------------------------------------------
+    def fill(self):
+        while True:
+            with self._condition:
+                if self._num_open >= self.min_size:
+                    return
+
+                self._num_open += 1
+
+            try:
+                pooled_connection = self._open()
+            except Exception:
+                self._release()
+                raise
+
+            self.checkin(pooled_connection)
+
+    #------------------------------------------------------
+    # Get a connection out of the pool.
+    # Waits up to checkout_timeout_seconds for one to become available.
+    #------------------------------------------------------
+    def checkout(self) -> PooledConnection:
+        start    = time.monotonic()
+        deadline = start + self.checkout_timeout_seconds
+        waited   = False
+
+        while True:
+            pooled_connection = None
+
+            with self._condition:
+                while True:
+                    pooled_connection = self._popIdle()
+
+                    if pooled_connection is not None:
+                        break
+                    elif self._num_open < self.max_size:
+                        self._num_open += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(f'No database connection available after {self.checkout_timeout_seconds} seconds')
+
+                    waited = True
+                    self._condition.wait(remaining)
+
+            # a slot was reserved for a new connection
+            if pooled_connection is None:
+                try:
+                    pooled_connection = self._open()
+                except Exception:
+                    self._release()
+                    raise
+
+            elif not self._isHealthy(pooled_connection):
+                self._close(pooled_connection)
+                continue
+
+            self._recordCheckout(time.monotonic() - start, waited)
+
+            return pooled_connection
+
+    #------------------------------------------------------
+    # Return a connection to the pool.
+    # Any open transaction is rolled back, and the connection is closed if
+    # it is expired, broken, or the caller says so.
+    #------------------------------------------------------
+    def checkin(self, pooled_connection: PooledConnection, discard: bool=False):
+        # the connection was inherited from the parent process - leave it alone
+        if self.pid != os.getpid():
+            return
+
+        if discard or self.is_closed or pooled_connection.isExpired(self.max_lifetime_seconds):
+            discard = True
+        else:
+            discard = not self._reset(pooled_connection)
+
+        if discard:
+            self._close(pooled_connection)
+            return
+
+        pooled_connection.last_used_at = time.monotonic()
+
+        with self._condition:
+            self._idle.append(pooled_connection)
+            self._condition.notify()
+
+    #------------------------------------------------------
+    # Close the pool: the idle connections are closed now, the checked out ones when they are returned
+    #------------------------------------------------------
+    def close(self):
+        with self._condition:
+            self.is_closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+
+        for pooled_connection in idle:
+            self._close(pooled_connection)
+
+    #------------------------------------------------------
+    # Get the pool metrics
+    #------------------------------------------------------
+    def getStats(self) -> dict:
+        with self._condition:
+            num_open = self._num_open
+            num_idle = len(self._idle)
+
+        return dict(
+            pid                = self.pid,
+            min_size           = self.min_size,
+            max_size           = self.max_size,
+            open               = num_open,
+            idle               = num_idle,
+            in_use             = num_open - num_idle,
+            checkouts          = self.checkouts,
+            waits              = self.waits,
+            wait_seconds_total = self.wait_seconds_total,
+            wait_seconds_max   = self.wait_seconds_max,
+            wait_seconds_avg   = (self.wait_seconds_total / self.waits) if self.waits else 0.0,
+            timeouts           = self.timeouts,
+            connections_opened = self.connections_opened,
+            connections_closed = self.connections_closed,
+            health_check_fails = self.health_check_fails,
+        )
+
+    #------------------------------------------------------
+    # Pop the most recently used idle connection (caller holds the lock).
+    # Expired connections are closed along the way.
+    #------------------------------------------------------
+    def _popIdle(self) -> PooledConnection | None:
+        while self._idle:
+            pooled_connection = self._idle.pop()
+
+            if not pooled_connection.isExpired(self.max_lifetime_seconds):
+                return pooled_connection
+
+            self._num_open -= 1
+            self.connections_closed += 1
+            _closeQuietly(pooled_connection.connection)
+
+        return None
+
+    #------------------------------------------------------
+    # Open a new connection (the caller already reserved the slot)
+    #------------------------------------------------------
+    def _open(self) -> PooledConnection:
+        connection = mysql.connector.connect(**self.connect_args)
+        self.connections_opened += 1
+
+        return PooledConnection(connection=connection, pool=self)
+
+    #------------------------------------------------------
+    # Close the connection and free up its slot
+    #------------------------------------------------------
+    def _close(self, pooled_connection: PooledConnection):
+        _closeQuietly(pooled_connection.connection)
+        self.connections_closed += 1
+        self._release()
+
+    #------------------------------------------------------
+    # Free up a connection slot
+    #------------------------------------------------------
+    def _release(self):
+        with self._condition:
+            self._num_open -= 1
+            self._condition.notify()
+
+    #------------------------------------------------------
+    # Ping the connection if it has been idle for a while
+    #------------------------------------------------------
+    def _isHealthy(self, pooled_connection: PooledConnection) -> bool:
+        if pooled_connection.getIdleSeconds() < self.health_check_idle_seconds:
+            return True
+
+        try:
+            pooled_connection.connection.ping(reconnect=False)
+            return True
+        except Exception:
+            self.health_check_fails += 1
+            return False
+
+    #------------------------------------------------------
+    # Get a returned connection ready for the next checkout.
+    # Returns False if the connection is no longer usable.
+    #------------------------------------------------------
+    def _reset(self, pooled_connection: PooledConnection) -> bool:
+        connection = pooled_connection.connection
+
+        try:
+            if connection.unread_result:
+                connection.get_rows()
+
+            if connection.in_transaction:
+                connection.rollback()
+
+            return True
+        except Exception:
+            return False
+
+    #------------------------------------------------------
+    # Update the checkout metrics
+    #------------------------------------------------------
+    def _recordCheckout(self, wait_seconds: float, waited: bool):
+        with self._condition:
+            self.checkouts += 1
+
+            if not waited:
+                return
+
+            self.waits += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+#------------------------------------------------------
+# Close the connection, ignoring any errors
+#------------------------------------------------------
+def _closeQuietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+
+#------------------------------------------------------
+# Worker process pool instance
+#------------------------------------------------------
+
+_pool: ConnectionPool = None
+_pool_lock = threading.Lock()
+
+
+#------------------------------------------------------
+# Get the current process's pool.
+# A new one is created on first use and after a fork.
+#------------------------------------------------------
+def getPool() -> ConnectionPool:
+    pool = _pool
+
+    if pool is None or pool.pid != os.getpid():
+        pool = _createPool()
+
+    return pool
+
+#------------------------------------------------------
+# Create the process's pool (the connections of a pool inherited from the parent process are abandoned, not closed)
+#------------------------------------------------------
+def _createPool() -> ConnectionPool:
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            return _pool
+
+        _pool = ConnectionPool(
+            connect_args              = _getConnectArgs(),
+            min_size                  = MIN_SIZE,
+            max_size                  = MAX_SIZE,
+            max_lifetime_seconds      = MAX_LIFETIME_SECONDS,
+            health_check_idle_seconds = HEALTH_CHECK_IDLE_SECONDS,
+            checkout_timeout_seconds  = CHECKOUT_TIMEOUT_SECONDS,
+        )
+
+    try:
+        _pool.fill()
+    except Exception as ex:
+        print(ex)
+
+    return _pool
+
+#------------------------------------------------------
+# Get the mysql.connector.connect keyword args
+#------------------------------------------------------
+def _getConnectArgs() -> dict:
+    return dict(
+        user       = credentials.USER,
+        password   = credentials.PASSWORD,
+        host       = credentials.HOST,
+        database   = credentials.DATABASE,
+        autocommit = True,
+    )
+
+#------------------------------------------------------
+# Discard the current pool (the next getPool() call creates a new one with the current options)
+#------------------------------------------------------
+def reset():
+    global _pool
+
+    with _pool_lock:
+        pool  = _pool
+        _pool = None
+
+    if pool is not None and pool.pid == os.getpid():
+        pool.close()
@@ -0,0 +1,215 @@
+"""
+**********************************************************************************************
+
+Request-scoped database session (unit of work).
+
+While a request is being handled, every repository call shares a single pooled connection and
+a single transaction, which is stored on flask.g:
+
+    - the connection is checked out (and the transaction started) by the first sql command
+    - commit() calls made by the repositories are deferred to the end of the request
+    - after the view returns: commit if the response status is < 400, otherwise rollback
+    - teardown: rollback whatever is still open (unhandled exception) and return the connection
+
+The session also holds the request's identity map (see db.identity_map), and the callbacks
+that need to wait until the request's work is committed (see onCommit).
+
+Outside of a request (startup index loads, scripts) the commands fall back on their own
+connection and autocommit, like before.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+import flask
+
+from . import pool
+from .identity_map import IdentityMap
+
+# use a session for every request (set by api_wmiys.configureDatabaseConnection)
+ENABLED = True
+
+# flask.g attribute name
+_G_ATTRIBUTE = 'db_session'
+
+
+class Session:
+
+    #------------------------------------------------------
+    # Constructor
+    #------------------------------------------------------
+    def __init__(self):
+        self.rollback_only = False
+        self.identity_map  = IdentityMap()
+        self._pooled_connection: pool.PooledConnection = None
+        self._commit_callbacks = []
+
+    #------------------------------------------------------
+    # Check if the session has checked out a connection
+    #------------------------------------------------------
+    @property
+    def is_active(self) -> bool:
+        return self._pooled_connection is not None
+
+    #------------------------------------------------------
+    # Get the session's connection.
+    # It gets checked out and its transaction started on first use.
+    #------------------------------------------------------
+    def getConnection(self):
+        if self._pooled_connection is None:
+            pooled_connection = pool.getPool().checkout()
+
+            try:
+                pooled_connection.connection.start_transaction()
+            except Exception:
+                pooled_connection.pool.checkin(pooled_connection, discard=True)
+                raise
+
+            self._pooled_connection = pooled_connection
+
+        return self._pooled_connection.connection
+
+    #------------------------------------------------------
+    # Make sure the transaction is rolled back at the end of the request
+    #------------------------------------------------------
+    def markRollbackOnly(self):
+        self.rollback_only = True
+
+    #------------------------------------------------------
+    # Call the callback once the transaction is committed (never if it's rolled back)
+    #------------------------------------------------------
+    def addCommitCallback(self, callback):
+        self._commit_callbacks.append(callback)
+
+    #------------------------------------------------------
+    # Commit the transaction (or roll it back if it was marked rollback only).
+    # The connection stays checked out until close().
+    #------------------------------------------------------
+    def commit(self):
+        if not self.is_active:
+            return
+
+        connection = self._pooled_connection.connection
+        callbacks = self._commit_callbacks
+        self._commit_callbacks = []
+
+        if self.rollback_only:
+            connection.rollback()
+            return
+        elif connection.in_transaction:
+            connection.commit()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as ex:
+                print(ex)
+
+    #------------------------------------------------------
+    # Roll back the transaction
+    #------------------------------------------------------
+    def rollback(self):
+        if not self.is_active:
+            return
+
+        self._pooled_connection.connection.rollback()
+
+    #------------------------------------------------------
+    # Roll back anything that was not committed and return the connection to the pool
+    #------------------------------------------------------
+    def close(self):
+        if not self.is_active:
+            return
+
+        pooled_connection = self._pooled_connection
+        self._pooled_connection = None
+
+        discard = False
+
+        try:
+            if pooled_connection.connection.in_transaction:
+                pooled_connection.connection.rollback()
+        except Exception as ex:
+            print(ex)
+            discard = True
+
+        pooled_connection.pool.checkin(pooled_connection, discard=discard)
+
+
+#------------------------------------------------------
+# Get the current request's session (created on first use).
+# Returns None outside of a request or if sessions are disabled.
+#------------------------------------------------------
+def getSession() -> Session | None:
+    if not ENABLED or not flask.has_request_context():
+        return None
+
+    session = flask.g.get(_G_ATTRIBUTE)
+
+    if session is None:
+        session = Session()
+        setattr(flask.g, _G_ATTRIBUTE, session)
+
+    return session
+
+#------------------------------------------------------
+# Call the callback once the current request's work is committed.
+# Outside of a request (or before anything was written) there is nothing to wait for, so it's called right away.
+#------------------------------------------------------
+def onCommit(callback):
+    session = _getActiveSession()
+
+    if session is None:
+        callback()
+    else:
+        session.addCommitCallback(callback)
+
+#------------------------------------------------------
+# Get the current request's session if it has a connection checked out
+#------------------------------------------------------
+def _getActiveSession() -> Session | None:
+    if not flask.has_request_context():
+        return None
+
+    session: Session = flask.g.get(_G_ATTRIBUTE)
+
+    if session is None or not session.is_active:
+        return None
+
+    return session
+
+
+#------------------------------------------------------
+# after_request handler: commit the request's work, or roll it back for error responses.
+# A failed commit turns the response into an error.
+#------------------------------------------------------
+def afterRequest(response: flask.Response) -> flask.Response:
+    session = _getActiveSession()
+
+    if session is None:
+        return response
+
+    if response.status_code >= 400:
+        session.markRollbackOnly()
+
+    try:
+        session.commit()
+    except Exception as ex:
+        # imported here: api_wmiys.common imports the services, which import this package
+        from api_wmiys.common import responses
+        
+        session.markRollbackOnly()
+        return responses.internal_error(str(ex))
+
+    return response
+
+#------------------------------------------------------
+# teardown_request handler: return the request's connection to the pool
+#------------------------------------------------------
+def teardownRequest(exception: BaseException=None):
+    session = _getActiveSession()
+
+    if session is None:
+        return
+
+    session.close()
@@ -5,4 +5,30 @@ from enum import Enum
 
 class DefaultFees(Enum):
     RENTER = 8
-    LENDER = 2
\ No newline at end of file
+    LENDER = 2
+
+#-----------------------------------------------------
+# Stripe payment actions of a lender's request response (see payments.outbox)
+# ----------------------------------------------------
+class PaymentActions(str, Enum):
+    CAPTURE = 'capture'
+    CANCEL  = 'cancel'
+
+
+#-----------------------------------------------------
+# Payment action statuses (Payment_Actions.status)
+# ----------------------------------------------------
+class PaymentActionStatus(str, Enum):
+    PENDING    = 'pending'
+    PROCESSING = 'processing'
+    SUCCEEDED  = 'succeeded'
+    FAILED     = 'failed'
+
+
+#-----------------------------------------------------
+# Balance transfer statuses (Balance_Transfers.status)
+# ----------------------------------------------------
+class BalanceTransferStatus(str, Enum):
+    PENDING = 'pending'
+    SENT    = 'sent'
+    FAILED  = 'failed'
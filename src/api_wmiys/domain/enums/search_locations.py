@@ -15,4 +15,15 @@ from enum import Enum
 class PerPageLimits(Enum):
     DEFAULT = 20
     MAX     = 100
-    MIN     = 1
\ No newline at end of file
+    MIN     = 1
+
+
+#------------------------------------------------------
+# The different ways a location search can be executed
+#
+#   PROCEDURE:      the Search_Locations stored procedure (original)
+#   PREFIX_INDEX:   the in-process location name index (falls back on PROCEDURE when it finds nothing)
+#------------------------------------------------------
+class SearchLocationsEngines(str, Enum):
+    PROCEDURE    = 'procedure'
+    PREFIX_INDEX = 'prefix_index'
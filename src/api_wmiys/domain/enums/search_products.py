@@ -0,0 +1,33 @@
+"""
+**********************************************************************************************
+
+Search products enums and symbolic constants.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from enum import Enum
+
+#------------------------------------------------------
+# The different ways a product search can be executed
+#
+#   FILTER:     calls SEARCH_PRODUCTS_FILTER once for every product row (original)
+#   SET_BASED:  distance, blackout ranges and completeness are joins/predicates in a single plan
+#   SPATIAL:    SET_BASED, but the box/distance use the Locations SPATIAL INDEX and ST_Distance_Sphere
+#------------------------------------------------------
+class SearchEngines(str, Enum):
+    FILTER    = 'filter'
+    SET_BASED = 'set_based'
+    SPATIAL   = 'spatial'
+
+
+#------------------------------------------------------
+# How the total record count of a search is fetched
+#
+#   SEPARATE:   the page query + a separate COUNT(*) query (original)
+#   WINDOW:     the page query has a COUNT(*) OVER() column so it's a single execution
+#------------------------------------------------------
+class CountModes(str, Enum):
+    SEPARATE = 'separate'
+    WINDOW   = 'window'
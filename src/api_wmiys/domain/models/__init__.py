@@ -2,6 +2,7 @@ from .balance_transfer import BalanceTransfer as BalanceTransfer
 from .location import Location as Location
 from .password_reset import PasswordReset as PasswordReset
 from .payment import Payment as Payment
+from .payment_action import PaymentAction as PaymentAction
 from .payout_account import PayoutAccount as PayoutAccount
 from .product_availability import ProductAvailability as ProductAvailability
 from .product_image import ProductImage as ProductImage
@@ -10,12 +10,16 @@ from dataclasses import dataclass
 from datetime import datetime
 from uuid import UUID
 
+from api_wmiys.domain.enums.payments import BalanceTransferStatus
+
 
 @dataclass
 class BalanceTransfer:
-    id                     : UUID     = None
-    user_id                : int      = None
-    amount                 : float    = 0
-    created_on             : datetime = None
-    destination_account_id : str      = None
-    transfer_id            : str      = None
\ No newline at end of file
+    id                     : UUID                  = None
+    user_id                : int                   = None
+    amount                 : float                 = 0
+    created_on             : datetime              = None
+    destination_account_id : str                   = None
+    transfer_id            : str                   = None
+    status                 : BalanceTransferStatus = BalanceTransferStatus.PENDING
+    batch_id               : UUID                  = None
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""
+**********************************************************************************************
+A payment action is a stripe capture/cancel that still needs to happen (or already happened)
+because a lender responded to a product request.
+
+They are stored in the Payment_Actions outbox table and processed in the background by the
+payment outbox worker (see payments.outbox).
+**********************************************************************************************
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+from uuid import UUID
+
+from api_wmiys.domain.enums.payments import PaymentActions, PaymentActionStatus
+
+
+@dataclass
+class PaymentAction:
+    id                 : UUID                = None
+    product_request_id : UUID                = None
+    action             : PaymentActions      = None
+    session_id         : str                 = None
+    idempotency_key    : str                 = None
+    status             : PaymentActionStatus = PaymentActionStatus.PENDING
+    attempts           : int                 = 0
+    next_attempt_on    : datetime            = None
+    locked_until       : datetime            = None
+    payment_intent_id  : str                 = None
+    last_error         : str                 = None
+    created_on         : datetime            = None
+    updated_on         : datetime            = None
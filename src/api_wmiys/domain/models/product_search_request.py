@@ -22,6 +22,14 @@ class ProductSearchRequest:
     sorting     : sorting.Sorting       = None
     pagination  : pagination.Pagination = None
 
+    # products blocked during starts_on/ends_on according to the availability calendar
+    # None means the calendar was not available and the database checks the ranges itself
+    blocked_product_ids : list[int] = None
+
+    # (min lat, max lat, min lng, max lng) that the product's location has to be in
+    # None means there is no bounding box prefilter
+    bounding_box : tuple = None
+
 
 @dataclass
 class ProductSearchRequestCategory(ProductSearchRequest):
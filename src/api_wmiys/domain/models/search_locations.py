@@ -13,8 +13,9 @@ from api_wmiys.domain.enums.search_locations import PerPageLimits
 
 @dataclass
 class SearchLocations:
-    query    : str = None
-    per_page : int = PerPageLimits.DEFAULT.value
+    query    : str  = None
+    per_page : int  = PerPageLimits.DEFAULT.value
+    fuzzy    : bool = False
 
 
 
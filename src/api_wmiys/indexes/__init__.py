@@ -0,0 +1,4 @@
+from . import spatial as spatial
+from . import availability as availability
+from . import location_names as location_names
+from . import snapshots as snapshots
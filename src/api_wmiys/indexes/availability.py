@@ -0,0 +1,363 @@
+"""
+**********************************************************************************************
+
+Per-product "blocked days" calendar.
+
+Every product that has a blackout (Product_Availability) or a pending/accepted request
+gets a bitmap (one per source) where bit i means the day (origin + i days) is blocked. It covers a
+rolling horizon (HORIZON_DAYS) starting today, so checking if a date range conflicts with
+anything is a single AND between the product's bitmap and the range's mask.
+
+The individual ranges are kept (keyed by their source record) so a single record can be
+changed/removed and the product's bitmap rebuilt without reloading everything.
+
+Each worker process has its own calendar. The writes made in this process are applied
+as soon as they are committed (see the set/remove functions below), and the whole calendar is reloaded every
+TTL_SECONDS so the writes made by the other worker processes (and the expired requests event)
+show up as well.
+
+Queries that fall outside of the horizon return None so the caller can fall back on the database.
+The queries can be limited to some of the range sources: product search only checks the blackouts
+(like its database statements do), the listing availability check checks both.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from datetime import date, datetime
+from enum import Enum
+import threading
+import time
+
+from api_wmiys.domain.enums.product_requests import RequestStatus
+from api_wmiys.repository import availability_calendar as availability_calendar_repo
+from api_wmiys.db import session as db_session
+
+# number of days (starting today) that the bitmaps cover
+HORIZON_DAYS = 730
+
+# number of seconds before the calendar gets reloaded from the database
+TTL_SECONDS = 60
+
+# request status values that block the product
+BLOCKING_REQUEST_STATUSES = (RequestStatus.PENDING, RequestStatus.ACCEPTED)
+
+
+#------------------------------------------------------
+# Where a blocked range comes from
+#------------------------------------------------------
+class RangeSources(str, Enum):
+    BLACKOUT = 'blackout'
+    REQUEST  = 'request'
+
+
+class AvailabilityCalendar:
+
+    #------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   - origin: the date of bit 0
+    #   - horizon_days: number of days covered
+    #------------------------------------------------------
+    def __init__(self, origin: date, horizon_days: int=HORIZON_DAYS):
+        self.origin       = origin
+        self.horizon_days = horizon_days
+        self.created_at   = time.monotonic()
+
+        # (source, source id) -> (product id, first bit, last bit)
+        self._ranges: dict[tuple, tuple[int, int, int]] = {}
+
+        # product id -> set of range keys
+        self._product_ranges: dict[int, set[tuple]] = {}
+
+        # source -> product id -> bitmap (of that source's ranges only)
+        self._bitmaps: dict[RangeSources, dict[int, int]] = {source: {} for source in RangeSources}
+
+        self._lock = threading.Lock()
+
+    #------------------------------------------------------
+    # Add/replace a blocked range
+    #------------------------------------------------------
+    def setRange(self, source: RangeSources, source_id, product_id: int, starts_on: date, ends_on: date):
+        key  = (RangeSources(source), str(source_id))
+        bits = self._getBitRange(starts_on, ends_on)
+
+        with self._lock:
+            old_product_id = self._removeRange(key)
+
+            if bits is not None:
+                self._ranges[key] = (product_id, bits[0], bits[1])
+                self._product_ranges.setdefault(product_id, set()).add(key)
+                self._rebuildBitmap(product_id)
+
+            if old_product_id is not None and old_product_id != product_id:
+                self._rebuildBitmap(old_product_id)
+
+    #------------------------------------------------------
+    # Remove a blocked range (no-op if it does not exist)
+    #------------------------------------------------------
+    def removeRange(self, source: RangeSources, source_id):
+        key = (RangeSources(source), str(source_id))
+
+        with self._lock:
+            product_id = self._removeRange(key)
+
+            if product_id is not None:
+                self._rebuildBitmap(product_id)
+
+    #------------------------------------------------------
+    # Check if the product has any blocked days in the range (by the ranges of the given sources).
+    #
+    # Returns None if the range is not within the horizon.
+    #------------------------------------------------------
+    def isBlocked(self, product_id: int, starts_on: date, ends_on: date, sources: tuple=tuple(RangeSources)) -> bool | None:
+        mask = self._getMask(starts_on, ends_on)
+
+        if mask is None:
+            return None
+
+        return any(self._bitmaps[RangeSources(source)].get(product_id, 0) & mask for source in sources)
+
+    #------------------------------------------------------
+    # Get the ids of all the products that have a blocked day in the range (by the ranges of the given sources).
+    #
+    # Returns None if the range is not within the horizon.
+    #------------------------------------------------------
+    def getBlockedProductIds(self, starts_on: date, ends_on: date, sources: tuple=tuple(RangeSources)) -> list[int] | None:
+        mask = self._getMask(starts_on, ends_on)
+
+        if mask is None:
+            return None
+
+        with self._lock:
+            bitmaps = [list(self._bitmaps[RangeSources(source)].items()) for source in sources]
+
+        product_ids = set()
+
+        for source_bitmaps in bitmaps:
+            product_ids.update(product_id for product_id, bitmap in source_bitmaps if bitmap & mask)
+
+        return sorted(product_ids)
+
+    #------------------------------------------------------
+    # Check if the calendar needs to be reloaded
+    #------------------------------------------------------
+    def isStale(self, ttl_seconds: float) -> bool:
+        if self.origin != _today():
+            return True
+
+        return (time.monotonic() - self.created_at) > ttl_seconds
+
+    #------------------------------------------------------
+    # Remove the range from the maps (caller holds the lock).
+    # Returns the product id it belonged to.
+    #------------------------------------------------------
+    def _removeRange(self, key: tuple) -> int | None:
+        existing = self._ranges.pop(key, None)
+
+        if existing is None:
+            return None
+
+        product_id = existing[0]
+        self._product_ranges.get(product_id, set()).discard(key)
+
+        return product_id
+
+    #------------------------------------------------------
+    # Rebuild a product's bitmap from its ranges (caller holds the lock)
+    #------------------------------------------------------
+    def _rebuildBitmap(self, product_id: int):
+        bitmaps = {source: 0 for source in RangeSources}
+
+        for key in self._product_ranges.get(product_id, ()):
+            _, first_bit, last_bit = self._ranges[key]
+            bitmaps[key[0]] |= _bitMask(first_bit, last_bit)
+
+        for source, bitmap in bitmaps.items():
+            if bitmap:
+                self._bitmaps[source][product_id] = bitmap
+            else:
+                self._bitmaps[source].pop(product_id, None)
+
+        if not any(bitmaps.values()):
+            self._product_ranges.pop(product_id, None)
+
+    #------------------------------------------------------
+    # Get the (first, last) bits of a stored range clamped to the horizon.
+    # Returns None if no part of it is within the horizon.
+    #------------------------------------------------------
+    def _getBitRange(self, starts_on: date, ends_on: date) -> tuple[int, int] | None:
+        first_bit = max(self._getOffset(starts_on), 0)
+        last_bit  = min(self._getOffset(ends_on), self.horizon_days - 1)
+
+        if first_bit > last_bit:
+            return None
+
+        return (first_bit, last_bit)
+
+    #------------------------------------------------------
+    # Get the mask for a query range.
+    # Returns None if the range is not completely within the horizon.
+    #------------------------------------------------------
+    def _getMask(self, starts_on: date, ends_on: date) -> int | None:
+        first_bit = self._getOffset(starts_on)
+        last_bit  = self._getOffset(ends_on)
+
+        if first_bit < 0 or last_bit >= self.horizon_days:
+            return None
+        elif first_bit > last_bit:
+            return 0
+
+        return _bitMask(first_bit, last_bit)
+
+    #------------------------------------------------------
+    # Number of days between the origin and the given date
+    #------------------------------------------------------
+    def _getOffset(self, day: date) -> int:
+        if isinstance(day, datetime):
+            day = day.date()
+
+        return (day - self.origin).days
+
+
+#------------------------------------------------------
+# Bitmask with the bits first_bit through last_bit (inclusive) set
+#------------------------------------------------------
+def _bitMask(first_bit: int, last_bit: int) -> int:
+    return ((1 << (last_bit - first_bit + 1)) - 1) << first_bit
+
+#------------------------------------------------------
+# Today's date
+#------------------------------------------------------
+def _today() -> date:
+    return datetime.now().date()
+
+
+
+#------------------------------------------------------
+# Worker process calendar instance
+#------------------------------------------------------
+
+_calendar: AvailabilityCalendar = None
+_calendar_lock = threading.Lock()
+
+
+#------------------------------------------------------
+# Get the worker's calendar.
+# It gets (re)loaded from the database when it is missing or stale.
+#
+# Returns None if it could not be loaded.
+#------------------------------------------------------
+def getCalendar() -> AvailabilityCalendar | None:
+    calendar = _calendar
+
+    if calendar is None or calendar.isStale(TTL_SECONDS):
+        try:
+            calendar = load(only_if_stale=True)
+        except Exception as ex:
+            print(ex)
+            return None
+
+    return calendar
+
+#------------------------------------------------------
+# (Re)load the calendar from the database.
+#
+# With only_if_stale, the calendar is checked again once the lock is held: the threads that
+# waited for another thread's reload just get its calendar.
+#------------------------------------------------------
+def load(only_if_stale: bool=False) -> AvailabilityCalendar:
+    global _calendar
+
+    with _calendar_lock:
+        if only_if_stale and _calendar is not None and not _calendar.isStale(TTL_SECONDS):
+            return _calendar
+
+        calendar = AvailabilityCalendar(_today(), HORIZON_DAYS)
+
+        _loadRanges(calendar, RangeSources.BLACKOUT, availability_calendar_repo.selectAllBlackouts)
+        _loadRanges(calendar, RangeSources.REQUEST, availability_calendar_repo.selectAllRequests)
+
+        _calendar = calendar
+
+    return calendar
+
+#------------------------------------------------------
+# Load all the ranges returned by the repository callback into the calendar
+#------------------------------------------------------
+def _loadRanges(calendar: AvailabilityCalendar, source: RangeSources, repository_callback):
+    db_result = repository_callback()
+
+    if not db_result.successful:
+        raise db_result.error
+
+    for row in db_result.data or []:
+        calendar.setRange(source, row.get('id'), row.get('product_id'), row.get('starts_on'), row.get('ends_on'))
+
+
+#------------------------------------------------------
+# Incremental updates
+#
+# These are called after the database write succeeded, and applied once the request's
+# transaction is committed (never if it's rolled back, see db.session.onCommit).
+# They never raise: the worst case is the calendar being stale until the next reload.
+#------------------------------------------------------
+
+#------------------------------------------------------
+# A blackout was inserted or updated
+#------------------------------------------------------
+def setBlackout(product_availability_id, product_id: int, starts_on: date, ends_on: date):
+    _applyUpdate(lambda calendar: calendar.setRange(RangeSources.BLACKOUT, product_availability_id, product_id, starts_on, ends_on))
+
+#------------------------------------------------------
+# A blackout was deleted
+#------------------------------------------------------
+def removeBlackout(product_availability_id):
+    _applyUpdate(lambda calendar: calendar.removeRange(RangeSources.BLACKOUT, product_availability_id))
+
+#------------------------------------------------------
+# A request was inserted or its status changed
+#------------------------------------------------------
+def setRequest(product_request_id, product_id: int, starts_on: date, ends_on: date, status: RequestStatus):
+    if RequestStatus(status) in BLOCKING_REQUEST_STATUSES:
+        _applyUpdate(lambda calendar: calendar.setRange(RangeSources.REQUEST, product_request_id, product_id, starts_on, ends_on))
+    else:
+        _applyUpdate(lambda calendar: calendar.removeRange(RangeSources.REQUEST, product_request_id))
+
+#------------------------------------------------------
+# A request was written but its payment range is not known by the caller.
+# The range is read right away (the request's transaction can see the write).
+#------------------------------------------------------
+def refreshRequest(product_request_id):
+    try:
+        db_result = availability_calendar_repo.selectRequest(product_request_id)
+    except Exception as ex:
+        print(ex)
+        return
+
+    if not db_result.successful or not db_result.data:
+        return
+
+    row = db_result.data
+    setRequest(product_request_id, row.get('product_id'), row.get('starts_on'), row.get('ends_on'), row.get('status'))
+
+#------------------------------------------------------
+# Apply the update to the loaded calendar (if there is one) once the write is committed
+#------------------------------------------------------
+def _applyUpdate(update_callback):
+    db_session.onCommit(lambda: _applyCommittedUpdate(update_callback))
+
+#------------------------------------------------------
+# Apply the update to the loaded calendar (if there is one).
+# Holding the load lock makes sure an update is not lost to a reload that read the tables before the commit.
+#------------------------------------------------------
+def _applyCommittedUpdate(update_callback):
+    with _calendar_lock:
+        if _calendar is None:
+            return
+
+        try:
+            update_callback(_calendar)
+        except Exception as ex:
+            print(ex)
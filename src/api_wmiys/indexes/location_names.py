@@ -0,0 +1,499 @@
+"""
+**********************************************************************************************
+
+In-process index over the Locations reference data: location lookups by id, autocomplete
+(prefix) and fuzzy name searches.
+
+Every location's search text ("<city> <state_id> <state_name>", the same text Search_Locations
+matches against) is normalized the way the table's collation compares it (case and accent
+insensitive), and each of its suffixes that starts at a word is stored in a sorted array:
+
+    "saint paul mn minnesota", "paul mn minnesota", "mn minnesota", "minnesota"
+
+A query is then 2 binary searches: every key that starts with it is in a contiguous range.
+The locations are numbered in the stored procedure's result order (ranking ASC, population DESC),
+so the best matches of a range are just its smallest numbers. The top results of every 1 and 2
+character query are computed up front, since those ranges are the biggest.
+
+Unlike LIKE '%q%', a query has to start at a word ("paul" finds "Saint Paul", "aul" doesn't).
+The caller falls back on the stored procedure when the index finds nothing.
+
+Fuzzy search (typos: "chicgo", "milwakee") uses a trigram inverted index over the same words:
+each word is padded ("  chicago ") and cut into its 3 character grams, and every gram points to
+the sorted ranks of the locations that have it. A location's score is the number of the query's
+grams it shares. The rarest grams are counted first and the counting stops once
+FUZZY_MAX_POSTINGS rank entries have been looked at, so a query costs about the same no matter
+how many locations there are (the very common grams barely tell locations apart anyway).
+
+Everything is stored in flat numpy columns (strings are a utf-8 blob + offsets), so the same
+index runs either on columns built in memory from the database, or on a snapshot file written
+by `flask build-locations-snapshot` (see SNAPSHOT_PATH and indexes.snapshots). A snapshot is
+memory-mapped, so the mod_wsgi processes share a single copy and have nothing to build.
+
+The index never changes; a reload builds (or maps) a new one and swaps it in.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from datetime import datetime
+import bisect
+import os
+import threading
+import time
+import unicodedata
+import numpy as np
+
+from api_wmiys.domain.enums.search_locations import PerPageLimits
+from api_wmiys.repository import locations as locations_repo
+from . import snapshots
+
+# number of seconds before the index gets rebuilt from the database / snapshot
+TTL_SECONDS = 86400
+
+# snapshot file to map instead of building the index from the database (None: always build)
+SNAPSHOT_PATH: str = None
+
+# queries up to this many characters have their top results computed up front
+PRECOMPUTED_QUERY_LENGTH = 2
+
+# max number of posting list entries counted by a fuzzy search
+FUZZY_MAX_POSTINGS = 20000
+
+# share of the query's grams a location needs to be a fuzzy match
+FUZZY_MIN_SIMILARITY = 0.3
+
+# longest fuzzy query (characters)
+FUZZY_MAX_QUERY_LENGTH = 64
+
+# sorts after every character a normalized key can contain
+_KEY_RANGE_END = '\U0010ffff'
+
+# fields returned for each location (same as Search_Locations)
+RESULT_FIELDS = ('id', 'city', 'state_id', 'state_name', 'lat', 'lng', 'ranking', 'population', 'county_name')
+
+# fields that are stored as strings, and the ones that can be NULL
+_STRING_FIELDS   = ('city', 'state_id', 'state_name', 'county_name')
+_NULLABLE_FIELDS = ('ranking', 'population', 'county_name')
+
+
+#------------------------------------------------------
+# A column of strings: one utf-8 blob + the offset of each string in it (n + 1 offsets).
+# Supports len() and indexing, so bisect works on it directly.
+#------------------------------------------------------
+class StringColumn:
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray):
+        self._offsets = offsets
+        self._data    = data
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, i: int) -> str:
+        return self._data[self._offsets[i]:self._offsets[i + 1]].tobytes().decode()
+
+
+#------------------------------------------------------
+# Sorted string keys, each with a list of ranks (trigram postings, precomputed top results)
+#------------------------------------------------------
+class RankLists:
+
+    def __init__(self, keys: StringColumn, offsets: np.ndarray, ranks: np.ndarray):
+        self._keys    = keys
+        self._offsets = offsets
+        self._ranks   = ranks
+
+    #------------------------------------------------------
+    # Get the ranks of the key (None if it's not there)
+    #------------------------------------------------------
+    def get(self, key: str) -> np.ndarray | None:
+        i = bisect.bisect_left(self._keys, key)
+
+        if i >= len(self._keys) or self._keys[i] != key:
+            return None
+
+        return self._ranks[self._offsets[i]:self._offsets[i + 1]]
+
+
+class LocationNameIndex:
+
+    #------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   - columns: the columns created by buildColumns (in memory or from a snapshot)
+    #------------------------------------------------------
+    def __init__(self, columns: dict[str, np.ndarray]):
+        self.columns     = columns
+        self.max_results = int(columns['max_results'][0])
+        self.created_at  = time.monotonic()
+
+        # location fields, in rank order
+        self._strings = {field: _getStringColumn(columns, field) for field in _STRING_FIELDS}
+
+        # location id -> rank lookup (sorted ids + binary search)
+        self._sorted_ids = columns['sorted_ids']
+        self._id_ranks   = columns['id_ranks']
+
+        # prefix keys and the rank of the location each one belongs to
+        self._keys  = _getStringColumn(columns, 'prefix_keys')
+        self._ranks = columns['prefix_ranks']
+
+        self._precomputed = RankLists(_getStringColumn(columns, 'top_keys'), columns['top_offsets'], columns['top_ranks'])
+        self._postings    = RankLists(_getStringColumn(columns, 'trigram_keys'), columns['trigram_offsets'], columns['trigram_ranks'])
+
+    #------------------------------------------------------
+    # Number of locations in the index
+    #------------------------------------------------------
+    def __len__(self) -> int:
+        return int(self.columns['id'].size)
+
+    #------------------------------------------------------
+    # Check if the index is older than the given number of seconds
+    #------------------------------------------------------
+    def isStale(self, ttl_seconds: float) -> bool:
+        return (time.monotonic() - self.created_at) > ttl_seconds
+
+    #------------------------------------------------------
+    # Get a location's fields (all of RESULT_FIELDS by default).
+    # Returns None if the location does not exist.
+    #------------------------------------------------------
+    def getLocation(self, location_id: int, fields: tuple=RESULT_FIELDS) -> dict | None:
+        i = np.searchsorted(self._sorted_ids, location_id)
+
+        if i >= self._sorted_ids.size or self._sorted_ids[i] != location_id:
+            return None
+
+        return self._getRow(int(self._id_ranks[i]), fields)
+
+    #------------------------------------------------------
+    # Get the best locations whose words start with the query (at most limit of them).
+    # Returns a new list of new dicts.
+    #------------------------------------------------------
+    def search(self, query: str, limit: int=PerPageLimits.DEFAULT.value) -> list[dict]:
+        normalized_query = normalize(query or '')
+
+        if not normalized_query or limit <= 0:
+            return []
+
+        if len(normalized_query) <= PRECOMPUTED_QUERY_LENGTH and limit <= self.max_results:
+            ranks = self._precomputed.get(normalized_query)
+            ranks = ranks if ranks is not None else _NO_RANKS
+        else:
+            ranks = self._getRanks(normalized_query)
+
+        return [self._getRow(int(rank)) for rank in ranks[:limit]]
+
+    #------------------------------------------------------
+    # Get the locations that are the most similar to the (possibly misspelled) query.
+    # Ordered by the number of shared trigrams, then ranking/population.
+    # Returns a new list of new dicts.
+    #------------------------------------------------------
+    def searchFuzzy(self, query: str, limit: int=PerPageLimits.DEFAULT.value) -> list[dict]:
+        query_trigrams = _getTrigrams(normalize((query or '')[:FUZZY_MAX_QUERY_LENGTH]))
+
+        if not query_trigrams or limit <= 0:
+            return []
+
+        # rarest grams first, until the budget is spent
+        posting_lists = [self._postings.get(trigram) for trigram in query_trigrams]
+        posting_lists = sorted((posting_list for posting_list in posting_lists if posting_list is not None), key=len)
+        counted = []
+        num_postings = 0
+
+        for posting_list in posting_lists:
+            if counted and num_postings + posting_list.size > FUZZY_MAX_POSTINGS:
+                break
+
+            # even the rarest gram is too common: its best ranked locations are enough
+            posting_list = posting_list[:FUZZY_MAX_POSTINGS]
+
+            counted.append(posting_list)
+            num_postings += posting_list.size
+
+        if not counted:
+            return []
+
+        ranks, scores = np.unique(np.concatenate(counted), return_counts=True)
+
+        # the grams skipped because of the budget can't count against a location
+        # (the ones no location has do: they are misses for every location)
+        num_skipped = len(posting_lists) - len(counted)
+        min_score = FUZZY_MIN_SIMILARITY * len(query_trigrams) - num_skipped
+        mask = scores >= max(min_score, 1)
+        ranks, scores = ranks[mask], scores[mask]
+
+        # highest score first, then best rank (np.unique already sorted the ranks)
+        order = np.argsort(-scores, kind='stable')[:limit]
+
+        return [self._getRow(int(rank)) for rank in ranks[order]]
+
+    #------------------------------------------------------
+    # Get the ranks of all the locations that have a key starting with the query, best first
+    #------------------------------------------------------
+    def _getRanks(self, normalized_query: str) -> np.ndarray:
+        lo = bisect.bisect_left(self._keys, normalized_query)
+        hi = bisect.bisect_left(self._keys, normalized_query + _KEY_RANGE_END, lo)
+
+        # sorted + deduplicated (a location can match on more than one of its words)
+        return np.unique(self._ranks[lo:hi])
+
+    #------------------------------------------------------
+    # Get the fields of the location with the given rank (a new dict)
+    #------------------------------------------------------
+    def _getRow(self, rank: int, fields: tuple=RESULT_FIELDS) -> dict:
+        row = {}
+
+        for field in fields:
+            if field in _NULLABLE_FIELDS and self.columns[f'{field}_null'][rank]:
+                row[field] = None
+            elif field in self._strings:
+                row[field] = self._strings[field][rank]
+            else:
+                row[field] = self.columns[field][rank].item()
+
+        return row
+
+
+#------------------------------------------------------
+# Build the index columns from Locations rows (RESULT_FIELDS).
+#
+# Parms:
+#   - rows: Locations rows
+#   - max_results: number of top results kept for the precomputed queries
+#------------------------------------------------------
+def buildColumns(rows: list[dict], max_results: int=PerPageLimits.MAX.value) -> dict[str, np.ndarray]:
+    rows = sorted(rows, key=_getRankKey)
+    count = len(rows)
+
+    columns = dict(
+        max_results = np.asarray([max_results], dtype=np.int32),
+        id          = np.fromiter((row.get('id') for row in rows), dtype=np.int64, count=count),
+        lat         = np.fromiter((float(row.get('lat')) for row in rows), dtype=np.float64, count=count),
+        lng         = np.fromiter((float(row.get('lng')) for row in rows), dtype=np.float64, count=count),
+        ranking     = np.fromiter((row.get('ranking') or 0 for row in rows), dtype=np.int64, count=count),
+        population  = np.fromiter((row.get('population') or 0 for row in rows), dtype=np.int64, count=count),
+    )
+
+    for field in _NULLABLE_FIELDS:
+        columns[f'{field}_null'] = np.fromiter((row.get(field) is None for row in rows), dtype=np.bool_, count=count)
+
+    for field in _STRING_FIELDS:
+        _addStringColumn(columns, field, [row.get(field) or '' for row in rows])
+
+    # id lookup
+    id_ranks = np.argsort(columns['id'], kind='stable').astype(np.int32)
+    columns['sorted_ids'] = columns['id'][id_ranks]
+    columns['id_ranks']   = id_ranks
+
+    # prefix keys
+    entries = sorted((key, rank) for rank, row in enumerate(rows) for key in _getKeys(row))
+    keys = [key for key, _ in entries]
+    prefix_ranks = np.fromiter((rank for _, rank in entries), dtype=np.int32, count=len(entries))
+
+    _addStringColumn(columns, 'prefix_keys', keys)
+    columns['prefix_ranks'] = prefix_ranks
+
+    # top results of the short queries
+    top_ranks = {}
+
+    for query in {key[:length] for key in keys for length in range(1, PRECOMPUTED_QUERY_LENGTH + 1)}:
+        lo = bisect.bisect_left(keys, query)
+        hi = bisect.bisect_left(keys, query + _KEY_RANGE_END, lo)
+        top_ranks[query] = np.unique(prefix_ranks[lo:hi])[:max_results]
+
+    _addRankLists(columns, 'top', top_ranks)
+
+    # trigram postings
+    postings: dict[str, list[int]] = {}
+
+    for rank, row in enumerate(rows):
+        for trigram in _getTrigrams(_getSearchText(row)):
+            postings.setdefault(trigram, []).append(rank)
+
+    _addRankLists(columns, 'trigram', postings)
+
+    return columns
+
+#------------------------------------------------------
+# Add a StringColumn's offsets/data columns
+#------------------------------------------------------
+def _addStringColumn(columns: dict, name: str, strings: list[str]):
+    encoded = [value.encode() for value in strings]
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+
+    columns[f'{name}_offsets'] = offsets
+    columns[f'{name}_data']    = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+#------------------------------------------------------
+# Get a StringColumn from its offsets/data columns
+#------------------------------------------------------
+def _getStringColumn(columns: dict, name: str) -> StringColumn:
+    return StringColumn(columns[f'{name}_offsets'], columns[f'{name}_data'])
+
+#------------------------------------------------------
+# Add the columns of a RankLists (key -> ranks)
+#------------------------------------------------------
+def _addRankLists(columns: dict, name: str, rank_lists: dict):
+    keys = sorted(rank_lists)
+    lengths = [len(rank_lists[key]) for key in keys]
+
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    ranks = np.concatenate([np.asarray(rank_lists[key], dtype=np.int32) for key in keys]) if keys else np.empty(0, dtype=np.int32)
+
+    _addStringColumn(columns, f'{name}_keys', keys)
+    columns[f'{name}_offsets'] = offsets
+    columns[f'{name}_ranks']   = ranks
+
+
+#------------------------------------------------------
+# Normalize text the way the utf8_unicode_ci collation compares it:
+# accents removed, case folded, whitespace collapsed
+#------------------------------------------------------
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    without_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+    return ' '.join(without_accents.casefold().split())
+
+#------------------------------------------------------
+# Get the normalized "<city> <state_id> <state_name>" of a location
+#------------------------------------------------------
+def _getSearchText(row: dict) -> str:
+    return normalize(f"{row.get('city') or ''} {row.get('state_id') or ''} {row.get('state_name') or ''}")
+
+#------------------------------------------------------
+# Get the index keys of a location: its search text from each word on
+#------------------------------------------------------
+def _getKeys(row: dict) -> list[str]:
+    words = _getSearchText(row).split(' ')
+
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+#------------------------------------------------------
+# Get the set of trigrams of the normalized text's words ("  word " padding)
+#------------------------------------------------------
+def _getTrigrams(normalized_text: str) -> set[str]:
+    trigrams = set()
+
+    for word in normalized_text.split():
+        padded = f'  {word} '
+        trigrams.update(padded[i:i+3] for i in range(len(padded) - 2))
+
+    return trigrams
+
+#------------------------------------------------------
+# Sort key for the stored procedure's order: ranking ASC, population DESC (NULLs the way MySQL sorts them)
+#------------------------------------------------------
+def _getRankKey(row: dict) -> tuple:
+    ranking    = row.get('ranking')
+    population = row.get('population')
+
+    return (
+        ranking is not None,
+        ranking or 0,
+        population is None,
+        -(population or 0),
+    )
+
+# empty search result
+_NO_RANKS = np.empty(0, dtype=np.int32)
+
+
+
+#------------------------------------------------------
+# Worker process index instance
+#------------------------------------------------------
+
+_index: LocationNameIndex = None
+_index_lock = threading.Lock()
+
+
+#------------------------------------------------------
+# Get the worker's location name index.
+# It gets (re)built from the database when it is missing or stale
+# (a stale index is still used if the rebuild fails).
+#
+# Returns None if it could not be loaded.
+#------------------------------------------------------
+def getIndex() -> LocationNameIndex | None:
+    index = _index
+
+    if index is not None and not index.isStale(TTL_SECONDS):
+        return index
+
+    # another thread is already rebuilding it: keep using the stale one meanwhile
+    if index is not None and _index_lock.locked():
+        return index
+
+    try:
+        index = load(only_if_stale=True)
+    except Exception as ex:
+        print(ex)
+
+    return index
+
+#------------------------------------------------------
+# (Re)load the index: map the snapshot file if there is one, otherwise build it from the database.
+#
+# With only_if_stale, the index is checked again once the lock is held: the threads that
+# waited for another thread's rebuild just get its index.
+#------------------------------------------------------
+def load(only_if_stale: bool=False) -> LocationNameIndex:
+    global _index
+
+    with _index_lock:
+        if only_if_stale and _index is not None and not _index.isStale(TTL_SECONDS):
+            return _index
+
+        snapshot = openSnapshot()
+        columns = snapshot.columns if snapshot else _buildColumnsFromDatabase()
+
+        _index = LocationNameIndex(columns)
+
+    return _index
+
+#------------------------------------------------------
+# Map the snapshot file (None if no snapshot is configured or it was not built yet)
+#------------------------------------------------------
+def openSnapshot() -> snapshots.Snapshot | None:
+    if not SNAPSHOT_PATH or not os.path.exists(SNAPSHOT_PATH):
+        return None
+
+    return snapshots.load(SNAPSHOT_PATH)
+
+#------------------------------------------------------
+# Write the snapshot file the worker processes map (flask build-locations-snapshot).
+# Returns the number of locations written.
+#------------------------------------------------------
+def writeSnapshot(path: str=None) -> int:
+    path = path or SNAPSHOT_PATH
+
+    if not path:
+        raise ValueError('No snapshot path (LOCATIONS_SNAPSHOT_PATH) is configured')
+
+    columns = _buildColumnsFromDatabase()
+    num_locations = int(columns['id'].size)
+
+    snapshots.write(path, columns, metadata=dict(
+        created_on    = datetime.now().isoformat(),
+        num_locations = num_locations,
+    ))
+
+    return num_locations
+
+#------------------------------------------------------
+# Build the index columns from the Locations table
+#------------------------------------------------------
+def _buildColumnsFromDatabase() -> dict[str, np.ndarray]:
+    db_result = locations_repo.selectAllSearchFields()
+
+    if not db_result.successful:
+        raise db_result.error
+
+    return buildColumns(db_result.data or [])
@@ -0,0 +1,143 @@
+"""
+**********************************************************************************************
+
+Read-only columnar snapshot files.
+
+A snapshot is a set of named numpy columns written into one binary file:
+
+    magic (8 bytes) | format version (uint32) | header length (uint32) | header (json) | columns
+
+The header has each column's dtype, length and offset (from the start of the column data).
+Every column starts on a 64 byte boundary, so it can be used in place.
+
+Opening a snapshot memory-maps the file read-only and the columns are numpy views of the
+mapping: nothing is copied or parsed. All the worker processes that open the same file share
+its pages through the OS page cache.
+
+Snapshots are written to a temp file that then replaces the old one, so a process that still
+has the old file mapped keeps reading the old (unchanged) data until it opens the new one.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+MAGIC = b'WMIYSSNP'
+FORMAT_VERSION = 1
+
+# byte boundary that every column starts on
+ALIGNMENT = 64
+
+# magic + format version + header length
+_PREFIX = struct.Struct('<8sII')
+
+
+#------------------------------------------------------
+# Raised when a file is not a snapshot this code can read
+#------------------------------------------------------
+class SnapshotFormatError(Exception):
+    pass
+
+
+class Snapshot:
+
+    #------------------------------------------------------
+    # Constructor: memory-map the snapshot file
+    #------------------------------------------------------
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < _PREFIX.size:
+            raise SnapshotFormatError(f'{path} is not a snapshot file')
+
+        magic, version, header_length = _PREFIX.unpack_from(self._mmap, 0)
+
+        if magic != MAGIC:
+            raise SnapshotFormatError(f'{path} is not a snapshot file')
+        elif version != FORMAT_VERSION:
+            raise SnapshotFormatError(f'{path} has format version {version}, expected {FORMAT_VERSION}')
+
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_length])
+        data_start = _align(_PREFIX.size + header_length)
+
+        self.metadata: dict = header.get('metadata') or {}
+        self.columns: dict[str, np.ndarray] = {}
+
+        for name, column in header['columns'].items():
+            self.columns[name] = np.frombuffer(
+                self._mmap,
+                dtype  = np.dtype(column['dtype']),
+                count  = column['count'],
+                offset = data_start + column['offset'],
+            )
+
+    #------------------------------------------------------
+    # Total size of the file (bytes)
+    #------------------------------------------------------
+    @property
+    def size(self) -> int:
+        return len(self._mmap)
+
+
+#------------------------------------------------------
+# Open (memory-map) a snapshot file
+#------------------------------------------------------
+def load(path: str) -> Snapshot:
+    return Snapshot(path)
+
+#------------------------------------------------------
+# Write the columns (1 dimensional numpy arrays) into a snapshot file.
+# The file is replaced atomically.
+#------------------------------------------------------
+def write(path: str, columns: dict[str, np.ndarray], metadata: dict=None):
+    header_columns = {}
+    offset = 0
+
+    for name, values in columns.items():
+        values = np.ascontiguousarray(values)
+
+        if values.ndim != 1:
+            raise ValueError(f'Snapshot column {name} is not 1 dimensional')
+
+        header_columns[name] = dict(dtype=values.dtype.str, count=int(values.size), offset=offset)
+        offset = _align(offset + values.nbytes)
+
+    header = json.dumps(dict(columns=header_columns, metadata=metadata or {})).encode()
+    data_start = _align(_PREFIX.size + len(header))
+
+    temp_path = f'{path}.tmp-{os.getpid()}'
+
+    try:
+        with open(temp_path, 'wb') as snapshot_file:
+            snapshot_file.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+            snapshot_file.write(header)
+
+            for name, values in columns.items():
+                snapshot_file.seek(data_start + header_columns[name]['offset'])
+                snapshot_file.write(np.ascontiguousarray(values).tobytes())
+
+            # the (empty) last columns still have to be inside the file
+            snapshot_file.truncate(data_start + offset)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+
+        os.replace(temp_path, path)
+
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+#------------------------------------------------------
+# Round up to the next column boundary
+#------------------------------------------------------
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
@@ -0,0 +1,300 @@
+"""
+**********************************************************************************************
+
+In-process geospatial index over the Locations table.
+
+Every location's (id, lat, lng) is held in a handful of numpy arrays:
+    - rows are sorted by latitude so a radius query only looks at the latitude band
+      that can possibly be within range (2 binary searches)
+    - each row is also stored as a point on the unit sphere (x, y, z) so the
+      distance for the whole band is computed in one vectorized haversine pass
+
+The index is built once per worker process (see api_wmiys.configureIndexes), from the
+locations snapshot file when there is one (see location_names.SNAPSHOT_PATH), and
+then answers "which location ids are within N miles of X" without a database round trip.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+import math
+import threading
+import numpy as np
+
+from api_wmiys.repository import locations as locations_repo
+from . import location_names
+
+# same earth radius the sql functions use (Miles_Between, Get_Locations_In_Range)
+EARTH_RADIUS_MILES = 3959
+
+
+class SpatialIndex:
+
+    #------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   - ids:  location ids
+    #   - lats: latitudes (degrees)
+    #   - lngs: longitudes (degrees)
+    #------------------------------------------------------
+    def __init__(self, ids, lats, lngs):
+        ids  = np.asarray(ids, dtype=np.int64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+
+        # keep the rows sorted by latitude
+        order = np.argsort(lats, kind='stable')
+
+        self._ids  = ids[order]
+        self._lats = lats[order]
+        self._lngs = lngs[order]
+        self._xyz  = _toUnitSphere(self._lats, self._lngs)
+
+        # location id -> row position lookup (sorted ids + binary search)
+        self._id_order = np.argsort(self._ids, kind='stable')
+        self._sorted_ids = self._ids[self._id_order]
+
+    #------------------------------------------------------
+    # Number of locations in the index
+    #------------------------------------------------------
+    def __len__(self) -> int:
+        return int(self._ids.size)
+
+    #------------------------------------------------------
+    # Check if the given location id is in the index
+    #------------------------------------------------------
+    def __contains__(self, location_id: int) -> bool:
+        return self._getPosition(location_id) is not None
+
+    #------------------------------------------------------
+    # Get the (lat, lng) of the given location.
+    # Returns None if the location does not exist.
+    #------------------------------------------------------
+    def getCoordinates(self, location_id: int) -> tuple[float, float] | None:
+        position = self._getPosition(location_id)
+
+        if position is None:
+            return None
+
+        return (float(self._lats[position]), float(self._lngs[position]))
+
+    #------------------------------------------------------
+    # Get the distance (miles) between 2 locations.
+    # Returns None if either location does not exist.
+    #------------------------------------------------------
+    def milesBetween(self, location_id_a: int, location_id_b: int) -> float | None:
+        position_a = self._getPosition(location_id_a)
+        position_b = self._getPosition(location_id_b)
+
+        if position_a is None or position_b is None:
+            return None
+
+        chord = np.linalg.norm(self._xyz[position_a] - self._xyz[position_b])
+
+        return float(_chordToMiles(chord))
+
+    #------------------------------------------------------
+    # Get the distance (miles) between a location and each of the other locations.
+    #
+    # Returns a numpy array the same length as other_location_ids (nan for the unknown ids).
+    # Returns None if the location does not exist.
+    #------------------------------------------------------
+    def milesFromLocation(self, location_id: int, other_location_ids) -> np.ndarray | None:
+        position = self._getPosition(location_id)
+
+        if position is None:
+            return None
+
+        other_ids = np.asarray(other_location_ids, dtype=np.int64)
+        positions, found = self._getPositions(other_ids)
+
+        chords = np.linalg.norm(self._xyz[positions] - self._xyz[position], axis=1)
+        distances = _chordToMiles(chords)
+        distances[~found] = np.nan
+
+        return distances
+
+    #------------------------------------------------------
+    # Get all the locations that are within the given number of miles of the coordinates.
+    #
+    # Returns a tuple of 2 numpy arrays: (location ids, distances in miles)
+    #------------------------------------------------------
+    def withinMiles(self, lat: float, lng: float, miles: float) -> tuple[np.ndarray, np.ndarray]:
+        if miles < 0:
+            return _emptyResult()
+
+        # narrow down the rows to the latitude band that can be within range
+        lat_delta = np.degrees(miles / EARTH_RADIUS_MILES)
+        lo = np.searchsorted(self._lats, lat - lat_delta, side='left')
+        hi = np.searchsorted(self._lats, lat + lat_delta, side='right')
+
+        if lo >= hi:
+            return _emptyResult()
+
+        # vectorized haversine for the band (via the chord length on the unit sphere)
+        origin = _toUnitSphere(np.asarray([lat]), np.asarray([lng]))[0]
+        chords = np.linalg.norm(self._xyz[lo:hi] - origin, axis=1)
+        distances = _chordToMiles(chords)
+
+        mask = distances <= miles
+
+        return (self._ids[lo:hi][mask], distances[mask])
+
+    #------------------------------------------------------
+    # Get all the locations that are within the given number of miles of a location.
+    # The location itself is not included in the result.
+    #
+    # Returns None if the location does not exist.
+    #------------------------------------------------------
+    def withinMilesOfLocation(self, location_id: int, miles: float) -> tuple[np.ndarray, np.ndarray] | None:
+        coordinates = self.getCoordinates(location_id)
+
+        if coordinates is None:
+            return None
+
+        ids, distances = self.withinMiles(coordinates[0], coordinates[1], miles)
+        mask = ids != location_id
+
+        return (ids[mask], distances[mask])
+
+    #------------------------------------------------------
+    # Get the row position of the given location id
+    #------------------------------------------------------
+    def _getPosition(self, location_id: int) -> int | None:
+        i = np.searchsorted(self._sorted_ids, location_id)
+
+        if i >= self._sorted_ids.size or self._sorted_ids[i] != location_id:
+            return None
+
+        return int(self._id_order[i])
+
+    #------------------------------------------------------
+    # Vectorized _getPosition.
+    #
+    # Returns a tuple of 2 numpy arrays: (row positions, whether the id was found)
+    # The position of an id that was not found is 0.
+    #------------------------------------------------------
+    def _getPositions(self, location_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        if self._sorted_ids.size == 0:
+            return (np.zeros(location_ids.size, dtype=np.int64), np.zeros(location_ids.size, dtype=bool))
+
+        i = np.searchsorted(self._sorted_ids, location_ids)
+        i = np.minimum(i, self._sorted_ids.size - 1)
+        found = self._sorted_ids[i] == location_ids
+
+        positions = np.where(found, self._id_order[i], 0)
+
+        return (positions, found)
+
+
+#------------------------------------------------------
+# Convert the lat/lng (degrees) arrays into an (n, 3) array of unit sphere points
+#------------------------------------------------------
+def _toUnitSphere(lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    lat_radians = np.radians(lats)
+    lng_radians = np.radians(lngs)
+    cos_lat = np.cos(lat_radians)
+
+    return np.column_stack((
+        cos_lat * np.cos(lng_radians),
+        cos_lat * np.sin(lng_radians),
+        np.sin(lat_radians),
+    ))
+
+#------------------------------------------------------
+# Convert a chord length on the unit sphere into the great circle distance in miles.
+# This is the haversine formula: 2 * asin(chord / 2) is the central angle.
+#------------------------------------------------------
+def _chordToMiles(chords):
+    half_chords = np.minimum(np.asarray(chords) / 2, 1.0)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(half_chords)
+
+#------------------------------------------------------
+# Get the lat/lng box that contains every point within the given miles of the coordinates.
+#
+# The longitude half width is the exact asin(sin(d) / cos(lat)), so nothing in range is left out.
+# If the circle reaches a pole or crosses the antimeridian, the box covers all the longitudes.
+#
+# Returns a tuple: (min lat, max lat, min lng, max lng)
+#------------------------------------------------------
+def getBoundingBox(lat: float, lng: float, miles: float) -> tuple[float, float, float, float]:
+    angle     = miles / EARTH_RADIUS_MILES
+    lat_delta = math.degrees(angle)
+    lat_min   = max(lat - lat_delta, -90.0)
+    lat_max   = min(lat + lat_delta, 90.0)
+
+    cos_lat = math.cos(math.radians(lat))
+
+    if lat_min <= -90.0 or lat_max >= 90.0 or math.sin(angle) >= cos_lat:
+        return (lat_min, lat_max, -180.0, 180.0)
+    
+    lng_delta = math.degrees(math.asin(math.sin(angle) / cos_lat))
+
+    if lng - lng_delta < -180.0 or lng + lng_delta > 180.0:
+        return (lat_min, lat_max, -180.0, 180.0)
+
+    return (lat_min, lat_max, lng - lng_delta, lng + lng_delta)
+
+#------------------------------------------------------
+# Empty withinMiles result
+#------------------------------------------------------
+def _emptyResult() -> tuple[np.ndarray, np.ndarray]:
+    return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+
+
+#------------------------------------------------------
+# Worker process index instance
+#------------------------------------------------------
+
+_index: SpatialIndex = None
+_index_lock = threading.Lock()
+
+
+#------------------------------------------------------
+# Get the worker's spatial index.
+# It gets loaded from the database on first use.
+#------------------------------------------------------
+def getIndex() -> SpatialIndex:
+    if _index is None:
+        load()
+
+    return _index
+
+#------------------------------------------------------
+# (Re)load the spatial index from the locations snapshot file, or the database if there is none
+#------------------------------------------------------
+def load() -> SpatialIndex:
+    global _index
+
+    with _index_lock:
+        snapshot = location_names.openSnapshot()
+
+        if snapshot:
+            _index = SpatialIndex(
+                ids  = snapshot.columns['id'],
+                lats = snapshot.columns['lat'],
+                lngs = snapshot.columns['lng'],
+            )
+        else:
+            _index = _buildFromDatabase()
+
+    return _index
+
+#------------------------------------------------------
+# Build the spatial index from the Locations table
+#------------------------------------------------------
+def _buildFromDatabase() -> SpatialIndex:
+    db_result = locations_repo.selectAllCoordinates()
+
+    if not db_result.successful:
+        raise db_result.error
+
+    rows = db_result.data or []
+
+    return SpatialIndex(
+        ids  = [row.get('id') for row in rows],
+        lats = [row.get('lat') for row in rows],
+        lngs = [row.get('lng') for row in rows],
+    )
@@ -1,5 +1,8 @@
 
 from .routines import cancelPayment
 from .routines import capturePayment
+from .routines import configureHttpClient
 from .routines import createNewStripeAccount
+from .routines import findBalanceTransfer
+from .routines import isRetryableError
 from .routines import sendBalanceTransfer
\ No newline at end of file
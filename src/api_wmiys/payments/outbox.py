@@ -0,0 +1,278 @@
+"""
+**********************************************************************************************
+
+Payment outbox.
+
+Capturing/canceling a request's payment takes 2 stripe calls, so they are not made while the
+lender's response is being handled. Instead:
+
+    1. enqueue() inserts a Payment_Actions row in the same transaction as the request's new status
+    2. once that transaction is committed, the process's worker thread is woken up
+    3. the worker claims the due actions (FOR UPDATE SKIP LOCKED, so the workers of the other
+       processes never get the same ones), calls stripe, and records the result
+
+Failed calls are retried with an exponential backoff (+ jitter) until MAX_ATTEMPTS. Every
+action has its own idempotency key that is sent with each attempt, so stripe never applies an
+action twice, even if a worker dies after the call and the action gets claimed again.
+
+The worker takes the payment client as a parm (anything with capturePayment, cancelPayment and
+isRetryableError, see payments.routines) so it can run against a stubbed stripe.
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from uuid import UUID
+import os
+import random
+import threading
+import uuid
+
+from wmiys_common import utilities
+from api_wmiys.domain import models
+from api_wmiys.domain.enums.payments import PaymentActions
+from api_wmiys.repository import payment_actions as payment_actions_repo
+from pymysql.structs import DbOperationResult
+from api_wmiys.db import session as db_session
+from . import routines
+
+# worker options (set by api_wmiys.configurePaymentOutbox)
+WORKER_ENABLED        = True
+POLL_SECONDS          = 30
+BATCH_SIZE            = 10
+MAX_ATTEMPTS          = 8
+LEASE_SECONDS         = 120
+BACKOFF_BASE_SECONDS  = 5
+BACKOFF_MAX_SECONDS   = 3600
+
+
+#------------------------------------------------------
+# Queue up the capture/cancel of a product request's payment.
+# It's processed once the current request's transaction is committed.
+#------------------------------------------------------
+def enqueue(product_request_id: UUID, session_id: str, action: PaymentActions) -> DbOperationResult:
+    payment_action = models.PaymentAction(
+        id                 = utilities.getUUID(False),
+        product_request_id = product_request_id,
+        action             = action,
+        session_id         = session_id,
+        idempotency_key    = uuid.uuid4().hex,
+    )
+
+    db_result = payment_actions_repo.insert(payment_action)
+
+    if db_result.successful:
+        db_session.onCommit(wake)
+
+    return db_result
+
+
+class PaymentOutboxWorker(threading.Thread):
+
+    #------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   - payment_client: makes the stripe calls (capturePayment, cancelPayment, isRetryableError)
+    #   - poll_seconds: how often the outbox is checked when nobody wakes the worker up
+    #   - batch_size: max number of actions claimed at once
+    #   - max_attempts: number of attempts before an action is marked as failed
+    #   - lease_seconds: how long the claimed actions are locked for
+    #------------------------------------------------------
+    def __init__(self, payment_client=routines, poll_seconds: float=None, batch_size: int=None, max_attempts: int=None, lease_seconds: int=None):
+        super().__init__(name='payment-outbox', daemon=True)
+
+        self.payment_client = payment_client
+        self.poll_seconds   = poll_seconds  if poll_seconds  is not None else POLL_SECONDS
+        self.batch_size     = batch_size    if batch_size    is not None else BATCH_SIZE
+        self.max_attempts   = max_attempts  if max_attempts  is not None else MAX_ATTEMPTS
+        self.lease_seconds  = lease_seconds if lease_seconds is not None else LEASE_SECONDS
+        self.pid            = os.getpid()
+
+        # metrics
+        self.succeeded = 0
+        self.retried   = 0
+        self.failed    = 0
+
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    #------------------------------------------------------
+    # Thread main loop
+    #------------------------------------------------------
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                num_processed = self.processDue()
+            except Exception as ex:
+                print(ex)
+                num_processed = 0
+
+            # a full batch means there might be more waiting
+            if num_processed >= self.batch_size:
+                continue
+
+            self._wake_event.wait(self.poll_seconds)
+            self._wake_event.clear()
+
+    #------------------------------------------------------
+    # Process the next batch of due actions.
+    # Returns the number of actions that were processed.
+    #------------------------------------------------------
+    def processDue(self) -> int:
+        db_result = payment_actions_repo.claimDue(self.batch_size, self.lease_seconds)
+
+        if not db_result.successful:
+            raise db_result.error
+
+        for payment_action in db_result.data:
+            self.processAction(payment_action)
+
+        return len(db_result.data)
+
+    #------------------------------------------------------
+    # Call stripe for the claimed action and record the result
+    #------------------------------------------------------
+    def processAction(self, payment_action: models.PaymentAction):
+        if payment_action.action == PaymentActions.CAPTURE:
+            payment_method = self.payment_client.capturePayment
+        else:
+            payment_method = self.payment_client.cancelPayment
+
+        try:
+            intent = payment_method(payment_action.session_id, idempotency_key=payment_action.idempotency_key)
+        except Exception as ex:
+            self._recordError(payment_action, ex)
+            return
+
+        db_result = payment_actions_repo.markSucceeded(payment_action, getattr(intent, 'id', None))
+
+        # stripe already applied it - the lease expires and the retry is a no-op thanks to the idempotency key
+        if not db_result.successful:
+            print(db_result.error)
+            return
+
+        self.succeeded += 1
+
+    #------------------------------------------------------
+    # Wake the worker up (new actions were committed)
+    #------------------------------------------------------
+    def wake(self):
+        self._wake_event.set()
+
+    #------------------------------------------------------
+    # Stop the worker after the current batch
+    #------------------------------------------------------
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    #------------------------------------------------------
+    # Get the worker metrics
+    #------------------------------------------------------
+    def getStats(self) -> dict:
+        return dict(
+            pid       = self.pid,
+            alive     = self.is_alive(),
+            succeeded = self.succeeded,
+            retried   = self.retried,
+            failed    = self.failed,
+        )
+
+    #------------------------------------------------------
+    # Retry the action later, or give up on it
+    #------------------------------------------------------
+    def _recordError(self, payment_action: models.PaymentAction, error: Exception):
+        give_up = payment_action.attempts >= self.max_attempts or not self.payment_client.isRetryableError(error)
+
+        if give_up:
+            db_result = payment_actions_repo.markFailed(payment_action, str(error))
+            self.failed += 1
+        else:
+            db_result = payment_actions_repo.markRetry(payment_action, getBackoffSeconds(payment_action.attempts), str(error))
+            self.retried += 1
+
+        if not db_result.successful:
+            print(db_result.error)
+
+
+#------------------------------------------------------
+# Number of seconds to wait before the next attempt:
+# BACKOFF_BASE_SECONDS doubled for every attempt (capped at BACKOFF_MAX_SECONDS), half of it randomized
+#------------------------------------------------------
+def getBackoffSeconds(attempts: int) -> int:
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    return int(delay / 2 + random.uniform(0, delay / 2))
+
+
+
+#------------------------------------------------------
+# Process's worker instance
+#------------------------------------------------------
+
+_worker: PaymentOutboxWorker = None
+_worker_lock = threading.Lock()
+
+
+#------------------------------------------------------
+# Start the current process's worker (if it's not already running).
+# Threads don't survive a fork, so a new one is started when the process id changes.
+#------------------------------------------------------
+def start() -> PaymentOutboxWorker | None:
+    global _worker
+
+    if not WORKER_ENABLED:
+        return None
+
+    worker = getWorker()
+
+    if worker is not None and worker.is_alive():
+        return worker
+
+    with _worker_lock:
+        if _worker is None or _worker.pid != os.getpid() or not _worker.is_alive():
+            _worker = PaymentOutboxWorker()
+            _worker.start()
+
+    return _worker
+
+#------------------------------------------------------
+# Start the current process's worker with its first request (flask before_request hook).
+# Only processes that serve requests run a worker: a cli command or script that builds the app
+# could exit in the middle of a batch and leave its actions leased for LEASE_SECONDS.
+#------------------------------------------------------
+def beforeRequest():
+    start()
+
+#------------------------------------------------------
+# Wake the current process's worker up (started if needed)
+#------------------------------------------------------
+def wake():
+    worker = start()
+
+    if worker is not None:
+        worker.wake()
+
+#------------------------------------------------------
+# Get the current process's worker (None if it was never started in this process)
+#------------------------------------------------------
+def getWorker() -> PaymentOutboxWorker | None:
+    worker = _worker
+
+    if worker is None or worker.pid != os.getpid():
+        return None
+
+    return worker
+
+#------------------------------------------------------
+# Stop the current process's worker
+#------------------------------------------------------
+def stop():
+    global _worker
+
+    with _worker_lock:
+        worker  = _worker
+        _worker = None
+
+    if worker is not None and worker.pid == os.getpid():
+        worker.stop()
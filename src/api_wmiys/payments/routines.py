@@ -1,61 +1,106 @@
+import requests
 import stripe
 from wmiys_common import keys
 from wmiys_common import utilities
 from api_wmiys.common.base_return import BaseReturn
+from api_wmiys.common import metrics
 
 from api_wmiys.domain import models
 
 stripe.api_key = keys.payments.test
 
+# stripe http client options (set by api_wmiys.configurePayments)
+CONNECT_TIMEOUT_SECONDS = 5
+READ_TIMEOUT_SECONDS    = 20
+MAX_NETWORK_RETRIES     = 1
+MAX_CONNECTIONS         = 10
+
+
+#-----------------------------------------------------
+# Give stripe an http client that keeps its connections alive and times out.
+#
+# All the stripe calls share one requests.Session, so the TLS connections to the stripe api
+# are reused (up to MAX_CONNECTIONS of them) instead of set up for every call. Every call
+# gives up after CONNECT_TIMEOUT_SECONDS to connect / READ_TIMEOUT_SECONDS between bytes,
+# and is retried up to MAX_NETWORK_RETRIES times on network errors (stripe adds idempotency keys).
+# ----------------------------------------------------
+def configureHttpClient():
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+
+    stripe.default_http_client = stripe.http_client.RequestsClient(
+        timeout = (CONNECT_TIMEOUT_SECONDS, READ_TIMEOUT_SECONDS),
+        session = session,
+    )
+
+    stripe.max_network_retries = MAX_NETWORK_RETRIES
+
+
 #-----------------------------------------------------
 # Capture a stripe payment intent
 #
 # Parms:
 #   product_request_session_id: the session_id that belongs to the product request
+#   idempotency_key: stripe applies retries with the same key only once
 #
 # Returns a stripe Payment intent
 # ----------------------------------------------------
-def capturePayment(product_request_session_id) -> stripe.PaymentIntent:
-    return _handlePayment(product_request_session_id, True)
+def capturePayment(product_request_session_id, idempotency_key: str=None) -> stripe.PaymentIntent:
+    return _handlePayment(product_request_session_id, True, idempotency_key)
 
 #-----------------------------------------------------
 # Cancel a stripe payment intent
 #
 # Parms:
 #   product_request_session_id: the session_id that belongs to the product request
+#   idempotency_key: stripe applies retries with the same key only once
 #
 # Returns a stripe Payment intent
 # ----------------------------------------------------
-def cancelPayment(product_request_session_id) -> stripe.PaymentIntent:
-    return _handlePayment(product_request_session_id, False)
+def cancelPayment(product_request_session_id, idempotency_key: str=None) -> stripe.PaymentIntent:
+    return _handlePayment(product_request_session_id, False, idempotency_key)
 
 #-----------------------------------------------------
 # Internal function for either capturing or canceling a payment intent
 # ----------------------------------------------------
-def _handlePayment(product_request_session_id, capture: bool):
-    session = stripe.checkout.Session.retrieve(product_request_session_id)
+def _handlePayment(product_request_session_id, capture: bool, idempotency_key: str=None):
+    with metrics.timed('stripe.session_retrieve'):
+        session = stripe.checkout.Session.retrieve(product_request_session_id)
     
     if capture:
-        intent = stripe.PaymentIntent.capture(session.payment_intent)
+        with metrics.timed('stripe.payment_intent_capture'):
+            intent = stripe.PaymentIntent.capture(session.payment_intent, idempotency_key=idempotency_key)
     else:
-        intent = stripe.PaymentIntent.cancel(session.payment_intent)
+        with metrics.timed('stripe.payment_intent_cancel'):
+            intent = stripe.PaymentIntent.cancel(session.payment_intent, idempotency_key=idempotency_key)
 
     return intent
 
+#-----------------------------------------------------
+# Check if a failed payment call is worth retrying.
+# Invalid requests (already captured, unknown session, ...) and card errors will fail again.
+# ----------------------------------------------------
+def isRetryableError(error: Exception) -> bool:
+    return not isinstance(error, (stripe.error.InvalidRequestError, stripe.error.CardError))
+
 
 #------------------------------------------------------
 # Create a new stripe account
 #------------------------------------------------------
 def createNewStripeAccount(user_id: int) -> stripe.Account:
-    return stripe.Account.create(
-        type     = 'express',
-        metadata = dict(user_id=user_id)
-    )
+    with metrics.timed('stripe.account_create'):
+        return stripe.Account.create(
+            type     = 'express',
+            metadata = dict(user_id=user_id)
+        )
 
 
 
 #------------------------------------------------------
-# Tell stripe to send a lender their current balance
+# Tell stripe to send a lender their current balance.
+# The transfer's id is the idempotency key, so resending a transfer never pays it twice.
 # 
 # Returns a BaseReturn:
 #   - the data value is set to the resulting stripe.Transfer object
@@ -64,12 +109,14 @@ def sendBalanceTransfer(balance_transfer: models.BalanceTransfer) -> BaseReturn:
     result = BaseReturn(successful=True)
 
     try:
-        stripe_transfer: stripe.Transfer = stripe.Transfer.create(
-            amount      = utilities.dollarsToCents(balance_transfer.amount),
-            currency    = "usd",
-            destination = balance_transfer.destination_account_id,
-            metadata    = dict(balance_transfer_id=str(balance_transfer.id))
-        )
+        with metrics.timed('stripe.transfer_create'):
+            stripe_transfer: stripe.Transfer = stripe.Transfer.create(
+                amount          = utilities.dollarsToCents(balance_transfer.amount),
+                currency        = "usd",
+                destination     = balance_transfer.destination_account_id,
+                metadata        = dict(balance_transfer_id=str(balance_transfer.id)),
+                idempotency_key = str(balance_transfer.id),
+            )
 
         result.data = stripe_transfer
     
@@ -81,3 +128,37 @@ def sendBalanceTransfer(balance_transfer: models.BalanceTransfer) -> BaseReturn:
     return result
 
 
+
+
+#------------------------------------------------------
+# Look up the stripe transfer that was created for a balance transfer (if any).
+#
+# Used for transfers that stayed pending for longer than stripe remembers idempotency keys:
+# resending those could pay them twice. Stripe can't search transfers by metadata, so the
+# destination account's transfers since the balance transfer was created are checked instead.
+#
+# Returns a BaseReturn:
+#   - the data value is set to the stripe.Transfer object, or None if stripe never created one
+#------------------------------------------------------
+def findBalanceTransfer(balance_transfer: models.BalanceTransfer) -> BaseReturn:
+    result = BaseReturn(successful=True)
+
+    # leave some room for clock differences between the database and stripe
+    created_after = int(balance_transfer.created_on.timestamp()) - 3600
+
+    try:
+        with metrics.timed('stripe.transfer_list'):
+            stripe_transfers = stripe.Transfer.list(
+                destination = balance_transfer.destination_account_id,
+                created     = dict(gte=created_after),
+                limit       = 100,
+            )
+
+            result.data = next((t for t in stripe_transfers.auto_paging_iter() if t.metadata.get('balance_transfer_id') == str(balance_transfer.id)), None)
+
+    except Exception as e:
+        result.successful = False
+        result.error      = e
+        result.data       = None
+
+    return result
@@ -0,0 +1,91 @@
+"""
+**********************************************************************************************
+
+Availability calendar sql commands.
+
+These are the date ranges that block a product from being rented:
+    - Product_Availability records (lender blackouts)
+    - Product requests that are either pending or accepted (the payment's range)
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from uuid import UUID
+from api_wmiys.db import commands as sql_engine
+from pymysql.structs import DbOperationResult
+
+
+#------------------------------------------------------
+# All the blackout ranges that have not ended yet
+#------------------------------------------------------
+SQL_SELECT_ALL_BLACKOUTS = '''
+    SELECT
+        pa.id,
+        pa.product_id,
+        pa.starts_on,
+        pa.ends_on
+    FROM
+        Product_Availability pa
+    WHERE
+        pa.ends_on >= CURDATE();
+'''
+
+#------------------------------------------------------
+# All the pending/accepted request ranges that have not ended yet
+#------------------------------------------------------
+SQL_SELECT_ALL_REQUESTS = '''
+    SELECT
+        pr.id,
+        pay.product_id,
+        pay.starts_on,
+        pay.ends_on
+    FROM
+        Product_Requests pr
+        INNER JOIN Payments pay ON pay.id = pr.payment_id
+    WHERE
+        pr.status IN ('pending', 'accepted')
+        AND pay.ends_on >= CURDATE();
+'''
+
+#------------------------------------------------------
+# A single request's range and status
+#
+# Parms:
+#   - product request id
+#------------------------------------------------------
+SQL_SELECT_REQUEST = '''
+    SELECT
+        pr.id,
+        pr.status,
+        pay.product_id,
+        pay.starts_on,
+        pay.ends_on
+    FROM
+        Product_Requests pr
+        INNER JOIN Payments pay ON pay.id = pr.payment_id
+    WHERE
+        pr.id = %s
+    LIMIT
+        1;
+'''
+
+
+#------------------------------------------------------
+# Select all the blackout ranges that have not ended yet
+#------------------------------------------------------
+def selectAllBlackouts() -> DbOperationResult:
+    return sql_engine.selectAll(SQL_SELECT_ALL_BLACKOUTS)
+
+#------------------------------------------------------
+# Select all the pending/accepted request ranges that have not ended yet
+#------------------------------------------------------
+def selectAllRequests() -> DbOperationResult:
+    return sql_engine.selectAll(SQL_SELECT_ALL_REQUESTS)
+
+#------------------------------------------------------
+# Select a single request's range and status
+#------------------------------------------------------
+def selectRequest(product_request_id: UUID) -> DbOperationResult:
+    parms = (str(product_request_id),)
+    return sql_engine.select(SQL_SELECT_REQUEST, parms)
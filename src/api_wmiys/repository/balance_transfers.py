@@ -3,29 +3,260 @@
 
 Balance transfers sql commands.
 
+A transfer is reserved before it's sent to stripe: in a single transaction the lender's ledger
+row is locked, a pending Balance_Transfers row is inserted, and its amount is taken out of the
+balance. A second transfer for the same lender (on-demand or scheduled) waits for the lock and
+then sees the reduced balance, so a balance can never be paid out twice.
+
+Once stripe answers, the transfers are marked as sent, or failed (their amount is put back).
+
+Both run on their own connection, even during a request: the reservation has to be committed
+before stripe is called, so a transfer that stripe accepted can't be rolled back with the
+request (and paid out again), and the ledger row isn't locked during the stripe call.
+
 **********************************************************************************************
 """
 
 from __future__ import annotations
-import pymysql.commands as sql_engine
+from datetime import datetime
+from uuid import UUID
+import uuid
+
+from api_wmiys.db import commands as sql_engine
+from api_wmiys.db.connection import ConnectionDict
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain import models
+from api_wmiys.domain.enums.payments import BalanceTransferStatus
+
+
+#------------------------------------------------------
+# Connection that is not part of the request's session
+#------------------------------------------------------
+class _OwnConnection(ConnectionDict):
+    USES_SESSION = False
 
 
 SQL_INSERT = '''
-    INSERT INTO 
-        Balance_Transfers (id, user_id, amount, destination_account_id, transfer_id, created_on) 
-    VALUES 
-        (%s, %s, %s, %s, %s, %s);
+    INSERT INTO
+        Balance_Transfers (id, user_id, amount, destination_account_id, transfer_id, created_on, status, batch_id)
+    VALUES
+        (%s, %s, %s, %s, %s, %s, %s, %s);
+'''
+
+# every lender (or a single one) whose balance can be paid out to a confirmed payout account
+SQL_SELECT_PAYABLE_LEDGERS = '''
+    SELECT
+        ll.user_id AS user_id,
+        ll.balance AS balance,
+        (
+            SELECT pa.account_id
+            FROM Payout_Accounts pa
+            WHERE pa.user_id = ll.user_id AND pa.confirmed = TRUE
+            LIMIT 1
+        ) AS destination_account_id
+    FROM
+        Lender_Ledgers ll
+    WHERE
+        ll.balance >= %s
+        {user_filter}
+    HAVING
+        destination_account_id IS NOT NULL
+    FOR UPDATE;
+'''
+
+SQL_UPDATE_LEDGER_WITHDRAW = '''
+    UPDATE
+        Lender_Ledgers
+    SET
+        balance = GREATEST(balance - %s, 0)
+    WHERE
+        user_id = %s;
+'''
+
+SQL_UPDATE_LEDGER_REFUND = '''
+    UPDATE
+        Lender_Ledgers
+    SET
+        balance = balance + %s
+    WHERE
+        user_id = %s;
+'''
+
+SQL_UPDATE_SENT = '''
+    UPDATE
+        Balance_Transfers
+    SET
+        status      = 'sent',
+        transfer_id = %s
+    WHERE
+        id = %s
+        AND status = 'pending';
 '''
 
+SQL_UPDATE_FAILED = '''
+    UPDATE
+        Balance_Transfers
+    SET
+        status = 'failed'
+    WHERE
+        id = %s
+        AND status = 'pending';
+'''
+
+SQL_SELECT_STALE_PENDING = '''
+    SELECT
+        *
+    FROM
+        Balance_Transfers bt
+    WHERE
+        bt.status = 'pending'
+        AND bt.created_on < NOW() - INTERVAL %s SECOND
+        AND bt.created_on > NOW() - INTERVAL %s SECOND
+    ORDER BY
+        bt.created_on ASC;
+'''
+
+SQL_SELECT_EXPIRED_PENDING = '''
+    SELECT
+        *
+    FROM
+        Balance_Transfers bt
+    WHERE
+        bt.status = 'pending'
+        AND bt.created_on <= NOW() - INTERVAL %s SECOND
+    ORDER BY
+        bt.created_on ASC;
+'''
+
+
+#------------------------------------------------------
+# Reserve a transfer of the whole balance of every lender that has at least min_balance
+# and a confirmed payout account (or just the given lender's).
+#
+# Returns a DbOperationResult:
+#   - data: list of the reserved (pending) BalanceTransfer models
+#------------------------------------------------------
+def reserve(min_balance: float, user_id: int=None, batch_id: UUID=None) -> DbOperationResult:
+    result = DbOperationResult(successful=True)
+    db = _OwnConnection()
+
+    try:
+        db.connect()
+        _beginTransaction(db)
+        cursor = db.getCursor()
+
+        if user_id is None:
+            cursor.execute(SQL_SELECT_PAYABLE_LEDGERS.format(user_filter=''), (min_balance,))
+        else:
+            cursor.execute(SQL_SELECT_PAYABLE_LEDGERS.format(user_filter='AND ll.user_id = %s'), (min_balance, user_id))
+
+        balance_transfers = [_newReservation(row, batch_id) for row in cursor.fetchall()]
+
+        if balance_transfers:
+            cursor.executemany(SQL_INSERT, [_getInsertParms(bt) for bt in balance_transfers])
+            cursor.executemany(SQL_UPDATE_LEDGER_WITHDRAW, [(bt.amount, bt.user_id) for bt in balance_transfers])
+
+        db.commit()
+
+        result.data = balance_transfers
+
+    except Exception as e:
+        result.successful = False
+        result.error = e
+        result.data = None
+
+    finally:
+        db.close()
+
+    return result
+
+#------------------------------------------------------
+# Record the stripe results of pending transfers:
+#   - sent: transfer_id is set
+#   - failed: the amount is put back in the lender's balance
+#------------------------------------------------------
+def recordResults(sent: list[models.BalanceTransfer], failed: list[models.BalanceTransfer]) -> DbOperationResult:
+    result = DbOperationResult(successful=True)
+    db = _OwnConnection()
+
+    try:
+        db.connect()
+        _beginTransaction(db)
+        cursor = db.getCursor()
+
+        if sent:
+            cursor.executemany(SQL_UPDATE_SENT, [(bt.transfer_id, str(bt.id)) for bt in sent])
+
+        # only refund the transfers that were still pending
+        refunds = []
+
+        for bt in failed:
+            cursor.execute(SQL_UPDATE_FAILED, (str(bt.id),))
+
+            if cursor.rowcount > 0:
+                refunds.append((bt.amount, bt.user_id))
+
+        if refunds:
+            cursor.executemany(SQL_UPDATE_LEDGER_REFUND, refunds)
+
+        db.commit()
+
+    except Exception as e:
+        result.successful = False
+        result.error = e
+
+    finally:
+        db.close()
+
+    return result
 
 #------------------------------------------------------
-# Insert the transfer in the database
+# Get the transfers that have been pending for longer than min_age_seconds
+# (the process that reserved them died before stripe answered).
+# Older than max_age_seconds are left to selectExpiredPending: stripe forgets idempotency keys after 24 hours.
 #------------------------------------------------------
-def insert(bt: models.BalanceTransfer) -> DbOperationResult:
-    parms = _getInsertParms(bt)
-    return sql_engine.modify(SQL_INSERT, parms)
+def selectStalePending(min_age_seconds: int, max_age_seconds: int) -> DbOperationResult:
+    db_result = sql_engine.selectAll(SQL_SELECT_STALE_PENDING, (min_age_seconds, max_age_seconds))
+
+    if db_result.successful:
+        db_result.data = [models.BalanceTransfer(**row) for row in db_result.data or []]
+
+    return db_result
+
+#------------------------------------------------------
+# Get the transfers that have been pending for at least min_age_seconds.
+# These can't be sent again safely (stripe forgot their idempotency key), they have to be
+# looked up in stripe instead.
+#------------------------------------------------------
+def selectExpiredPending(min_age_seconds: int) -> DbOperationResult:
+    db_result = sql_engine.selectAll(SQL_SELECT_EXPIRED_PENDING, (min_age_seconds,))
+
+    if db_result.successful:
+        db_result.data = [models.BalanceTransfer(**row) for row in db_result.data or []]
+
+    return db_result
+
+
+#------------------------------------------------------
+# Start a transaction (the request's session already has one)
+#------------------------------------------------------
+def _beginTransaction(db: ConnectionDict):
+    if not db.connection.in_transaction:
+        db.connection.start_transaction()
+
+#------------------------------------------------------
+# Create a pending transfer of the locked ledger row's balance
+#------------------------------------------------------
+def _newReservation(row: dict, batch_id: UUID=None) -> models.BalanceTransfer:
+    return models.BalanceTransfer(
+        id                     = uuid.uuid4(),
+        user_id                = row['user_id'],
+        amount                 = row['balance'],
+        destination_account_id = row['destination_account_id'],
+        created_on             = datetime.now(),
+        status                 = BalanceTransferStatus.PENDING,
+        batch_id               = batch_id,
+    )
 
 #------------------------------------------------------
 # Get the insert command parms tuple
@@ -38,6 +269,8 @@ def _getInsertParms(balance_transfer: models.BalanceTransfer) -> tuple:
         balance_transfer.destination_account_id,
         balance_transfer.transfer_id,
         balance_transfer.created_on,
+        BalanceTransferStatus(balance_transfer.status).value,
+        str(balance_transfer.batch_id) if balance_transfer.batch_id else None,
     )
 
     return parms
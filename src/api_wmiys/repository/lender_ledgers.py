@@ -0,0 +1,69 @@
+"""
+**********************************************************************************************
+
+Lender ledgers sql commands.
+
+Every lender's earnings/balance are running totals in Lender_Ledgers (read through View_Users).
+These stored procedures keep them up to date:
+    - Lender_Ledger_Add_Request:        a request was accepted
+    - Lender_Ledger_Mature_Entries:     the payouts of rentals that ended are moved into the balance
+                                        (also run by Event_Mature_Lender_Ledger_Entries)
+
+Balance transfers are taken out of the balance when they are reserved (see repository.balance_transfers).
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from uuid import UUID
+from pymysql.structs import DbOperationResult
+from api_wmiys.db.connection import ConnectionBase
+
+#------------------------------------------------------
+# Connection that is not part of the request's session
+#------------------------------------------------------
+class _OwnConnection(ConnectionBase):
+    USES_SESSION = False
+
+
+SQL_ADD_REQUEST_STORED_PROCEDURE    = 'Lender_Ledger_Add_Request'
+SQL_MATURE_ENTRIES_STORED_PROCEDURE = 'Lender_Ledger_Mature_Entries'
+
+
+#------------------------------------------------------
+# Add the accepted request's payout to the lender's ledger
+#------------------------------------------------------
+def addRequest(product_request_id: UUID) -> DbOperationResult:
+    parms = [str(product_request_id)]
+    return _callProcedure(SQL_ADD_REQUEST_STORED_PROCEDURE, parms)
+
+#------------------------------------------------------
+# Move the payouts of the rentals that ended into the balances (of every lender if user_id is None).
+# Committed right away, outside of the request's transaction (it comes before a balance transfer reservation).
+#------------------------------------------------------
+def matureEntries(user_id: int=None) -> DbOperationResult:
+    parms = [user_id]
+    return _callProcedure(SQL_MATURE_ENTRIES_STORED_PROCEDURE, parms, _OwnConnection)
+
+#------------------------------------------------------
+# Call the stored procedure and commit
+#------------------------------------------------------
+def _callProcedure(procedure_name: str, parms: list, connection_class=ConnectionBase) -> DbOperationResult:
+    result = DbOperationResult(successful=True)
+    db = connection_class()
+
+    try:
+        db.connect()
+        cursor = db.getCursor()
+        cursor.callproc(procedure_name, parms)
+        db.commit()
+    
+    except Exception as e:
+        result.successful = False
+        result.error = e
+        result.data = None
+    
+    finally:
+        db.close()
+    
+    return result
@@ -7,7 +7,7 @@ Product listing availability sql commands.
 """
 
 from __future__ import annotations
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain import models
 
@@ -8,8 +8,9 @@ This is an abstraction for all the sql commands related to Locations.
 **********************************************************************************************
 """
 
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
+from api_wmiys.db.connection import ConnectionDict
 
 from api_wmiys.domain import models
 
@@ -36,10 +37,136 @@ SQL_SELECT = """
         1;
 """
 
+#------------------------------------------------------
+# Select the location records of a list of ids
+#------------------------------------------------------
+SQL_SELECT_BY_IDS = """
+    SELECT
+        id,
+        city,
+        state_id,
+        state_name
+    FROM
+        Locations l
+    WHERE
+        l.id IN ({placeholders});
+"""
+
+#------------------------------------------------------
+# Select the coordinates of every location (spatial index source)
+#------------------------------------------------------
+SQL_SELECT_ALL_COORDINATES = """
+    SELECT
+        l.id,
+        l.lat,
+        l.lng
+    FROM
+        Locations l;
+"""
+
+#------------------------------------------------------
+# Select the search fields of every location (location name index source)
+#------------------------------------------------------
+SQL_SELECT_ALL_SEARCH_FIELDS = """
+    SELECT
+        l.id,
+        l.city,
+        l.state_id,
+        l.state_name,
+        l.lat,
+        l.lng,
+        l.ranking,
+        l.population,
+        l.county_name
+    FROM
+        Locations l;
+"""
+
+#------------------------------------------------------
+# Stored procedure: all the locations within the given miles of a location
+# (uses the Locations.coordinates SPATIAL INDEX)
+#
+# Parms:
+#   - location's id
+#   - miles
+#------------------------------------------------------
+LOCATIONS_IN_RANGE_STORED_PROCEDURE = 'Get_Locations_In_Range'
+
+#------------------------------------------------------
+# Stored procedure: the ids and exact (unrounded) distances of all the locations
+# within the given miles of a location
+#
+# Parms:
+#   - location's id
+#   - miles
+#------------------------------------------------------
+LOCATION_IDS_IN_RANGE_STORED_PROCEDURE = 'Get_Location_Ids_In_Range'
+
 
 #------------------------------------------------------
 # Select a single location record from the database
 #------------------------------------------------------
 def select(location: models.Location) -> DbOperationResult:
     parms = (location.id,)
-    return sql_engine.select(SQL_SELECT, parms)
\ No newline at end of file
+    return sql_engine.select(SQL_SELECT, parms)
+
+#------------------------------------------------------
+# Select the location records of the given ids (the ones that exist, in no particular order)
+#------------------------------------------------------
+def selectAllByIds(location_ids: list[int]) -> DbOperationResult:
+    if not location_ids:
+        return DbOperationResult(successful=True, data=[])
+
+    sql = SQL_SELECT_BY_IDS.format(placeholders=', '.join(['%s'] * len(location_ids)))
+    return sql_engine.selectAll(sql, tuple(location_ids))
+
+#------------------------------------------------------
+# Select the id, lat, and lng of all the locations
+#------------------------------------------------------
+def selectAllCoordinates() -> DbOperationResult:
+    return sql_engine.selectAll(SQL_SELECT_ALL_COORDINATES)
+
+#------------------------------------------------------
+# Select the fields returned by a location search for all the locations
+#------------------------------------------------------
+def selectAllSearchFields() -> DbOperationResult:
+    return sql_engine.selectAll(SQL_SELECT_ALL_SEARCH_FIELDS)
+
+#------------------------------------------------------
+# Select all the locations within the given miles of a location (closest first)
+#------------------------------------------------------
+def selectAllWithinMiles(location_id: int, miles: int) -> DbOperationResult:
+    parms = [location_id, miles]
+    return _callRangeProcedure(LOCATIONS_IN_RANGE_STORED_PROCEDURE, parms)
+
+#------------------------------------------------------
+# Select the id and exact distance of all the locations within the given miles of a location (closest first)
+#------------------------------------------------------
+def selectIdsWithinMiles(location_id: int, miles: int) -> DbOperationResult:
+    parms = [location_id, miles]
+    return _callRangeProcedure(LOCATION_IDS_IN_RANGE_STORED_PROCEDURE, parms)
+
+#------------------------------------------------------
+# Call one of the locations in range stored procedures and fetch its result set
+#------------------------------------------------------
+def _callRangeProcedure(procedure_name: str, parms: list) -> DbOperationResult:
+    db_result = DbOperationResult(successful=True)
+    db = ConnectionDict()
+
+    try:
+        db.connect()
+        mycursor = db.getCursor()
+        mycursor.callproc(procedure_name, parms)
+
+        record_set = next(mycursor.stored_results())
+        db_result.data = record_set.fetchall()
+
+    except Exception as e:
+        db_result.successful = False
+        db_result.data       = None
+        db_result.error      = e
+    
+    finally:
+        db.close()
+    
+    return db_result
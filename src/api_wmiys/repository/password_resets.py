@@ -7,9 +7,9 @@ Any interaction with the Password_Resets database table should go through here.
 **********************************************************************************************
 """
 
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
-from pymysql.connection import ConnectionBase
+from api_wmiys.db.connection import ConnectionBase
 from api_wmiys.domain import models
 
 
@@ -0,0 +1,215 @@
+"""
+**********************************************************************************************
+
+Payment actions sql commands.
+
+Payment_Actions is the outbox of the stripe captures/cancels that the lenders' request responses
+need. An action is inserted in the same transaction as the request's status change, then the
+payment outbox worker claims it, calls stripe, and records the result on both the action and
+the product request (Product_Requests.payment_status).
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+from pymysql.structs import DbOperationResult
+from api_wmiys.db import commands as sql_engine
+from api_wmiys.db.connection import ConnectionDict
+from api_wmiys.domain import models
+from api_wmiys.domain.enums.payments import PaymentActions, PaymentActionStatus
+
+
+SQL_INSERT = '''
+    INSERT INTO
+        Payment_Actions (id, product_request_id, action, session_id, idempotency_key)
+    VALUES
+        (%s, %s, %s, %s, %s);
+'''
+
+SQL_UPDATE_REQUEST_PAYMENT_STATUS = '''
+    UPDATE
+        Product_Requests
+    SET
+        payment_status = 'pending'
+    WHERE
+        id = %s;
+'''
+
+# pending actions that are due + processing actions whose worker lease ran out
+SQL_SELECT_DUE = '''
+    SELECT
+        *
+    FROM
+        Payment_Actions pa
+    WHERE
+        (pa.status = 'pending' AND pa.next_attempt_on <= NOW())
+        OR (pa.status = 'processing' AND pa.locked_until < NOW())
+    ORDER BY
+        pa.next_attempt_on ASC
+    LIMIT
+        %s
+    FOR UPDATE SKIP LOCKED;
+'''
+
+SQL_CLAIM = '''
+    UPDATE
+        Payment_Actions
+    SET
+        status       = 'processing',
+        attempts     = attempts + 1,
+        locked_until = NOW() + INTERVAL %s SECOND
+    WHERE
+        id IN ({placeholders});
+'''
+
+SQL_UPDATE_SUCCEEDED = '''
+    UPDATE
+        Payment_Actions pa
+        INNER JOIN Product_Requests pr ON pr.id = pa.product_request_id
+    SET
+        pa.status            = 'succeeded',
+        pa.payment_intent_id = %s,
+        pa.locked_until      = NULL,
+        pa.last_error        = NULL,
+        pr.payment_status    = %s
+    WHERE
+        pa.id = %s;
+'''
+
+SQL_UPDATE_RETRY = '''
+    UPDATE
+        Payment_Actions
+    SET
+        status          = 'pending',
+        next_attempt_on = NOW() + INTERVAL %s SECOND,
+        locked_until    = NULL,
+        last_error      = %s
+    WHERE
+        id = %s;
+'''
+
+SQL_UPDATE_FAILED = '''
+    UPDATE
+        Payment_Actions pa
+        INNER JOIN Product_Requests pr ON pr.id = pa.product_request_id
+    SET
+        pa.status         = 'failed',
+        pa.locked_until   = NULL,
+        pa.last_error     = %s,
+        pr.payment_status = 'failed'
+    WHERE
+        pa.id = %s;
+'''
+
+# Product_Requests.payment_status of a succeeded action
+_REQUEST_PAYMENT_STATUSES = {
+    PaymentActions.CAPTURE : 'captured',
+    PaymentActions.CANCEL  : 'canceled',
+}
+
+# longest error message that gets saved
+MAX_ERROR_LENGTH = 1000
+
+
+#------------------------------------------------------
+# Insert the payment action and mark the request's payment as pending
+#------------------------------------------------------
+def insert(payment_action: models.PaymentAction) -> DbOperationResult:
+    parms = (
+        str(payment_action.id),
+        str(payment_action.product_request_id),
+        PaymentActions(payment_action.action).value,
+        payment_action.session_id,
+        payment_action.idempotency_key,
+    )
+
+    db_result = sql_engine.modify(SQL_INSERT, parms)
+
+    if not db_result.successful:
+        return db_result
+
+    return sql_engine.modify(SQL_UPDATE_REQUEST_PAYMENT_STATUS, (str(payment_action.product_request_id),))
+
+#------------------------------------------------------
+# Claim the next due actions for the calling worker.
+# The claimed actions are locked for lease_seconds: if the worker does not record a result
+# before then, another worker can claim them again.
+#
+# Returns a DbOperationResult:
+#   - data: list of the claimed PaymentAction models
+#------------------------------------------------------
+def claimDue(limit: int, lease_seconds: int) -> DbOperationResult:
+    result = DbOperationResult(successful=True)
+    db = ConnectionDict()
+
+    try:
+        db.connect()
+        db.connection.start_transaction()
+        cursor = db.getCursor()
+
+        cursor.execute(SQL_SELECT_DUE, (limit,))
+        rows = cursor.fetchall()
+
+        if rows:
+            ids = [row['id'] for row in rows]
+            sql = SQL_CLAIM.format(placeholders=', '.join(['%s'] * len(ids)))
+            cursor.execute(sql, [lease_seconds] + ids)
+
+        db.commit()
+
+        result.data = [_toModel(row) for row in rows]
+
+    except Exception as e:
+        result.successful = False
+        result.error = e
+        result.data = None
+
+    finally:
+        db.close()
+
+    return result
+
+#------------------------------------------------------
+# Record that stripe applied the action
+#------------------------------------------------------
+def markSucceeded(payment_action: models.PaymentAction, payment_intent_id: str) -> DbOperationResult:
+    request_payment_status = _REQUEST_PAYMENT_STATUSES[PaymentActions(payment_action.action)]
+    parms = (payment_intent_id, request_payment_status, str(payment_action.id))
+
+    return sql_engine.modify(SQL_UPDATE_SUCCEEDED, parms)
+
+#------------------------------------------------------
+# Put the action back in the queue to be retried in delay_seconds
+#------------------------------------------------------
+def markRetry(payment_action: models.PaymentAction, delay_seconds: int, error: str) -> DbOperationResult:
+    parms = (delay_seconds, _truncateError(error), str(payment_action.id))
+    return sql_engine.modify(SQL_UPDATE_RETRY, parms)
+
+#------------------------------------------------------
+# Give up on the action and mark the request's payment as failed
+#------------------------------------------------------
+def markFailed(payment_action: models.PaymentAction, error: str) -> DbOperationResult:
+    parms = (_truncateError(error), str(payment_action.id))
+    return sql_engine.modify(SQL_UPDATE_FAILED, parms)
+
+
+#------------------------------------------------------
+# Turn a claimed Payment_Actions row into a model (attempts includes the claim)
+#------------------------------------------------------
+def _toModel(row: dict) -> models.PaymentAction:
+    payment_action = models.PaymentAction(**row)
+
+    payment_action.action   = PaymentActions(payment_action.action)
+    payment_action.status   = PaymentActionStatus.PROCESSING
+    payment_action.attempts = payment_action.attempts + 1
+
+    return payment_action
+
+#------------------------------------------------------
+# Keep the saved error messages to a reasonable length
+#------------------------------------------------------
+def _truncateError(error: str) -> str | None:
+    if error is None:
+        return None
+
+    return str(error)[:MAX_ERROR_LENGTH]
@@ -9,7 +9,7 @@ All sql commands regarding payout accounts are here.
 
 from __future__ import annotations
 
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain import models
 
@@ -9,7 +9,7 @@ The SQL_MODIFY command query is used for both INSERT and UPDATE commands.
 """
 
 from __future__ import annotations
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain import models
 
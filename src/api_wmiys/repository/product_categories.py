@@ -7,7 +7,7 @@ All the sql commands for fetching product categories.
 """
 
 from __future__ import annotations
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
 
 
@@ -18,6 +18,14 @@ SQL_SELECT_ALL = '''
         All_Categories;
 '''
 
+# changes whenever a row of a category table is inserted, updated or deleted
+SQL_SELECT_FINGERPRINT = '''
+    SELECT
+        (SELECT CONCAT(COUNT(*), '-', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', id, name))), 0)) FROM Product_Categories_Major) AS major,
+        (SELECT CONCAT(COUNT(*), '-', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', id, product_categories_major_id, name))), 0)) FROM Product_Categories_Minor) AS minor,
+        (SELECT CONCAT(COUNT(*), '-', COALESCE(BIT_XOR(CRC32(CONCAT_WS('|', id, product_categories_minor_id, name))), 0)) FROM Product_Categories_Sub) AS sub;
+'''
+
 
 SQL_SELECT_ALL_MAJORS = '''
     SELECT
@@ -105,6 +113,11 @@ SQL_SELECT_SUB = '''
 def selectAll() -> DbOperationResult:
     return sql_engine.selectAll(SQL_SELECT_ALL)
 
+#------------------------------------------------------
+# Get a checksum of the 3 category tables' rows (a dict)
+#------------------------------------------------------
+def selectFingerprint() -> DbOperationResult:
+    return sql_engine.select(SQL_SELECT_FINGERPRINT)
 
 #------------------------------------------------------
 # Retrieve all major categories
@@ -7,8 +7,8 @@ All the SQL commands for the Product_Images table.
 """
 
 from __future__ import annotations
-import pymysql.commands as sql_engine
-from pymysql.connection import ConnectionPrepared
+from api_wmiys.db import commands as sql_engine
+from api_wmiys.db.connection import ConnectionPrepared
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain import models
 
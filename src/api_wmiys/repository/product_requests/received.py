@@ -7,7 +7,7 @@ SQL commands for received product requests received.
 """
 
 from __future__ import annotations
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain.enums.product_requests import RequestStatus
 
@@ -8,7 +8,7 @@ SQL commands for received product requests submitted (as the renter).
 
 from __future__ import annotations
 from uuid import UUID
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain.enums.product_requests import RequestStatus
 
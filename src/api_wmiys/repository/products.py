@@ -6,9 +6,9 @@ It is meant to serve as an abstraction between the caller and the database.
 
 from __future__ import annotations
 
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
-from pymysql.connection import ConnectionPrepared
+from api_wmiys.db.connection import ConnectionPrepared
 
 from api_wmiys.domain import models
 
@@ -9,7 +9,7 @@ Search locations sql interface
 from __future__ import annotations
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain import models
-from pymysql.connection import ConnectionDict
+from api_wmiys.db.connection import ConnectionDict
 
 SEARCH_STORED_PROCEDURE = 'Search_Locations'
 
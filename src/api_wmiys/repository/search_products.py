@@ -3,66 +3,316 @@
 
 Search Products sql commands.
 
+There are 3 search engines (see SearchEngines):
+    - FILTER: the original statement that calls SEARCH_PRODUCTS_FILTER for every product row
+    - SET_BASED: evaluates the distance, blackout ranges and completeness as joins/predicates 
+      so the database can use a single query plan for the whole product set
+    - SPATIAL: the SET_BASED statement with the bounding box/distance done on the 
+      Locations.coordinates SPATIAL INDEX (MBRContains + ST_Distance_Sphere)
+
+The FILTER engine is kept around so the results of both engines can be compared.
+
 **********************************************************************************************
 """
 
 from __future__ import annotations
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain import models
+from api_wmiys.domain.enums.search_products import SearchEngines
 from api_wmiys.common import Sorting
 
 
+# the engine that is used when the caller does not specify one (set in the app configuration)
+ENGINE = SearchEngines.SET_BASED
+
+
+#------------------------------------------------------
+# Original search statement
+#
+# Only complete products are returned (same predicates as the set-based statement), 
+# so both engines return the same records.
+#
+# Parms:
+#   - dropoff location id
+#   - starts on
+#   - ends on
+#------------------------------------------------------
 SQL_SELECT_PREFIX = '''
     SELECT * FROM View_Search_Products p
-    WHERE SEARCH_PRODUCTS_FILTER(p.id, %s, %s, %s) = TRUE 
+    WHERE 
+        p.name IS NOT NULL
+        AND p.product_categories_sub_id IS NOT NULL
+        AND p.location_id IS NOT NULL
+        AND p.dropoff_distance IS NOT NULL
+        AND p.price_full IS NOT NULL
+        AND SEARCH_PRODUCTS_FILTER(p.id, %s, %s, %s) = TRUE 
+'''
+
+#------------------------------------------------------
+# Set-based search statement
+#
+# A product is returned if:
+#   - its location is within the bounding box (see the bounding box predicate below)
+#   - all of its required columns have values (PRODUCT_IS_COMPLETE)
+#   - it is not blocked during the range (see the availability predicates below)
+#   - the dropoff location is within its dropoff distance (MILES_BETWEEN)
+#
+# Parms:
+#   - dropoff location id
+#   - the bounding box predicate parms
+#   - the availability predicate parms
+#------------------------------------------------------
+_SQL_SELECT_PREFIX_SET_BASED_TEMPLATE = '''
+    SELECT 
+        p.* 
+    FROM 
+        View_Search_Products p
+        INNER JOIN Products prod ON prod.id = p.id
+        INNER JOIN Locations pl ON pl.id = prod.location_id
+        INNER JOIN Locations dl ON dl.id = %s
+    WHERE 
+        {bounding_box_predicate}
+        prod.name IS NOT NULL
+        AND prod.product_categories_sub_id IS NOT NULL
+        AND prod.dropoff_distance IS NOT NULL
+        AND prod.price_full IS NOT NULL
+        {availability_predicate}
+        AND {distance_predicate}
 '''
 
-SQL_SELECT_PREFIX_CATEGORY = f'{SQL_SELECT_PREFIX} AND {{category_column_name}} = %s'
+#------------------------------------------------------
+# Distance predicate: hand written great circle distance (same math as MILES_BETWEEN)
+#
+# ACOS is clamped to [-1, 1] because rounding can push the value of 2 identical points just past 1.
+#------------------------------------------------------
+_SQL_DISTANCE_ACOS = '''ACOS(LEAST(1, GREATEST(-1, 
+            SIN(RADIANS(pl.lat)) * SIN(RADIANS(dl.lat)) + 
+            COS(RADIANS(pl.lat)) * COS(RADIANS(dl.lat)) * COS(RADIANS(dl.lng) - RADIANS(pl.lng))
+        ))) * 3959 <= prod.dropoff_distance'''
+
+#------------------------------------------------------
+# Distance predicate: spatial column distance (miles)
+#------------------------------------------------------
+_SQL_DISTANCE_SPHERE = 'ST_Distance_Sphere(pl.coordinates, dl.coordinates, 3959) <= prod.dropoff_distance'
+
+#------------------------------------------------------
+# Availability predicate: none of its availability records overlap the range (IS_PRODUCT_AVAILABLE)
+#
+# Parms:
+#   - ends on
+#   - starts on
+#------------------------------------------------------
+_SQL_AVAILABILITY_NOT_EXISTS = '''
+        AND NOT EXISTS (
+            SELECT 
+                1 
+            FROM 
+                Product_Availability pa
+            WHERE 
+                pa.product_id = prod.id
+                AND pa.starts_on <= %s
+                AND pa.ends_on >= %s
+        )
+'''
+
+#------------------------------------------------------
+# Availability predicate: the product is not one of the ones the availability calendar says are blocked
+#
+# Parms:
+#   - each blocked product id
+#------------------------------------------------------
+_SQL_AVAILABILITY_NOT_IN = 'AND p.id NOT IN ({placeholders})'
+
+#------------------------------------------------------
+# Bounding box predicate: cheap (indexable) lat/lng range check before the exact distance
+#
+# Parms:
+#   - min lat
+#   - max lat
+#   - min lng
+#   - max lng
+#------------------------------------------------------
+_SQL_BOUNDING_BOX = '''
+        pl.lat BETWEEN %s AND %s
+        AND pl.lng BETWEEN %s AND %s AND
+'''
+
+#------------------------------------------------------
+# Bounding box predicate: the box polygon checked against the Locations SPATIAL INDEX
+#
+# Parms:
+#   - box polygon WKT (lng lat order)
+#------------------------------------------------------
+_SQL_BOUNDING_BOX_SPATIAL = '''
+        MBRContains(ST_GeomFromText(%s, 4326, 'axis-order=long-lat'), pl.coordinates) AND
+'''
+
+SQL_SELECT_PREFIX_SET_BASED = _SQL_SELECT_PREFIX_SET_BASED_TEMPLATE.format(
+    bounding_box_predicate = '',
+    availability_predicate = _SQL_AVAILABILITY_NOT_EXISTS,
+    distance_predicate     = _SQL_DISTANCE_ACOS,
+)
+
+_SQL_CATEGORY_SUFFIX = ' AND p.{category_column_name} = %s'
+
+#------------------------------------------------------
+# Only the columns needed to rank the search results by distance
+#------------------------------------------------------
+_SQL_SELECT_CANDIDATES = 'SELECT t.id, t.location_id FROM ({prefix}) t'
+
+#------------------------------------------------------
+# Select the search view records of the given products
+#
+# Parms:
+#   - each product id
+#------------------------------------------------------
+SQL_SELECT_BY_IDS = 'SELECT * FROM View_Search_Products p WHERE p.id IN ({placeholders});'
+
+#------------------------------------------------------
+# The largest dropoff distance of all the products (bounding box size)
+#------------------------------------------------------
+SQL_SELECT_MAX_DROPOFF_DISTANCE = 'SELECT MAX(dropoff_distance) AS miles FROM Products;'
+
+SQL_SELECT_PREFIX_CATEGORY = SQL_SELECT_PREFIX + _SQL_CATEGORY_SUFFIX
+
 
 #------------------------------------------------------
 # Select all the records including a LIMIT, OFFSET clause
 #------------------------------------------------------
-def selectAll(product_search: models.ProductSearchRequest) -> DbOperationResult:
-    sql = _getStmtWithLimit(product_search)
-    parms = _getSelectAllParms(product_search)
+def selectAll(product_search: models.ProductSearchRequest, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+    sql = _getStmtWithLimit(product_search, engine)
+    parms = _getSelectAllParms(product_search, engine)
+
+    return sql_engine.selectAll(sql, parms)
+
+#------------------------------------------------------
+# Select all the records including a LIMIT, OFFSET clause.
+# Each record also has the total number of records that would have been returned with no LIMIT clause.
+#------------------------------------------------------
+def selectAllWithTotalCount(product_search: models.ProductSearchRequest, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+    sql = _getStmtWithLimit(product_search, engine, window_count=True)
+    parms = _getSelectAllParms(product_search, engine)
+
+    return sql_engine.selectAll(sql, parms)
+
+#------------------------------------------------------
+# Select the page of records after the keyset pagination cursor (plus 1 extra record).
+# The first page (no cursor) also has the total record count column.
+#------------------------------------------------------
+def selectAllSeek(product_search: models.ProductSearchRequest, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+    sql, seek_parms = _getStmtSeek(_getPrefix(product_search, engine), product_search)
+    parms = _getSelectAllParms(product_search, engine) + seek_parms
 
     return sql_engine.selectAll(sql, parms)
 
+#------------------------------------------------------
+# Select the id and location id of every record (no ORDER BY, LIMIT)
+#------------------------------------------------------
+def selectAllCandidates(product_search: models.ProductSearchRequest, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+    sql = _SQL_SELECT_CANDIDATES.format(prefix=_getPrefix(product_search, engine))
+    parms = _getSelectAllParms(product_search, engine)
+
+    return sql_engine.selectAll(f'{sql};', parms)
+
+#------------------------------------------------------
+# Select the search view records of the given product ids (in no particular order)
+#------------------------------------------------------
+def selectAllByIds(product_ids: list[int]) -> DbOperationResult:
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    sql = SQL_SELECT_BY_IDS.format(placeholders=placeholders)
+
+    return sql_engine.selectAll(sql, tuple(product_ids))
+
+#------------------------------------------------------
+# Select the largest dropoff distance of all the products
+#------------------------------------------------------
+def selectMaxDropoffDistance() -> DbOperationResult:
+    return sql_engine.select(SQL_SELECT_MAX_DROPOFF_DISTANCE)
+
 #------------------------------------------------------
 # Select the count of the total number of records that would have been returned with no LIMIT clause
 #------------------------------------------------------
-def selectAllTotalCount(product_search: models.ProductSearchRequest) -> DbOperationResult:
-    sql = _getStmtTotalCount(product_search)
-    parms = _getSelectAllParms(product_search)
+def selectAllTotalCount(product_search: models.ProductSearchRequest, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+    sql = _getStmtTotalCount(product_search, engine)
+    parms = _getSelectAllParms(product_search, engine)
 
     return sql_engine.select(sql, parms)
 
 #------------------------------------------------------
 # Select all the records including a LIMIT, OFFSET clause for a specific category
 #------------------------------------------------------
-def selectAllCategory(product_search: models.ProductSearchRequestCategory) -> DbOperationResult:
+def selectAllCategory(product_search: models.ProductSearchRequestCategory, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+
+    # build the sql statement
+    sql = _getCategoryPrefix(product_search, engine)
+    sql = _getOrderByStmt(sql, product_search.sorting)
+    sql = product_search.pagination.getSqlStmtLimitOffset(sql)
+
+    # get the parms tuple
+    parms = _getSelectAllCategoryParms(product_search, engine)
+
+    # execute the sql command
+    return sql_engine.selectAll(sql, parms)
+
+#------------------------------------------------------
+# Select all the records including a LIMIT, OFFSET clause for a specific category.
+# Each record also has the total number of records that would have been returned with no LIMIT clause.
+#------------------------------------------------------
+def selectAllCategoryWithTotalCount(product_search: models.ProductSearchRequestCategory, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+
     # build the sql statement
-    sql = SQL_SELECT_PREFIX_CATEGORY.format(category_column_name=product_search.category_type.value)
+    sql = _getCategoryPrefix(product_search, engine)
+    sql = product_search.pagination.getSqlStmtWindowCount(sql)
     sql = _getOrderByStmt(sql, product_search.sorting)
     sql = product_search.pagination.getSqlStmtLimitOffset(sql)
 
     # get the parms tuple
-    parms = _getSelectAllCategoryParms(product_search)
+    parms = _getSelectAllCategoryParms(product_search, engine)
 
     # execute the sql command
     return sql_engine.selectAll(sql, parms)
 
+#------------------------------------------------------
+# Select the page of records after the keyset pagination cursor (plus 1 extra record) for a specific category.
+# The first page (no cursor) also has the total record count column.
+#------------------------------------------------------
+def selectAllCategorySeek(product_search: models.ProductSearchRequestCategory, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+    sql, seek_parms = _getStmtSeek(_getCategoryPrefix(product_search, engine), product_search)
+    parms = _getSelectAllCategoryParms(product_search, engine) + seek_parms
+
+    return sql_engine.selectAll(sql, parms)
+
+#------------------------------------------------------
+# Select the id and location id of every record for a specific category (no ORDER BY, LIMIT)
+#------------------------------------------------------
+def selectAllCategoryCandidates(product_search: models.ProductSearchRequestCategory, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+    sql = _SQL_SELECT_CANDIDATES.format(prefix=_getCategoryPrefix(product_search, engine))
+    parms = _getSelectAllCategoryParms(product_search, engine)
+
+    return sql_engine.selectAll(f'{sql};', parms)
+
 #------------------------------------------------------
 # Select the count of the total number of records that would have been returned with no LIMIT clause for a specific category
 #------------------------------------------------------
-def selectAllCategoryTotalCount(product_search: models.ProductSearchRequestCategory) -> DbOperationResult:
+def selectAllCategoryTotalCount(product_search: models.ProductSearchRequestCategory, engine: SearchEngines=None) -> DbOperationResult:
+    engine = engine or ENGINE
+
     # build the sql statement
-    sql = SQL_SELECT_PREFIX_CATEGORY.format(category_column_name=product_search.category_type.value)
+    sql = _getCategoryPrefix(product_search, engine)
     sql = product_search.pagination.getSqlStmtTotalCount(sql)
 
     # get the parms tuple
-    parms = _getSelectAllCategoryParms(product_search)
+    parms = _getSelectAllCategoryParms(product_search, engine)
 
     # execute the sql command
     return sql_engine.select(sql, parms)
@@ -70,22 +320,100 @@ def selectAllCategoryTotalCount(product_search: models.ProductSearchRequestCateg
 #------------------------------------------------------
 # Get the sql command statement with the limit clause
 #------------------------------------------------------
-def _getStmtWithLimit(product_search: models.ProductSearchRequest) -> str:
-    prefix = _getOrderByStmt(SQL_SELECT_PREFIX, product_search.sorting)
+def _getStmtWithLimit(product_search: models.ProductSearchRequest, engine: SearchEngines, window_count: bool=False) -> str:
+    prefix = _getPrefix(product_search, engine)
+
+    if window_count:
+        prefix = product_search.pagination.getSqlStmtWindowCount(prefix)
+
+    prefix = _getOrderByStmt(prefix, product_search.sorting)
     sql    = product_search.pagination.getSqlStmtLimitOffset(prefix)
     result = f'{sql};'
 
     return result
 
 #------------------------------------------------------
-# Get the sql command statement for fetching the total record count
+# Get the keyset pagination sql command statement (product_search.pagination is a KeysetPagination)
 #------------------------------------------------------
-def _getStmtTotalCount(product_search: models.ProductSearchRequest) -> str:
-    prefix = _getOrderByStmt(SQL_SELECT_PREFIX, product_search.sorting)
+def _getStmtSeek(prefix: str, product_search: models.ProductSearchRequest) -> tuple[str, tuple]:
+    pagination = product_search.pagination
+
+    if not pagination.cursor:
+        prefix = pagination.getSqlStmtWindowCount(prefix)
+
+    sql, seek_parms = pagination.getSqlStmtSeek(prefix, product_search.sorting)
+
+    return (f'{sql};', seek_parms)
+
+#------------------------------------------------------
+# Get the sql command statement for fetching the total record count.
+# No ORDER BY clause: the order does not change the count.
+#------------------------------------------------------
+def _getStmtTotalCount(product_search: models.ProductSearchRequest, engine: SearchEngines) -> str:
+    prefix = _getPrefix(product_search, engine)
     sql    = product_search.pagination.getSqlStmtTotalCount(prefix)
     
     return f'{sql};'
 
+#------------------------------------------------------
+# Get the select statement (no ORDER BY/LIMIT) for the engine
+#------------------------------------------------------
+def _getPrefix(product_search: models.ProductSearchRequest, engine: SearchEngines) -> str:
+    if _isSetBased(engine):
+        return _getSetBasedPrefix(product_search, engine)
+    else:
+        return SQL_SELECT_PREFIX
+
+#------------------------------------------------------
+# Check if the engine uses the set-based statement
+#------------------------------------------------------
+def _isSetBased(engine: SearchEngines) -> bool:
+    return engine in [SearchEngines.SET_BASED, SearchEngines.SPATIAL]
+
+#------------------------------------------------------
+# Get the set-based select statement.
+# The availability calendar's blocked ids are used when the service provided them.
+#------------------------------------------------------
+def _getSetBasedPrefix(product_search: models.ProductSearchRequest, engine: SearchEngines) -> str:
+    blocked_ids = product_search.blocked_product_ids
+
+    if blocked_ids is None:
+        availability_predicate = _SQL_AVAILABILITY_NOT_EXISTS
+    elif not blocked_ids:
+        availability_predicate = ''
+    else:
+        placeholders = ', '.join(['%s'] * len(blocked_ids))
+        availability_predicate = _SQL_AVAILABILITY_NOT_IN.format(placeholders=placeholders)
+    
+    if product_search.bounding_box is None:
+        bounding_box_predicate = ''
+    elif engine == SearchEngines.SPATIAL:
+        bounding_box_predicate = _SQL_BOUNDING_BOX_SPATIAL
+    else:
+        bounding_box_predicate = _SQL_BOUNDING_BOX
+    
+    if engine == SearchEngines.SPATIAL:
+        distance_predicate = _SQL_DISTANCE_SPHERE
+    else:
+        distance_predicate = _SQL_DISTANCE_ACOS
+    
+    return _SQL_SELECT_PREFIX_SET_BASED_TEMPLATE.format(
+        bounding_box_predicate = bounding_box_predicate,
+        availability_predicate = availability_predicate,
+        distance_predicate     = distance_predicate,
+    )
+
+#------------------------------------------------------
+# Get the category select statement (no ORDER BY/LIMIT) for the engine
+#------------------------------------------------------
+def _getCategoryPrefix(product_search: models.ProductSearchRequestCategory, engine: SearchEngines) -> str:
+    if _isSetBased(engine):
+        template = _getSetBasedPrefix(product_search, engine) + _SQL_CATEGORY_SUFFIX
+    else:
+        template = SQL_SELECT_PREFIX_CATEGORY
+    
+    return template.format(category_column_name=product_search.category_type.value)
+
 #------------------------------------------------------
 # Attatch the order by clause to the given sql statement
 #------------------------------------------------------
@@ -95,8 +423,8 @@ def _getOrderByStmt(prefix: str, sorting: Sorting) -> str:
 #------------------------------------------------------
 # Get the parms tuple for selecting category command
 #------------------------------------------------------
-def _getSelectAllCategoryParms(product_search: models.ProductSearchRequestCategory) -> tuple:
-    select_all_tuple = _getSelectAllParms(product_search)
+def _getSelectAllCategoryParms(product_search: models.ProductSearchRequestCategory, engine: SearchEngines) -> tuple:
+    select_all_tuple = _getSelectAllParms(product_search, engine)
     parms = [*select_all_tuple, product_search.category_id]
 
     return tuple(parms)
@@ -104,15 +432,56 @@ def _getSelectAllCategoryParms(product_search: models.ProductSearchRequestCatego
 #------------------------------------------------------
 # Get the parms tuple for selecting all
 #------------------------------------------------------
-def _getSelectAllParms(product_search: models.ProductSearchRequest) -> tuple:
-    parms = (
-        product_search.location_id, 
-        product_search.starts_on, 
-        product_search.ends_on
-    )
+def _getSelectAllParms(product_search: models.ProductSearchRequest, engine: SearchEngines) -> tuple:
+    if _isSetBased(engine):
+        parms = (
+            product_search.location_id, 
+            *_getBoundingBoxParms(product_search, engine),
+            *_getAvailabilityParms(product_search),
+        )
+    else:
+        parms = (
+            product_search.location_id, 
+            product_search.starts_on, 
+            product_search.ends_on
+        )
 
     return parms
 
+#------------------------------------------------------
+# Get the parms for the set-based availability predicate
+#------------------------------------------------------
+def _getAvailabilityParms(product_search: models.ProductSearchRequest) -> tuple:
+    if product_search.blocked_product_ids is not None:
+        return tuple(product_search.blocked_product_ids)
+    else:
+        return (product_search.ends_on, product_search.starts_on)
+
+#------------------------------------------------------
+# Get the parms for the set-based bounding box predicate
+#------------------------------------------------------
+def _getBoundingBoxParms(product_search: models.ProductSearchRequest, engine: SearchEngines) -> tuple:
+    if product_search.bounding_box is None:
+        return tuple()
+    elif engine == SearchEngines.SPATIAL:
+        return (_getBoundingBoxPolygon(product_search.bounding_box),)
+    else:
+        return tuple(product_search.bounding_box)
+
+#------------------------------------------------------
+# Get the WKT polygon (lng lat order) of a (min lat, max lat, min lng, max lng) box
+#------------------------------------------------------
+def _getBoundingBoxPolygon(bounding_box: tuple) -> str:
+    lat_min, lat_max, lng_min, lng_max = bounding_box
 
+    corners = [
+        (lng_min, lat_min),
+        (lng_max, lat_min),
+        (lng_max, lat_max),
+        (lng_min, lat_max),
+        (lng_min, lat_min),
+    ]
 
+    points = ','.join(f'{lng:.7f} {lat:.7f}' for lng, lat in corners)
 
+    return f'POLYGON(({points}))'
@@ -5,9 +5,9 @@ Users repository
 """
 from __future__ import annotations
 
-import pymysql.commands as sql_engine
+from api_wmiys.db import commands as sql_engine
 from pymysql.structs import DbOperationResult
-from pymysql.connection import ConnectionPrepared
+from api_wmiys.db.connection import ConnectionPrepared
 
 from api_wmiys.domain import models
 
@@ -20,7 +20,7 @@ SQL_UPDATE = '''
     UPDATE Users 
     SET
         email      = %s,
-        password   = %s,
+        password   = COALESCE(%s, password),
         name_first = %s,
         name_last  = %s,
         birth_date = %s
@@ -46,6 +46,7 @@ def select(user: models.User) -> DbOperationResult:
 
 #------------------------------------------------------
 # Update the database's user record to the field values provided in the given User domain model
+# (the password is left as is when it's None)
 #------------------------------------------------------
 def update(user: models.User) -> DbOperationResult:
     parms = (
@@ -14,4 +14,5 @@ from . import balance_transfers as balance_transfers
 from . import password_resets as password_resets
 from . import requests_received as requests_received
 from . import requests_submitted as requests_submitted
+from . import metrics as metrics
 from . import test as test
\ No newline at end of file
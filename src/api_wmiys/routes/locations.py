@@ -11,6 +11,14 @@ from api_wmiys.services import locations as location_services
 bp_locations = flask.Blueprint('locationsBP', __name__)
 
 
+#----------------------------------------------------------
+# Get a batch of locations (?ids=1,2,3)
+#----------------------------------------------------------
+@bp_locations.get('')
+@security.login_required
+def getLocationsBatch():
+    return location_services.response_GET_BATCH()
+
 #----------------------------------------------------------
 # Get a single location
 #----------------------------------------------------------
@@ -18,3 +26,19 @@ bp_locations = flask.Blueprint('locationsBP', __name__)
 @security.login_required
 def getLocations(location_id: int):
     return location_services.response_GET(location_id)
+
+#----------------------------------------------------------
+# Get the ids of all the locations within a radius of a location
+#----------------------------------------------------------
+@bp_locations.get('<int:location_id>/radius')
+@security.login_required
+def getLocationsInRadius(location_id: int):
+    return location_services.response_GET_RADIUS(location_id)
+
+#----------------------------------------------------------
+# Get a page of the locations within a radius of a location, closest first
+#----------------------------------------------------------
+@bp_locations.get('<int:location_id>/nearby')
+@security.login_required
+def getNearbyLocations(location_id: int):
+    return location_services.response_GET_NEARBY(location_id)
@@ -9,6 +9,7 @@ from http import HTTPStatus
 import flask
 
 from api_wmiys.common import security
+from api_wmiys.common import tokens
 from api_wmiys.services import users as user_services
 
 
@@ -36,5 +37,8 @@ def loginRoute():
 
     # return the user data to the client
     user_output_view = user_services.getUserView(user_id)
+
+    # along with an access token to use instead of the email/password
+    user_output_view['access_token'] = tokens.createToken(user_id, email)
     
     return flask.jsonify(user_output_view)
@@ -0,0 +1,19 @@
+"""
+Package:        metrics
+Url Prefix:     /metrics
+Description:    Routing for the worker process metrics (disabled unless METRICS_ENABLED is set)
+"""
+
+import flask
+from api_wmiys.common import security
+from api_wmiys.services import metrics as metrics_services
+
+bp_metrics = flask.Blueprint('bp_metrics', __name__)
+
+#------------------------------------------------------
+# Get the current worker process's metrics
+#------------------------------------------------------
+@bp_metrics.get('')
+@security.no_external_requests
+def get():
+    return metrics_services.responses_GET()
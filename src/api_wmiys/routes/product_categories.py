@@ -16,14 +16,7 @@ bp_product_categories = flask.Blueprint('product_categories', __name__)
 #------------------------------------------------------
 @bp_product_categories.get('')
 def productCatgories():
-    seperateFlag = flask.request.args.get('seperate')
-
-    if not seperateFlag:
-        return flask.jsonify(product_categories_services.getAll())
-
-    
-    seperateCategories = product_categories_services.getAllSeperate()
-    return flask.jsonify(seperateCategories)
+    return product_categories_services.response_GET_ALL()
 
 
 #------------------------------------------------------
@@ -4,20 +4,38 @@
 Balance transfers occur when a lender wants to transfer their earnings to their bank account.
 Lenders need to have a balance greater than 1 in order to successfully transfer their balance.
 
+Transfers are either requested by the lender (POST /balance-transfers) or sent by the scheduled
+payout job (flask send-payouts) to every lender with at least PAYOUT_MIN_BALANCE. Both reserve
+the balance in the database before calling stripe (see repository.balance_transfers), so the
+same balance is never paid out twice.
+
 **********************************************************************************************
 """
 
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import uuid
 import flask
 
 from wmiys_common import utilities
 from api_wmiys import payments
 from api_wmiys.common import responses
 from api_wmiys.domain import models
+from api_wmiys.domain.enums.payments import BalanceTransferStatus
 from api_wmiys.repository import balance_transfers as balance_transfers_repo
+from api_wmiys.repository import lender_ledgers as lender_ledgers_repo
 from api_wmiys.services import users as user_services
 
+# smallest balance that can be transferred
+MIN_BALANCE = 1
+
+# scheduled payout options (set by api_wmiys.configurePayouts)
+PAYOUT_MIN_BALANCE         = 25
+PAYOUT_CONCURRENCY         = 4
+STALE_PENDING_SECONDS      = 900
+STALE_PENDING_MAX_SECONDS  = 23 * 3600
+
 
 #------------------------------------------------------
 # Create a new balance transfer
@@ -29,11 +47,14 @@ def responses_POST() -> flask.Response:
         # validate the model before anything else
         _validateModel(balance_transfer)
 
+        # take the user's balance out of their ledger (committed before stripe is called)
+        balance_transfer = _reserveTransfer(balance_transfer.user_id)
+
         # send the user's funds to them using stripe
-        balance_transfer.transfer_id = _sendTransfer(balance_transfer)
+        sent, failed = _sendTransfers([balance_transfer])
 
-        # record the transfer in the database
-        _saveTransferToDatabase(balance_transfer)
+        if failed:
+            raise Exception('The transfer could not be sent')
     
     except Exception as e:
         return responses.badRequest(str(e))
@@ -70,38 +91,153 @@ def _getUserStats() -> dict:
 #------------------------------------------------------
 # Validate the given BalanceTransfer:
 #   - client has a stripe account set up
-#   - client has a lender balance greater than 1
+#
+# The balance is checked by the reservation (entries that just matured count too).
 #------------------------------------------------------
 def _validateModel(balance_transfer: models.BalanceTransfer):
     if not balance_transfer.destination_account_id:
         raise Exception('Stripe account is not setup.')
-    elif balance_transfer.amount < 1:
+
+#------------------------------------------------------
+# Reserve a transfer of the user's current balance (at least MIN_BALANCE).
+# The reservation is committed on its own connection, outside of the request's transaction.
+#------------------------------------------------------
+def _reserveTransfer(user_id: int) -> models.BalanceTransfer:
+    db_result = lender_ledgers_repo.matureEntries(user_id)
+
+    if not db_result.successful:
+        raise db_result.error
+
+    db_result = balance_transfers_repo.reserve(MIN_BALANCE, user_id=user_id)
+
+    if not db_result.successful:
+        raise db_result.error
+
+    # balance too low (or another transfer took it in the meantime)
+    if not db_result.data:
         raise Exception('Insufficient funds')
 
+    return db_result.data[0]
+
 
 #------------------------------------------------------
-# Send the BalanceTransfer to Stripe and transfer the amount
-# Returns the stripe.Transfer id
+# Pay out the balance of every lender with at least PAYOUT_MIN_BALANCE (flask send-payouts).
+#
+# Transfers left pending by a previous run that died are sent again first (with the same
+# idempotency key). The ones that are too old to be sent again are looked up in stripe.
+# Returns a summary of the run.
 #------------------------------------------------------
-def _sendTransfer(balance_transfer: models.BalanceTransfer) -> str:
-    result = payments.sendBalanceTransfer(balance_transfer)
+def sendScheduledPayouts() -> dict:
+    batch_id = uuid.uuid4()
 
-    if not result.successful:
-        raise result.error
+    db_result = lender_ledgers_repo.matureEntries()
+
+    if not db_result.successful:
+        raise db_result.error
+
+    reconciled_sent, reconciled_failed, unresolved = _reconcileExpiredTransfers()
+
+    db_result = balance_transfers_repo.selectStalePending(STALE_PENDING_SECONDS, STALE_PENDING_MAX_SECONDS)
+
+    if not db_result.successful:
+        raise db_result.error
+
+    stale_transfers = db_result.data
+
+    db_result = balance_transfers_repo.reserve(PAYOUT_MIN_BALANCE, batch_id=batch_id)
+
+    if not db_result.successful:
+        raise db_result.error
+
+    reserved_transfers = db_result.data
+
+    sent, failed = _sendTransfers(stale_transfers + reserved_transfers, PAYOUT_CONCURRENCY)
+
+    return dict(
+        batch_id          = str(batch_id),
+        resent            = len(stale_transfers),
+        reserved          = len(reserved_transfers),
+        sent              = len(sent),
+        failed            = len(failed),
+        amount_sent       = sum(bt.amount for bt in sent),
+        reconciled_sent   = len(reconciled_sent),
+        reconciled_failed = len(reconciled_failed),
+        unresolved        = [str(bt.id) for bt in unresolved],
+    )
 
-    return result.data.id
 
 #------------------------------------------------------
-# Record the given BalanceTransfer object in the database
+# Settle the transfers that stayed pending for longer than STALE_PENDING_MAX_SECONDS
+# (the process that reserved them died, and no run resent them in time).
+#
+# Each one is looked up in stripe by the balance_transfer_id in its metadata:
+#   - found: stripe sent it, so it's marked as sent
+#   - not found: it was never sent, so it's marked as failed and its amount is put back
+#   - lookup failed: it's left pending for the next run
+#
+# Returns a tuple: (sent transfers, failed transfers, unresolved transfers)
 #------------------------------------------------------
-def _saveTransferToDatabase(balance_transfer: models.BalanceTransfer) -> bool:
-    db_result = balance_transfers_repo.insert(balance_transfer)
+def _reconcileExpiredTransfers() -> tuple[list, list, list]:
+    db_result = balance_transfers_repo.selectExpiredPending(STALE_PENDING_MAX_SECONDS)
+
+    if not db_result.successful:
+        raise db_result.error
+
+    sent       = []
+    failed     = []
+    unresolved = []
+
+    for balance_transfer in db_result.data:
+        result = payments.findBalanceTransfer(balance_transfer)
+
+        if not result.successful:
+            print(result.error)
+            unresolved.append(balance_transfer)
+        elif result.data:
+            balance_transfer.transfer_id = result.data.id
+            balance_transfer.status      = BalanceTransferStatus.SENT
+            sent.append(balance_transfer)
+        else:
+            balance_transfer.status = BalanceTransferStatus.FAILED
+            failed.append(balance_transfer)
+
+    db_result = balance_transfers_repo.recordResults(sent, failed)
 
     if not db_result.successful:
         raise db_result.error
 
-    return True
+    return (sent, failed, unresolved)
 
-        
 
+#------------------------------------------------------
+# Send the reserved transfers to stripe (up to concurrency at a time) and record the results.
+# Failed transfers are put back in the lenders' balances.
+#
+# Returns a tuple: (sent transfers, failed transfers)
+#------------------------------------------------------
+def _sendTransfers(balance_transfers: list[models.BalanceTransfer], concurrency: int=1) -> tuple[list, list]:
+    if concurrency > 1 and len(balance_transfers) > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(payments.sendBalanceTransfer, balance_transfers))
+    else:
+        results = [payments.sendBalanceTransfer(bt) for bt in balance_transfers]
+
+    sent   = []
+    failed = []
+
+    for balance_transfer, result in zip(balance_transfers, results):
+        if result.successful:
+            balance_transfer.transfer_id = result.data.id
+            balance_transfer.status      = BalanceTransferStatus.SENT
+            sent.append(balance_transfer)
+        else:
+            print(result.error)
+            balance_transfer.status = BalanceTransferStatus.FAILED
+            failed.append(balance_transfer)
+
+    db_result = balance_transfers_repo.recordResults(sent, failed)
+
+    if not db_result.successful:
+        raise db_result.error
 
+    return (sent, failed)
@@ -9,7 +9,7 @@ Services to gather all the client's data
 from __future__ import annotations
 from dataclasses import dataclass
 
-from pymysql.connection import ConnectionDict
+from api_wmiys.db.connection import ConnectionDict
 from pymysql.structs import DbOperationResult
 from api_wmiys.domain import models
 from api_wmiys.common import serializers
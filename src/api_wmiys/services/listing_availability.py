@@ -15,6 +15,7 @@ from api_wmiys.common import DateRangeValidator
 from api_wmiys.common import ValidationReturnCodes
 from api_wmiys.common.base_return import BaseReturn
 from api_wmiys.repository import listing_availability as listing_availability_repo
+from api_wmiys.indexes import availability as availability_calendar
 
 #----------------------------------------------------------
 # Check if a product is available for rent
@@ -110,6 +111,10 @@ def _validateModelDates(listing_availability: models.ProductListingAvailability)
 # Check if a product is available for rent
 #----------------------------------------------------------
 def _isProductAvailable(model: models.ProductListingAvailability) -> bool:
+    # no need to go to the database if the availability calendar already knows the dates are blocked
+    if _isBlockedInCalendar(model):
+        return False
+
     db_result = listing_availability_repo.select(model)
 
     if not db_result.successful:
@@ -130,8 +135,17 @@ def _isProductAvailable(model: models.ProductListingAvailability) -> bool:
 
     return result == SqlBool.TRUE
 
+#----------------------------------------------------------
+# Check the availability calendar for blackout days in the model's date range.
+# Only blackouts count, same as the database check, so both give the same answer.
+# False if it's either not blocked or the calendar could not answer.
+#----------------------------------------------------------
+def _isBlockedInCalendar(model: models.ProductListingAvailability) -> bool:
+    calendar = availability_calendar.getCalendar()
 
+    if not calendar:
+        return False
 
+    sources = (availability_calendar.RangeSources.BLACKOUT,)
 
-
-
+    return calendar.isBlocked(int(model.product_id), model.starts_on, model.ends_on, sources) == True
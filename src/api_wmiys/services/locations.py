@@ -8,23 +8,36 @@ Location services
 
 
 from __future__ import annotations
+import math
 
 import flask
+import numpy as np
 
 from api_wmiys.repository import locations as locations_repo
 from api_wmiys.domain import models
 from api_wmiys import common
+from api_wmiys.common import BaseReturn, caching
+from api_wmiys.common.pagination import getRequestPaginationParms, Pagination
+from api_wmiys.indexes import spatial, location_names
+
+# Cache-Control max-age of the location GET responses (set by api_wmiys.configureLocations)
+CACHE_MAX_AGE_SECONDS = 86400
+
+# max number of ids in a batch GET request
+MAX_BATCH_IDS = 100
+
+# fields of a location GET response (same as locations_repo.select)
+_LOCATION_FIELDS = ('id', 'city', 'state_id', 'state_name')
+
+# fields of a nearby location (same as Get_Locations_In_Range, plus distance)
+_NEARBY_FIELDS = ('id', 'city', 'state_id', 'state_name', 'lat', 'lng', 'population', 'ranking', 'county_name')
 
 #------------------------------------------------------
 # Respond to a GET request
 #------------------------------------------------------
 def response_GET(location_id: int) -> flask.Response:
-    location_model = models.Location(
-        id = location_id
-    )
+    result = _getLocations([location_id])
 
-    result = locations_repo.select(location_model)
-    
     # make sure sql command was successful and the location exists
     if not result.successful:
         return common.responses.badRequest(str(result.error))
@@ -32,7 +45,235 @@ def response_GET(location_id: int) -> flask.Response:
         return common.responses.notFound()
 
     # all good - return the location
-    return common.responses.get(result.data)
+    return common.responses.getCacheable(result.data[0], CACHE_MAX_AGE_SECONDS)
+
+#------------------------------------------------------
+# Respond to a batch GET request: the locations of the 'ids' url parm (comma separated).
+# The ones that exist are returned, in the requested order.
+#------------------------------------------------------
+def response_GET_BATCH() -> flask.Response:
+    try:
+        location_ids = _getIdsUrlParm()
+    except ValueError as ex:
+        return common.responses.badRequest(str(ex))
+
+    result = _getLocations(location_ids)
+
+    if not result.successful:
+        return common.responses.badRequest(str(result.error))
+
+    return common.responses.getCacheable(result.data, CACHE_MAX_AGE_SECONDS)
+
+#------------------------------------------------------
+# Get the 'ids' url parm (without duplicates).
+# Raises a ValueError if it's missing or invalid.
+#------------------------------------------------------
+def _getIdsUrlParm() -> list[int]:
+    ids_parm = flask.request.args.get('ids') or ''
+
+    try:
+        location_ids = [int(location_id) for location_id in ids_parm.split(',') if location_id.strip()]
+    except ValueError:
+        raise ValueError(r"Invalid url query parm: 'ids'")
+
+    location_ids = list(dict.fromkeys(location_ids))
+
+    if not location_ids:
+        raise ValueError(r"Missing required url query parm: 'ids'")
+    elif len(location_ids) > MAX_BATCH_IDS:
+        raise ValueError(f"Too many ids (max {MAX_BATCH_IDS})")
+
+    return location_ids
+
+#------------------------------------------------------
+# Get the locations of the given ids (the ones that exist, in the same order).
+# Served from the location names index (the shared snapshot), the database if it's not loaded.
+#------------------------------------------------------
+def _getLocations(location_ids: list[int]) -> BaseReturn:
+    index = location_names.getIndex()
+
+    if index is None:
+        return _getLocationsFromDatabase(location_ids)
+
+    locations = [index.getLocation(location_id, _LOCATION_FIELDS) for location_id in location_ids]
+
+    return BaseReturn(successful=True, data=[location for location in locations if location])
+
+#------------------------------------------------------
+# Get the locations of the given ids from the locations cache, and the database for the rest
+#------------------------------------------------------
+def _getLocationsFromDatabase(location_ids: list[int]) -> BaseReturn:
+    locations = {location_id: caching.locations.get(location_id) for location_id in location_ids}
+    missing_ids = [location_id for location_id, location in locations.items() if location is None]
+
+    if missing_ids:
+        generation = caching.locations.generation
+
+        if len(missing_ids) == 1:
+            db_result = locations_repo.select(models.Location(id=missing_ids[0]))
+            rows = [db_result.data] if db_result.data else []
+        else:
+            db_result = locations_repo.selectAllByIds(missing_ids)
+            rows = db_result.data or []
+
+        if not db_result.successful:
+            return BaseReturn(successful=False, error=db_result.error)
+
+        for row in rows:
+            caching.locations.set(row.get('id'), row, generation)
+            locations[row.get('id')] = row
+
+    # copies, so the cached rows can't be modified
+    output = [dict(locations[location_id]) for location_id in location_ids if locations.get(location_id)]
+
+    return BaseReturn(successful=True, data=output)
+
+
+#------------------------------------------------------
+# Respond to a GET radius request:
+# all the locations within the 'miles' url parm of the given location, closest first
+#------------------------------------------------------
+def response_GET_RADIUS(location_id: int) -> flask.Response:
+    miles = flask.request.args.get('miles', type=float)
+
+    if miles is None or miles < 0:
+        return common.responses.badRequest(r"Missing or invalid required url query parm: 'miles'")
+
+    try:
+        index = spatial.getIndex()
+    except Exception as ex:
+        print(ex)
+        return _responseGetRadiusFromDatabase(location_id, miles)
+
+    result = index.withinMilesOfLocation(location_id, miles)
+
+    if result is None:
+        return common.responses.notFound()
+
+    ids, distances = result
+    order = distances.argsort(kind='stable')
 
+    return _responseGetRadius(location_id, miles, ids[order].tolist())
 
+#------------------------------------------------------
+# GET radius response when the spatial index could not be loaded:
+# use the Locations.coordinates spatial index in the database instead
+#------------------------------------------------------
+def _responseGetRadiusFromDatabase(location_id: int, miles: float) -> flask.Response:
+    location_result = locations_repo.select(models.Location(id=location_id))
+
+    if not location_result.successful:
+        return common.responses.internal_error(str(location_result.error))
+    elif not location_result.data:
+        return common.responses.notFound()
+    
+    # the procedure takes whole miles: round up, then compare the exact distances like the index does
+    result = locations_repo.selectIdsWithinMiles(location_id, math.ceil(miles))
+
+    if not result.successful:
+        return common.responses.internal_error(str(result.error))
+
+    location_ids = [row.get('id') for row in result.data or [] if row.get('distance') <= miles]
+
+    return _responseGetRadius(location_id, miles, location_ids)
+
+#------------------------------------------------------
+# GET radius response body
+#------------------------------------------------------
+def _responseGetRadius(location_id: int, miles: float, location_ids: list[int]) -> flask.Response:
+    output = dict(
+        location_id  = location_id,
+        miles        = miles,
+        location_ids = location_ids,
+    )
+
+    return common.responses.get(output)
+
+
+#------------------------------------------------------
+# Respond to a GET nearby request:
+# a page of the locations within the 'miles' url parm of the given location, closest first.
+#
+# Same results as the Get_Locations_In_Range procedure (distances are rounded to whole miles
+# before they are compared), but computed in one vectorized pass over the spatial index.
+#------------------------------------------------------
+def response_GET_NEARBY(location_id: int) -> flask.Response:
+    miles = flask.request.args.get('miles', type=float)
+
+    if miles is None or miles < 0:
+        return common.responses.badRequest(r"Missing or invalid required url query parm: 'miles'")
+
+    pagination = getRequestPaginationParms()
+    names_index = location_names.getIndex()
+
+    try:
+        spatial_index = spatial.getIndex()
+    except Exception as ex:
+        print(ex)
+        spatial_index = None
+
+    if spatial_index is None or names_index is None:
+        return _responseGetNearbyFromDatabase(location_id, miles, pagination)
+
+    # anything under miles + 0.5 can round down to miles
+    result = spatial_index.withinMilesOfLocation(location_id, miles + 0.5)
+
+    if result is None:
+        return common.responses.notFound()
+
+    ids, distances = result
+    distances = np.floor(distances + 0.5)       # MySQL ROUND (distances are never negative)
+    mask = distances <= miles
+    ids, distances = ids[mask], distances[mask]
+
+    # closest first, then by id so the pages are stable
+    order = np.lexsort((ids, distances))
+    page_order = order[pagination.offset:pagination.offset + pagination.per_page]
+
+    locations = []
+
+    for nearby_id, distance in zip(ids[page_order].tolist(), distances[page_order].tolist()):
+        location = names_index.getLocation(nearby_id, _NEARBY_FIELDS)
+
+        # the indexes were loaded at different times
+        if location is None:
+            continue
+
+        location['distance'] = int(distance)
+        locations.append(location)
+
+    return _responseGetNearby(locations, int(ids.size), pagination)
+
+#------------------------------------------------------
+# GET nearby response when the indexes could not be loaded: page the stored procedure's result
+#------------------------------------------------------
+def _responseGetNearbyFromDatabase(location_id: int, miles: float, pagination: Pagination) -> flask.Response:
+    location_result = locations_repo.select(models.Location(id=location_id))
+
+    if not location_result.successful:
+        return common.responses.internal_error(str(location_result.error))
+    elif not location_result.data:
+        return common.responses.notFound()
+
+    # the procedure takes whole miles: round up, then filter on the rounded distances like the index does
+    result = locations_repo.selectAllWithinMiles(location_id, math.ceil(miles))
+
+    if not result.successful:
+        return common.responses.internal_error(str(result.error))
+
+    rows = [row for row in result.data or [] if row.get('distance') <= miles]
+    rows = sorted(rows, key=lambda row: (row.get('distance'), row.get('id')))
+    locations = rows[pagination.offset:pagination.offset + pagination.per_page]
+
+    return _responseGetNearby(locations, len(rows), pagination)
+
+#------------------------------------------------------
+# GET nearby response body (same layout as the product searches)
+#------------------------------------------------------
+def _responseGetNearby(locations: list[dict], total_records: int, pagination: Pagination) -> flask.Response:
+    output = dict(
+        pagination = pagination.getPaginationResponse(total_records),
+        results    = locations,
+    )
 
+    return common.responses.get(output)
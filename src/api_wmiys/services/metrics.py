@@ -0,0 +1,52 @@
+"""
+**********************************************************************************************
+
+Metrics of the current worker process: operation latency histograms (stripe calls, ...),
+database pool, caches, and the payment outbox worker.
+
+Each mod_wsgi process has its own, so a response only describes the process that handled it
+(the pid is included).
+
+**********************************************************************************************
+"""
+
+from __future__ import annotations
+import os
+
+import flask
+
+from api_wmiys import db
+from api_wmiys.common import responses, caching, metrics
+from api_wmiys.payments import outbox as payment_outbox
+
+
+#------------------------------------------------------
+# Get the current process's metrics
+#------------------------------------------------------
+def responses_GET() -> flask.Response:
+    if not metrics.ENABLED:
+        return responses.notFound()
+
+    output = dict(
+        pid            = os.getpid(),
+        latencies      = metrics.getStats(),
+        db_pool        = db.pool.getPool().getStats(),
+        caches         = dict(
+            search_products = caching.search_products.getStats(),
+            credentials     = caching.credentials.getStats(),
+        ),
+        payment_outbox = _getPaymentOutboxStats(),
+    )
+
+    return responses.get(output)
+
+#------------------------------------------------------
+# Stats of the process's payment outbox worker (None if it's not running)
+#------------------------------------------------------
+def _getPaymentOutboxStats() -> dict | None:
+    worker = payment_outbox.getWorker()
+
+    if worker is None:
+        return None
+
+    return worker.getStats()
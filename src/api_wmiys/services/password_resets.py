@@ -28,6 +28,8 @@ import flask
 from api_wmiys.domain import models
 from api_wmiys.repository import password_resets as password_resets_repo
 from api_wmiys.common import responses
+from api_wmiys.common import caching
+from api_wmiys.db import session as db_session
 from wmiys_common import utilities
 
 
@@ -63,6 +65,9 @@ def responses_PUT(password_reset_id: UUID) -> flask.Response:
     if db_result.data != 1:
         return responses.notFound()
 
+    # the user's old password can't be used anymore (the reset does not say which user it was)
+    db_session.onCommit(caching.credentials.clear)
+
     return responses.updated()
 
 
@@ -18,7 +18,10 @@ from wmiys_common import utilities
 from api_wmiys.repository import product_availability as product_availability_repo
 from api_wmiys.common import responses
 from api_wmiys.common import serializers
+from api_wmiys.common import caching
+from api_wmiys.db import session as db_session
 from api_wmiys.domain import models
+from api_wmiys.indexes import availability as availability_calendar
 
 
 #----------------------------------------------------------
@@ -92,6 +95,16 @@ def _standardModifyResponse(modify_parms: ModifyRequestParms) -> flask.Response:
     if not result.successful:
         return responses.badRequest(str(result.error))
 
+    # keep the worker's availability calendar in sync
+    availability_calendar.setBlackout(
+        product_availability_id = product_availability.id,
+        product_id              = product_availability.product_id,
+        starts_on               = product_availability.starts_on,
+        ends_on                 = product_availability.ends_on,
+    )
+
+    db_session.onCommit(caching.search_products.clear)
+
     return _standardViewReturn(modify_parms.product_availability_id, modify_parms.responses_callback)
 
 #----------------------------------------------------------
@@ -163,8 +176,11 @@ def responses_DELETE(product_availability_id) -> flask.Response:
         return responses.badRequest(str(db_result.error))
     elif not db_result.data:
         return responses.notFound()
-    else:
-        return responses.deleted()
+    
+    availability_calendar.removeBlackout(product_availability_id)
+    db_session.onCommit(caching.search_products.clear)
+
+    return responses.deleted()
 
 
 
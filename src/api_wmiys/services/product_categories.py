@@ -2,17 +2,84 @@
 **********************************************************************************************
 This class handles all the product-category requests.
 All products must be assigned a specific sub-category id.
+
+The whole category hierarchy is built once per process into a CategoryTree: the flat
+(All_Categories), separated (major/minor/sub lists) and nested forms, already encoded as json,
+with a version hash that is used as their ETag.
+
+Categories barely ever change, so the tree is only rebuilt when the fingerprint of the
+category tables changes (checked every FINGERPRINT_CHECK_SECONDS at most).
 **********************************************************************************************
 """
 
 from __future__ import annotations
+import hashlib
+import json
+import threading
+import time
+
+import flask
 
 from api_wmiys.repository import product_categories as repo
+from api_wmiys.common import responses
+
+# min number of seconds between 2 checks of the category tables' fingerprint
+FINGERPRINT_CHECK_SECONDS = 60
+
+# Cache-Control max-age of the category tree responses (clients revalidate with the ETag after)
+CACHE_MAX_AGE_SECONDS = 300
+
+
+class CategoryTree:
+
+    #------------------------------------------------------
+    # Constructor
+    #
+    # Parms:
+    #   - categories: All_Categories rows
+    #   - fingerprint: the category tables' fingerprint when the rows were selected
+    #------------------------------------------------------
+    def __init__(self, categories: list[dict], fingerprint: str):
+        self.fingerprint = fingerprint
+        self.checked_at  = time.monotonic()
+
+        self.flat      = _encode(categories)
+        self.separated = _encode(_separate(categories))
+        self.nested    = _encode(_nest(categories))
+
+        self.version = hashlib.sha256(self.flat).hexdigest()[:32]
+
+    #------------------------------------------------------
+    # Check if the fingerprint is due for a check
+    #------------------------------------------------------
+    def isCheckDue(self, check_seconds: float) -> bool:
+        return (time.monotonic() - self.checked_at) > check_seconds
+
+
+#------------------------------------------------------
+# Respond to a GET all request: the categories in the form of the url parms
+# ('seperate' or 'nested', flat by default)
+#------------------------------------------------------
+def response_GET_ALL() -> flask.Response:
+    try:
+        tree = getTree()
+    except Exception as ex:
+        print(ex)
+        return responses.internal_error(str(ex))
+
+    if flask.request.args.get('seperate'):
+        body, variant = tree.separated, 'separated'
+    elif flask.request.args.get('nested'):
+        body, variant = tree.nested, 'nested'
+    else:
+        body, variant = tree.flat, 'flat'
+
+    return responses.getCacheableJson(body, f'{tree.version}-{variant}', CACHE_MAX_AGE_SECONDS)
 
 #------------------------------------------------------
 # Returns all categories
 #------------------------------------------------------
-def getAll() -> dict:
+def getAll() -> list[dict]:
     return _getProductCategories()
 
 
@@ -20,31 +87,141 @@ def getAll() -> dict:
 # Fetch all the product category records, and split them up into different levels
 #------------------------------------------------------
 def getAllSeperate() -> dict:
-    category_record_table = _getProductCategories()
+    return _separate(_getProductCategories())
 
-    majors = []
-    minors = []
-    subs = []
+#------------------------------------------------------
+# Split the category records up into the different levels (each category only once, first seen order)
+#------------------------------------------------------
+def _separate(categories: list[dict]) -> dict:
+    majors = {}
+    minors = {}
+    subs = {}
+
+    for category in categories:
+        majors.setdefault(category.get('major_id'), dict(id=category.get('major_id'), name=category.get('major_name')))
+        minors.setdefault(category.get('minor_id'), dict(id=category.get('minor_id'), name=category.get('minor_name'), parent_id=category.get('major_id')))
+        subs.setdefault(category.get('sub_id'), dict(id=category.get('sub_id'), name=category.get('sub_name'), parent_id=category.get('minor_id')))
+
+    return dict(major=list(majors.values()), minor=list(minors.values()), sub=list(subs.values()))
+
+#------------------------------------------------------
+# Nest the category records: majors -> minors -> subs
+#------------------------------------------------------
+def _nest(categories: list[dict]) -> list[dict]:
+    majors = {}
+    minors = {}
+
+    for category in categories:
+        major = majors.get(category.get('major_id'))
 
-    for category in category_record_table:
-        major = dict(id=category.get('major_id'), name=category.get('major_name'))
-        minor = dict(id=category.get('minor_id'), name=category.get('minor_name'), parent_id=category.get('major_id'))
-        sub = dict(id=category.get('sub_id'), name=category.get('sub_name'), parent_id=category.get('minor_id'))
-        
-        if major not in majors:
-            majors.append(major)
-        if minor not in minors:
-            minors.append(minor)
-        if sub not in subs:
-            subs.append(sub)
+        if major is None:
+            major = dict(id=category.get('major_id'), name=category.get('major_name'), minors=[])
+            majors[major['id']] = major
 
-    return dict(major=majors, minor=minors, sub=subs)
+        minor = minors.get(category.get('minor_id'))
+
+        if minor is None:
+            minor = dict(id=category.get('minor_id'), name=category.get('minor_name'), subs=[])
+            minors[minor['id']] = minor
+            major['minors'].append(minor)
+
+        minor['subs'].append(dict(id=category.get('sub_id'), name=category.get('sub_name')))
+
+    return list(majors.values())
+
+#------------------------------------------------------
+# Encode a response body
+#------------------------------------------------------
+def _encode(output) -> bytes:
+    return json.dumps(output, separators=(',', ':'), sort_keys=True, default=str).encode()
 
 #------------------------------------------------------
 # Get all the product categories
 #------------------------------------------------------
 def _getProductCategories() -> list[dict]:
-    return repo.selectAll().data
+    db_result = repo.selectAll()
+
+    if not db_result.successful:
+        raise db_result.error
+
+    return db_result.data or []
+
+#------------------------------------------------------
+# Get the category tables' fingerprint
+#------------------------------------------------------
+def _getFingerprint() -> str:
+    db_result = repo.selectFingerprint()
+
+    if not db_result.successful:
+        raise db_result.error
+
+    return json.dumps(db_result.data, sort_keys=True, default=str)
+
+
+
+#------------------------------------------------------
+# Worker process category tree instance
+#------------------------------------------------------
+
+_tree: CategoryTree = None
+_tree_lock = threading.Lock()
+
+
+#------------------------------------------------------
+# Get the process's category tree.
+# It's built on first use, and rebuilt when the category tables changed since then.
+# A stale tree is still used if the check or the rebuild fails.
+#------------------------------------------------------
+def getTree() -> CategoryTree:
+    tree = _tree
+
+    if tree is None:
+        return refresh()
+    elif not tree.isCheckDue(FINGERPRINT_CHECK_SECONDS):
+        return tree
+
+    try:
+        with _tree_lock:
+            # another thread may have just checked it
+            if _tree.isCheckDue(FINGERPRINT_CHECK_SECONDS):
+                _checkFingerprint()
+
+    except Exception as ex:
+        print(ex)
+
+    return _tree
+
+#------------------------------------------------------
+# (Re)build the category tree from the database
+#------------------------------------------------------
+def refresh() -> CategoryTree:
+    global _tree
+
+    with _tree_lock:
+        _tree = _build()
+
+    return _tree
+
+#------------------------------------------------------
+# Rebuild the tree if the fingerprint changed (call with the lock held)
+#------------------------------------------------------
+def _checkFingerprint():
+    global _tree
+
+    fingerprint = _getFingerprint()
+
+    if fingerprint != _tree.fingerprint:
+        _tree = _build(fingerprint)
+    else:
+        _tree.checked_at = time.monotonic()
+
+#------------------------------------------------------
+# Build a category tree. The fingerprint is read before the rows, so a change
+# made in between only causes an extra rebuild at the next check.
+#------------------------------------------------------
+def _build(fingerprint: str=None) -> CategoryTree:
+    fingerprint = fingerprint or _getFingerprint()
+    return CategoryTree(_getProductCategories(), fingerprint)
 
 #------------------------------------------------------
 # Retrieve all major categories
@@ -21,13 +21,16 @@ from enum import Enum, auto
 import flask
 
 from wmiys_common import utilities
-from api_wmiys import payments
+from api_wmiys.payments import outbox as payment_outbox
 from api_wmiys.domain import models
 from api_wmiys.domain.enums.product_requests import RequestStatus, LenderRequestResponse
-from api_wmiys.common import responses, serializers
-from api_wmiys.common.base_return import BaseReturn
+from api_wmiys.domain.enums.payments import PaymentActions
+from api_wmiys.common import responses, serializers, caching
+from api_wmiys.db import session as db_session
+from api_wmiys.indexes import availability as availability_calendar
 from api_wmiys.services.product_requests import requests as requests_services
 from api_wmiys.repository.product_requests import received as requests_received_repo
+from api_wmiys.repository import lender_ledgers as lender_ledgers_repo
 
 
 # Validation return codes for validating a request response from the lender
@@ -54,6 +57,10 @@ def responses_POST() -> flask.Response:
     if not db_result.successful:
         return responses.badRequest(str(db_result.error))
 
+    # the new pending request blocks its payment's date range
+    availability_calendar.refreshRequest(pr.id)
+    db_session.onCommit(caching.search_products.clear)
+
     output = _getView(pr.id)
 
     return responses.created(output)
@@ -191,18 +198,36 @@ def responses_POST_STATUS(request_id: UUID, status: str) -> flask.Response:
     new_status = _getRequestStatusFromResponse(LenderRequestResponse(status))
     pr = _getBaselineModelResponsed(pr_internal, new_status)
 
-    # process the payment
-    payment_result = _processPayment(pr)
-
-    # if not payment_result.successful:
-        # return responses.badRequest(str(payment_result.error))
-
     # update the database
     update_db_result = requests_services.update(pr)
 
     if not update_db_result.successful:
         return responses.badRequest(str(update_db_result.error))
 
+    # the payment outbox worker captures/cancels the payment once this is committed
+    payment_db_result = payment_outbox.enqueue(pr.id, pr.session_id, _getPaymentAction(pr))
+
+    if not payment_db_result.successful:
+        return responses.internal_error(str(payment_db_result.error))
+
+    # the lender earns the payout of an accepted request
+    if pr.status == RequestStatus.ACCEPTED:
+        ledger_db_result = lender_ledgers_repo.addRequest(pr.id)
+
+        if not ledger_db_result.successful:
+            return responses.internal_error(str(ledger_db_result.error))
+
+    # accepted requests keep blocking the range, denied ones free it up
+    availability_calendar.setRequest(
+        product_request_id = pr.id,
+        product_id         = pr_internal.payment.product_id,
+        starts_on          = pr_internal.payment.starts_on,
+        ends_on            = pr_internal.payment.ends_on,
+        status             = pr.status,
+    )
+
+    db_session.onCommit(caching.search_products.clear)
+
     # return the view
     view = requests_received_repo.select(pr.id, flask.g.client_id).data
     
@@ -277,23 +302,11 @@ def _getRequestStatusFromResponse(reply: LenderRequestResponse) -> RequestStatus
 
 
 #-----------------------------------------------------
-# Capture or cancel the given request's payment
+# Accepted requests get their payment captured, the others canceled
 #-----------------------------------------------------
-def _processPayment(product_request: models.ProductRequest) -> BaseReturn:
-    result = BaseReturn(successful=True)
-
-    # determine which payment method to utilize
+def _getPaymentAction(product_request: models.ProductRequest) -> PaymentActions:
     if product_request.status == RequestStatus.ACCEPTED:
-        payment_capture_method = payments.capturePayment
+        return PaymentActions.CAPTURE
     else:
-        payment_capture_method = payments.cancelPayment
-
-    # try executing it
-    try:
-        result.data = payment_capture_method(product_request.session_id)
-    except Exception as e:
-        result.successful = False
-        result.error = e
-
-    return result
+        return PaymentActions.CANCEL
 
@@ -17,6 +17,8 @@ from .. import common
 from api_wmiys.repository import products as proudcts_repo
 from api_wmiys.domain import models
 from api_wmiys.common import serializers
+from api_wmiys.common import caching
+from api_wmiys.db import session as db_session
 
 
 #------------------------------------------------------
@@ -52,10 +54,19 @@ def response_PUT(product_id) -> flask.Response:
     
     if not db_result.successful:
         return common.responses.badRequest(str(db_result.error))
+
+    db_session.onCommit(_clearSearchCaches)
     
     # now, fetch the product from the database to get its updated data and to make sure the user owns it
     return _standardSingleProductReturn(product_id, common.responses.updated)
 
+#------------------------------------------------------
+# Clear the caches that depend on the products (called once the write is committed)
+#------------------------------------------------------
+def _clearSearchCaches():
+    caching.search_products.clear()
+    caching.max_dropoff_distance.clear()
+
 #------------------------------------------------------
 # Create a new product
 #------------------------------------------------------
@@ -72,6 +83,8 @@ def response_POST() -> flask.Response:
     if not repository_result.successful:
         return common.responses.badRequest(repository_result.error)
 
+    db_session.onCommit(_clearSearchCaches)
+
     # now return the newly created product
     return _standardSingleProductReturn(new_product.id, common.responses.created)
 
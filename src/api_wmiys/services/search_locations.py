@@ -8,8 +8,12 @@ from __future__ import annotations
 import flask
 from api_wmiys.common import responses
 from api_wmiys.domain import models
-from api_wmiys.domain.enums.search_locations import PerPageLimits
+from api_wmiys.domain.enums.search_locations import PerPageLimits, SearchLocationsEngines
 from api_wmiys.repository import seach_locations as search_locations_repo
+from api_wmiys.indexes import location_names
+
+# how the searches are executed (set by api_wmiys.configureSearchLocations)
+ENGINE = SearchLocationsEngines.PREFIX_INDEX
 
 #------------------------------------------------------
 # Location search url routing logic
@@ -37,6 +41,7 @@ def _getUrlQueryParms() -> models.SearchLocations:
     url_parms = models.SearchLocations(
         query    = _getQueryUrlParm(),
         per_page = _getPerPageUrlParm(),
+        fuzzy    = _getFuzzyUrlParm(),
     )
 
     return url_parms
@@ -48,6 +53,13 @@ def _getUrlQueryParms() -> models.SearchLocations:
 def _getQueryUrlParm() -> str | None:
     return flask.request.args.get('q') or None
 
+#------------------------------------------------------
+# Check if the client asked for a typo tolerant search ('fuzzy' url parm)
+#------------------------------------------------------
+def _getFuzzyUrlParm() -> bool:
+    fuzzy = flask.request.args.get('fuzzy') or ''
+    return fuzzy.lower() in ['true', '1', 'yes']
+
 #------------------------------------------------------
 # Get the per page ('per_page') url parm
 #
@@ -77,6 +89,33 @@ def _getPerPageUrlParm() -> int:
 # Fetch all the locations that fall within the search criteria
 #------------------------------------------------------
 def _getAllViews(url_parms: models.SearchLocations) -> list[dict]:
+    if url_parms.fuzzy:
+        return _getAllViewsFuzzy(url_parms)
+
+    if ENGINE == SearchLocationsEngines.PREFIX_INDEX:
+        index = location_names.getIndex()
+        location_views = index.search(url_parms.query, url_parms.per_page) if index else []
+
+        if location_views:
+            return location_views
+
+    return _getAllViewsFromDatabase(url_parms)
+
+#------------------------------------------------------
+# Fetch the locations that are the most similar to the (possibly misspelled) query
+#------------------------------------------------------
+def _getAllViewsFuzzy(url_parms: models.SearchLocations) -> list[dict]:
+    index = location_names.getIndex()
+
+    if index is None:
+        return _getAllViewsFromDatabase(url_parms)
+
+    return index.searchFuzzy(url_parms.query, url_parms.per_page)
+
+#------------------------------------------------------
+# Fetch the locations with the Search_Locations stored procedure
+#------------------------------------------------------
+def _getAllViewsFromDatabase(url_parms: models.SearchLocations) -> list[dict]:
     db_result = search_locations_repo.selectAll(url_parms)
 
     if not db_result.successful:
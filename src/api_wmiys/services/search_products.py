@@ -6,6 +6,24 @@ Doing a product search has a few steps involved since it utilizes pagination:
         
 The record count is needed becauase we need to calculate how many pages there are for the page_size.
 
+With the WINDOW count mode (see CountModes) both of these come from a single query: every row of
+the page has the total count in an extra column. The separate count query is only needed when the 
+requested page is past the last one (no rows to read the count from).
+
+Clients can use keyset pagination instead of page numbers by passing a 'cursor' url parm
+(empty for the first page). The response's pagination then has a 'next_cursor' value to pass 
+for the next page (null on the last page). The total count is only computed for the first page 
+and carried over in the cursor.
+
+Every result has the renter to lender 'distance' (miles), computed with the spatial index. 
+Sorting by distance ('sort=distance:asc' is nearest first) is done here instead of in sql:
+    - fetch only the id/location id of every matching product
+    - rank them by distance with a bounded heap (top offset + per_page)
+    - fetch the full records of just the page's products
+
+Results are cached (common.caching.search_products) by the normalized search request. Product, 
+product availability and product request writes clear that cache.
+
 For instance, let's say the product search results with no pagination would result in 75 records.
 The incoming request url parms indicate that they would like the response to have 20 records per page.
 The response would return that there are 4 total pages (1-4), 20 records (15 on the last) per page.
@@ -15,18 +33,32 @@ The response would return that there are 4 total pages (1-4), 20 records (15 on
 from __future__ import annotations
 from datetime import date
 from functools import wraps
+import heapq
+import math
 
 import flask
 
 from api_wmiys.common import SortingSearchProducts
 from api_wmiys.common import responses
 from api_wmiys.common.pagination import getRequestPaginationParms
+from api_wmiys.common.pagination import getRequestKeysetPaginationParms
+from api_wmiys.common.pagination import KeysetPagination
+from api_wmiys.common.pagination import Cursor
 from api_wmiys.common.base_return import FilteredDataReturn
 from api_wmiys.domain import models
 from api_wmiys.domain.enums.product_categories import ColumnNames
 from api_wmiys.domain.enums.product_categories import UrlCategoryNames
+from api_wmiys.domain.enums.search_products import CountModes
 from api_wmiys.repository import search_products as search_products_repo
 from api_wmiys.common import images
+from api_wmiys.common import caching
+from api_wmiys.indexes import availability as availability_calendar
+from api_wmiys.indexes import spatial
+
+
+# how the total record count is fetched (set in the app configuration)
+COUNT_MODE = CountModes.WINDOW
+
 
 #-----------------------------------------------------
 # Seach all major categories
@@ -64,12 +96,65 @@ def _responsesTemplate(url_parms, get_all_callback) -> flask.Response:
     # make sure all of the required ones are provided by the client
     if not _areRequiredParmsSet(url_parms):
         return responses.badRequest('Missing a required url query paramter.')
+    
+    if not _isCursorValid(url_parms):
+        return responses.badRequest('Invalid cursor.')
+
+    repo_result = _fetchCached(url_parms, get_all_callback)
+
+    return _returnFilteredDataResult(repo_result, _isKeysetPagination(url_parms))
 
-    repo_result = get_all_callback(url_parms)
+#-----------------------------------------------------
+# Run the fetch callback unless the result is already cached
+#-----------------------------------------------------
+def _fetchCached(url_parms, get_all_callback) -> FilteredDataReturn:
+    cache  = caching.search_products
+    key    = _getCacheKey(url_parms)
+    cached = cache.get(key)
+
+    if cached:
+        return _copyFilteredDataResult(cached)
+    
+    # grab the generation before the fetch so a write that happens during it discards the result
+    generation = cache.generation
+
+    _setPrefilters(url_parms)
+    result = get_all_callback(url_parms)
 
-    return _returnFilteredDataResult(repo_result)
+    if result.successful:
+        cache.set(key, _copyFilteredDataResult(result), generation)
+
+    return result
+
+#-----------------------------------------------------
+# Get the normalized cache key of the search request
+#-----------------------------------------------------
+def _getCacheKey(url_parms: models.ProductSearchRequest) -> tuple:
+    return (
+        str(url_parms.location_id),
+        url_parms.starts_on,
+        url_parms.ends_on,
+        getattr(url_parms, 'category_type', None),
+        str(getattr(url_parms, 'category_id', None)),
+        url_parms.sorting.field,
+        url_parms.sorting.type,
+        url_parms.pagination.page,
+        url_parms.pagination.per_page,
+        flask.request.args.get('cursor') if _isKeysetPagination(url_parms) else None,
+    )
 
 #-----------------------------------------------------
+# Copy the result so the cached rows are never modified by the response routines
+#-----------------------------------------------------
+def _copyFilteredDataResult(result: FilteredDataReturn) -> FilteredDataReturn:
+    return FilteredDataReturn(
+        successful    = result.successful,
+        data          = [dict(record) for record in result.data or []],
+        count_records = result.count_records,
+        count_pages   = result.count_pages,
+        next_cursor   = result.next_cursor,
+    )
+#-----------------------------------------------------
 # Gather all the request url parms to filter out the search results for a category search
 #-----------------------------------------------------
 def _getProductSearchRequestCategory(category_type: ColumnNames, category_id: int) -> models.ProductSearchRequestCategory:
@@ -94,7 +179,7 @@ def _getProductSearchRequest() -> models.ProductSearchRequest:
         location_id = flask.request.args.get('location_id') or None,
         starts_on   = date.fromisoformat(flask.request.args.get('starts_on')) or None,
         ends_on     = date.fromisoformat(flask.request.args.get('ends_on')) or None,
-        pagination  = getRequestPaginationParms(),
+        pagination  = _getPagination(),
         sorting     = SortingSearchProducts(SortingSearchProducts.ACCEPTABLE_FIELDS, 'name'),
     )
 
@@ -102,6 +187,97 @@ def _getProductSearchRequest() -> models.ProductSearchRequest:
     
     return result
 
+#-----------------------------------------------------
+# Set the prefilters of a validated search request: 
+# the products blocked during the range (availability calendar) and the bounding box.
+#-----------------------------------------------------
+def _setPrefilters(url_parms: models.ProductSearchRequest):
+    url_parms.blocked_product_ids = _getBlockedProductIds(url_parms)
+    url_parms.bounding_box        = _getBoundingBox(url_parms)
+
+#-----------------------------------------------------
+# Get the lat/lng box around the dropoff location that any product in range has to be in.
+# Its size is the largest dropoff distance of all the products.
+#
+# Returns None (no prefilter) if the spatial index or the max distance are not available.
+#-----------------------------------------------------
+def _getBoundingBox(url_parms: models.ProductSearchRequest) -> tuple | None:
+    try:
+        coordinates = spatial.getIndex().getCoordinates(int(url_parms.location_id))
+        max_miles   = _getMaxDropoffDistance()
+    except Exception as ex:
+        print(ex)
+        return None
+    
+    if coordinates is None or max_miles is None:
+        return None
+    
+    return spatial.getBoundingBox(coordinates[0], coordinates[1], float(max_miles))
+
+#-----------------------------------------------------
+# Get the largest dropoff distance of all the products.
+#
+# It's kept in its own cache (caching.max_dropoff_distance) that product writes clear.
+#-----------------------------------------------------
+def _getMaxDropoffDistance() -> int | None:
+    cache = caching.max_dropoff_distance
+    key   = ('max_dropoff_distance',)
+    miles = cache.get(key)
+
+    if miles is not None:
+        return miles
+    
+    generation = cache.generation
+    db_result  = search_products_repo.selectMaxDropoffDistance()
+
+    if not db_result.successful:
+        raise db_result.error
+    
+    miles = (db_result.data or {}).get('miles')
+    cache.set(key, miles, generation)
+
+    return miles
+
+#-----------------------------------------------------
+# Get the ids of the products that have a blackout during the search range.
+# Only the blackouts count, same as the database statements (SEARCH_PRODUCTS_FILTER / NOT EXISTS).
+# Returns None if the availability calendar cannot answer, in which case the database checks the ranges.
+#-----------------------------------------------------
+def _getBlockedProductIds(url_parms: models.ProductSearchRequest) -> list[int] | None:
+    if None in [url_parms.starts_on, url_parms.ends_on]:
+        return None
+
+    calendar = availability_calendar.getCalendar()
+
+    if not calendar:
+        return None
+
+    return calendar.getBlockedProductIds(url_parms.starts_on, url_parms.ends_on, (availability_calendar.RangeSources.BLACKOUT,))
+
+#-----------------------------------------------------
+# Get the keyset pagination if the client provided a 'cursor' url parm, otherwise page/per_page pagination.
+#-----------------------------------------------------
+def _getPagination():
+    if 'cursor' in flask.request.args:
+        return getRequestKeysetPaginationParms()
+    else:
+        return getRequestPaginationParms()
+
+#-----------------------------------------------------
+# Check if the search uses keyset pagination
+#-----------------------------------------------------
+def _isKeysetPagination(url_parms: models.ProductSearchRequest) -> bool:
+    return isinstance(url_parms.pagination, KeysetPagination)
+
+#-----------------------------------------------------
+# Make sure the cursor (if any) could be decoded and it was generated for the same sorting
+#-----------------------------------------------------
+def _isCursorValid(url_parms: models.ProductSearchRequest) -> bool:
+    if not _isKeysetPagination(url_parms):
+        return True
+    
+    return url_parms.pagination.isCursorValid(url_parms.sorting)
+
 #-----------------------------------------------------
 # Set the given SearchProductsUrlParms's sorting value to the one found in the request's url
 #-----------------------------------------------------
@@ -115,14 +291,28 @@ def _setSortingUrlParmsValue(url_parms: models.ProductSearchRequest):
 # Get all the product records and the pagination counts for all products
 #-----------------------------------------------------
 def _fetch(url_parms: models.ProductSearchRequest) -> FilteredDataReturn:
-    return _fetchTemplate(url_parms, _fetchRecords, _fetchCount)
+    if _isDistanceSort(url_parms):
+        return _fetchTemplate(url_parms, _fetchRecordsByDistance, _fetchCount)
+    elif _isKeysetPagination(url_parms):
+        return _fetchTemplate(url_parms, _fetchRecordsSeek, _fetchCount)
+    elif COUNT_MODE == CountModes.WINDOW:
+        return _fetchTemplate(url_parms, _fetchRecordsWithCount, _fetchCount)
+    else:
+        return _fetchTemplate(url_parms, _fetchRecords, _fetchCount)
 
 
 #-----------------------------------------------------
 # Get all the product records and the pagination counts for a category
 #-----------------------------------------------------
 def _fetchCategory(url_parms: models.ProductSearchRequestCategory) -> FilteredDataReturn:
-    return _fetchTemplate(url_parms, _fetchRecordsCategory, _fetchCountCategory)
+    if _isDistanceSort(url_parms):
+        return _fetchTemplate(url_parms, _fetchRecordsCategoryByDistance, _fetchCountCategory)
+    elif _isKeysetPagination(url_parms):
+        return _fetchTemplate(url_parms, _fetchRecordsCategorySeek, _fetchCountCategory)
+    elif COUNT_MODE == CountModes.WINDOW:
+        return _fetchTemplate(url_parms, _fetchRecordsCategoryWithCount, _fetchCountCategory)
+    else:
+        return _fetchTemplate(url_parms, _fetchRecordsCategory, _fetchCountCategory)
 
 
 #-----------------------------------------------------
@@ -132,14 +322,29 @@ def _fetchCategory(url_parms: models.ProductSearchRequestCategory) -> FilteredDa
 #     url_parms: either a ProductSearchRequest or ProductSearchRequestCategory
 #     fetch_records_callback: callback for a fetch records routine
 #     fetch_count_callback: fetch pagination count callback
+#
+# The records callback can return a (records, count) tuple when it got the count itself.
 #-----------------------------------------------------
 def _fetchTemplate(url_parms, fetch_records_callback, fetch_count_callback) -> FilteredDataReturn:
     result = FilteredDataReturn(successful=True)
     
     try:
-        result.data          = fetch_records_callback(url_parms)
-        result.count_records = fetch_count_callback(url_parms)
+        records     = fetch_records_callback(url_parms)
+        count       = None
+        next_cursor = None
+
+        if isinstance(records, tuple) and len(records) == 3:
+            records, count, next_cursor = records
+        elif isinstance(records, tuple):
+            records, count = records
+        
+        if count is None:
+            count = fetch_count_callback(url_parms)
+        
+        result.data          = records
+        result.count_records = count
         result.count_pages   = url_parms.pagination.totalPages(result.count_records)
+        result.next_cursor   = next_cursor
     
     except Exception as e:
         result.successful    = False
@@ -180,6 +385,76 @@ def _fetchRecords(url_parms: models.ProductSearchRequest) -> list[dict]:
 def _fetchRecordsCategory(url_parms: models.ProductSearchRequestCategory) -> list[dict]:
     return _fetchRecordsTemplate(url_parms, search_products_repo.selectAllCategory)
 
+#-----------------------------------------------------
+# Get all the filtered records and the total count (single query)
+#-----------------------------------------------------
+def _fetchRecordsWithCount(url_parms: models.ProductSearchRequest) -> tuple[list[dict], int | None]:
+    records = _fetchRecordsTemplate(url_parms, search_products_repo.selectAllWithTotalCount)
+    return _popTotalCount(url_parms, records)
+
+#-----------------------------------------------------
+# Get all the filtered records and the total count for a specific category (single query)
+#-----------------------------------------------------
+def _fetchRecordsCategoryWithCount(url_parms: models.ProductSearchRequestCategory) -> tuple[list[dict], int | None]:
+    records = _fetchRecordsTemplate(url_parms, search_products_repo.selectAllCategoryWithTotalCount)
+    return _popTotalCount(url_parms, records)
+
+#-----------------------------------------------------
+# Remove the window count column from the records and return it with them.
+#
+# The count is None when the page is past the last one (no rows to read it from) 
+# so the caller has to run the count query. If the first page is empty, the count is 0.
+#-----------------------------------------------------
+def _popTotalCount(url_parms: models.ProductSearchRequest, records: list[dict]) -> tuple[list[dict], int | None]:
+    column = url_parms.pagination.TOTAL_COUNT_COLUMN
+    count  = None
+
+    for record in records:
+        count = record.pop(column, count)
+
+    if count is None and url_parms.pagination.offset == 0:
+        count = 0
+
+    return (records, count)
+
+#-----------------------------------------------------
+# Get the keyset page of filtered records, the total count, and the next cursor
+#-----------------------------------------------------
+def _fetchRecordsSeek(url_parms: models.ProductSearchRequest) -> tuple[list[dict], int | None, str | None]:
+    records = _fetchRecordsTemplate(url_parms, search_products_repo.selectAllSeek)
+    return _getSeekPage(url_parms, records)
+
+#-----------------------------------------------------
+# Get the keyset page of filtered records, the total count, and the next cursor for a specific category
+#-----------------------------------------------------
+def _fetchRecordsCategorySeek(url_parms: models.ProductSearchRequestCategory) -> tuple[list[dict], int | None, str | None]:
+    records = _fetchRecordsTemplate(url_parms, search_products_repo.selectAllCategorySeek)
+    return _getSeekPage(url_parms, records)
+
+#-----------------------------------------------------
+# Split the seek query records into the page, total count, and the next cursor.
+#
+# The query returns 1 more record than the page size when there is a next page.
+# The first page has the window count column, the next ones carry it in the cursor.
+#-----------------------------------------------------
+def _getSeekPage(url_parms: models.ProductSearchRequest, records: list[dict]) -> tuple[list[dict], int | None, str | None]:
+    pagination: KeysetPagination = url_parms.pagination
+
+    has_next_page = len(records) > pagination.per_page
+    page = records[:pagination.per_page]
+
+    if pagination.cursor:
+        count = pagination.cursor.total_records
+    else:
+        page, count = _popTotalCount(url_parms, page)
+
+    next_cursor = None
+
+    if has_next_page:
+        next_cursor = pagination.getNextCursor(page[-1], url_parms.sorting, count).encode()
+
+    return (page, count, next_cursor)
+
 #-----------------------------------------------------
 # Template for fetching the search product records.
 # Returns an empty list if the db_result came back as null.
@@ -188,10 +463,175 @@ def _fetchRecordsTemplate(url_parms, repo_callback) -> list[dict]:
     # get the actual records
     db_result = repo_callback(url_parms)
 
+    if not db_result.successful:
+        raise db_result.error
+    
+    records = db_result.data or []
+    _setDistances(url_parms, records)
+
+    return records
+
+#-----------------------------------------------------
+# Check if the search is sorted by the computed distance
+#-----------------------------------------------------
+def _isDistanceSort(url_parms: models.ProductSearchRequest) -> bool:
+    return url_parms.sorting.field == SortingSearchProducts.DISTANCE_FIELD
+
+#-----------------------------------------------------
+# Get the page of product records sorted by distance
+#-----------------------------------------------------
+def _fetchRecordsByDistance(url_parms: models.ProductSearchRequest) -> tuple[list[dict], int, str | None]:
+    return _fetchRecordsByDistanceTemplate(url_parms, search_products_repo.selectAllCandidates)
+
+#-----------------------------------------------------
+# Get the page of product records sorted by distance for a specific category
+#-----------------------------------------------------
+def _fetchRecordsCategoryByDistance(url_parms: models.ProductSearchRequestCategory) -> tuple[list[dict], int, str | None]:
+    return _fetchRecordsByDistanceTemplate(url_parms, search_products_repo.selectAllCategoryCandidates)
+
+#-----------------------------------------------------
+# Template for getting a page of records sorted by distance.
+#
+# Only the (id, location_id) of the candidates are fetched from the database,
+# then the page's full records are fetched once the page's ids are known.
+#
+# Returns a tuple: (records, total count, next cursor)
+#-----------------------------------------------------
+def _fetchRecordsByDistanceTemplate(url_parms: models.ProductSearchRequest, candidates_callback) -> tuple[list[dict], int, str | None]:
+    db_result = candidates_callback(url_parms)
+
+    if not db_result.successful:
+        raise db_result.error
+    
+    candidates = db_result.data or []
+    ranking    = _getDistanceRanking(url_parms, candidates)
+    count      = len(ranking)
+
+    page_keys, next_cursor = _getDistancePageKeys(url_parms, ranking, count)
+    records = _fetchRecordsByIds([product_id for _, product_id in page_keys])
+
+    # put the records in the page's order and set their distance
+    records_by_id = {record.get('id'): record for record in records}
+    page = []
+
+    for distance, product_id in page_keys:
+        record = records_by_id.get(product_id)
+
+        if record is None:
+            continue
+
+        record[SortingSearchProducts.DISTANCE_FIELD] = _roundDistance(distance)
+        page.append(record)
+
+    return (page, count, next_cursor)
+
+#-----------------------------------------------------
+# Get the (distance, product id) of every candidate.
+# Candidates with an unknown location get an infinite distance (all of them if the
+# spatial index could not be loaded, so they end up ordered by product id).
+#-----------------------------------------------------
+def _getDistanceRanking(url_parms: models.ProductSearchRequest, candidates: list[dict]) -> list[tuple[float, int]]:
+    try:
+        location_ids = [candidate.get('location_id') or -1 for candidate in candidates]
+        distances    = spatial.getIndex().milesFromLocation(int(url_parms.location_id), location_ids)
+    except Exception as ex:
+        print(ex)
+        distances = None
+
+    if distances is None:
+        distances = [math.inf] * len(candidates)
+
+    ranking = []
+
+    for candidate, distance in zip(candidates, distances):
+        distance = float(distance)
+
+        if math.isnan(distance):
+            distance = math.inf
+        
+        ranking.append((distance, candidate.get('id')))
+
+    return ranking
+
+#-----------------------------------------------------
+# Select the (distance, product id) keys of the page with a bounded heap 
+# instead of sorting all the candidates.
+#
+# Returns a tuple: (page keys, next cursor)
+#-----------------------------------------------------
+def _getDistancePageKeys(url_parms: models.ProductSearchRequest, ranking: list[tuple[float, int]], count: int) -> tuple[list[tuple[float, int]], str | None]:
+    pagination = url_parms.pagination
+    descending = url_parms.sorting.type == SortingSearchProducts.TYPE_DESC
+    select_top = heapq.nlargest if descending else heapq.nsmallest
+
+    if not _isKeysetPagination(url_parms):
+        top = select_top(pagination.offset + pagination.per_page, ranking)
+        return (top[pagination.offset:], None)
+    
+    # keyset: skip everything up to and including the cursor's key
+    if pagination.cursor:
+        cursor_key = (pagination.cursor.value, pagination.cursor.id)
+
+        if descending:
+            ranking = [key for key in ranking if key < cursor_key]
+        else:
+            ranking = [key for key in ranking if key > cursor_key]
+        
+        count = pagination.cursor.total_records or count
+
+    top = select_top(pagination.per_page + 1, ranking)
+
+    if len(top) <= pagination.per_page:
+        return (top, None)
+    
+    last_key = top[pagination.per_page - 1]
+    next_cursor = Cursor(url_parms.sorting.field, url_parms.sorting.type, last_key[0], last_key[1], count)
+
+    return (top[:pagination.per_page], next_cursor.encode())
+
+#-----------------------------------------------------
+# Fetch the search view records of the given product ids
+#-----------------------------------------------------
+def _fetchRecordsByIds(product_ids: list[int]) -> list[dict]:
+    if not product_ids:
+        return []
+    
+    db_result = search_products_repo.selectAllByIds(product_ids)
+
     if not db_result.successful:
         raise db_result.error
     
     return db_result.data or []
+
+#-----------------------------------------------------
+# Set the renter to lender distance of each record.
+# If the spatial index is not available, the distance is null.
+#-----------------------------------------------------
+def _setDistances(url_parms: models.ProductSearchRequest, records: list[dict]):
+    if not records:
+        return
+    
+    try:
+        location_ids = [record.get('location_id') or -1 for record in records]
+        distances = spatial.getIndex().milesFromLocation(int(url_parms.location_id), location_ids)
+    except Exception as ex:
+        print(ex)
+        distances = None
+
+    if distances is None:
+        distances = [math.nan] * len(records)
+
+    for record, distance in zip(records, distances):
+        record[SortingSearchProducts.DISTANCE_FIELD] = _roundDistance(float(distance))
+
+#-----------------------------------------------------
+# Round the distance for the response (null if unknown)
+#-----------------------------------------------------
+def _roundDistance(distance: float) -> float | None:
+    if math.isnan(distance) or math.isinf(distance):
+        return None
+    
+    return round(distance, 2)
         
 #-----------------------------------------------------
 # Get the total record count from the repository
@@ -221,7 +661,7 @@ def _fetchCountTemplate(url_parms, repository_callback) -> int:
 # Standaridized response generator for a FilteredDataReturn object
 # All of the response functions should utilize this
 #-----------------------------------------------------
-def _returnFilteredDataResult(filtered_data: FilteredDataReturn) -> flask.Response:
+def _returnFilteredDataResult(filtered_data: FilteredDataReturn, include_cursor: bool=False) -> flask.Response:
     if not filtered_data.successful:
         return responses.badRequest(str(filtered_data.error))
 
@@ -230,6 +670,9 @@ def _returnFilteredDataResult(filtered_data: FilteredDataReturn) -> flask.Respon
         total_pages   = filtered_data.count_pages,
     )
 
+    if include_cursor:
+        pagination_dict['next_cursor'] = filtered_data.next_cursor
+
     products_img_prefixed = _prefixImageUrls(filtered_data.data)
 
     output = dict(
@@ -16,6 +16,8 @@ from api_wmiys.repository import users as users_repo
 from api_wmiys.domain import models
 from api_wmiys.common import responses
 from api_wmiys.common import serializers
+from api_wmiys.common import caching
+from api_wmiys.db import session as db_session
 
 SQL_ERROR_DUPLICATE_KEY = 1062
 
@@ -60,6 +62,8 @@ def response_PUT(user_id) -> flask.Response:
     if not result.successful:
         return _handleDbError(result)
 
+    # the email may have changed
+    db_session.onCommit(lambda: caching.credentials.removeWhere(lambda cached_user_id: cached_user_id == user_id))
 
     return _standardResponseWithView(user_id, responses.updated)
 
@@ -133,6 +137,7 @@ def generateUpdatedUserModelFromForm(user_id) -> models.User:
     user_model: models.User = serializer.serialize().model
     
     # explicitly set a few of the model's attribute values
+    # (client_password is None with token authentication, which leaves the password unchanged)
     user_model.id = user_id
     user_model.password = flask.g.client_password
 